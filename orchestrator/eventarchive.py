@@ -0,0 +1,267 @@
+"""
+事件归档：按大小滚动的 JSONL 文件，滚动后 gzip 压缩，后台线程批量写入。
+
+  - write(rec) 只是入队（非阻塞，UI 线程可直接调用）；队列满时丢弃并计数
+  - 后台线程每 flush_sec 或攒够 batch_max 条写一次；不在调用方线程做任何 IO / fsync
+  - 当前文件 <prefix>-YYYYmmdd-HHMMSS.jsonl 超过 max_bytes → fsync、关闭、压缩为 .jsonl.gz，
+    只保留最近 keep 个压缩文件；启动时把上次遗留的未压缩文件补压缩（异常退出恢复）
+  - iter_events() 按时间顺序流式扫描所有归档（.gz 与当前文件），按 target / worker / 时间过滤
+
+每行一条记录：{"ts", "worker", "target", "msg", "seq"?, "worker_ts"?}
+
+  python orchestrator/eventarchive.py query --dir logs --target 3 --since "2026-10-16 20:00"
+  python orchestrator/eventarchive.py query --dir logs --worker Worker-MSI-Desktop --grep FAIL --json
+"""
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+_STAMP = "%Y%m%d-%H%M%S"
+
+
+class EventArchive:
+    def __init__(self, directory, prefix: str = "events", max_bytes: int = 16 * 1024 * 1024,
+                 keep: int = 50, flush_sec: float = 1.0, batch_max: int = 2000, queue_max: int = 100000):
+        self.dir = Path(directory)
+        self.prefix = prefix
+        self.max_bytes = int(max_bytes)
+        self.keep = int(keep)
+        self.flush_sec = float(flush_sec)
+        self.batch_max = int(batch_max)
+        self._q: "queue.Queue[dict]" = queue.Queue(maxsize=int(queue_max))
+        self._fh = None
+        self._path: Optional[Path] = None
+        self._size = 0
+        self._stamp = ""
+        self._n = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.stats = {"written": 0, "dropped": 0, "batches": 0, "rotations": 0, "errors": 0,
+                      "last_batch_ms": 0.0}
+
+    # ---- 生产者（任意线程）----
+
+    def write(self, rec: dict):
+        try:
+            self._q.put_nowait(rec)
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    # ---- 生命周期 ----
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="event-archive")
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """写完队列里剩余的记录、fsync 当前文件（不压缩，下次启动时补压缩）。"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    # ---- 后台线程 ----
+
+    def _loop(self):
+        self._compress_leftovers()
+        while True:
+            batch = self._take_batch()
+            if batch:
+                t0 = time.perf_counter()
+                try:
+                    self._write_batch(batch)
+                except Exception:
+                    self.stats["errors"] += 1
+                self.stats["last_batch_ms"] = (time.perf_counter() - t0) * 1000.0
+            elif self._stop.is_set():
+                break
+        self._close(sync=True)
+
+    def _take_batch(self) -> List[dict]:
+        try:
+            batch = [self._q.get(timeout=self.flush_sec)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_max:
+            try:
+                batch.append(self._q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch: List[dict]):
+        if self._fh is None:
+            self._open()
+        data = "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in batch)
+        self._fh.write(data)
+        self._fh.flush()  # 交给 OS；fsync 只在滚动/退出时做
+        self._size += len(data.encode("utf-8"))
+        self.stats["written"] += len(batch)
+        self.stats["batches"] += 1
+        if self._size >= self.max_bytes:
+            self._rotate()
+
+    def _open(self):
+        # 同一秒内多次滚动：-1、-2 … 递增（即使旧文件已被 prune 也不复用序号，保证文件名有序）
+        stamp = datetime.now().strftime(_STAMP)
+        if stamp != self._stamp:
+            self._stamp, self._n = stamp, 0
+        while True:
+            suffix = f"-{self._n}" if self._n else ""
+            path = self.dir / f"{self.prefix}-{stamp}{suffix}.jsonl"
+            self._n += 1
+            if not path.exists() and not path.with_suffix(".jsonl.gz").exists():
+                break
+        self._path = path
+        self._fh = open(path, "a", encoding="utf-8")
+        self._size = 0
+
+    def _close(self, sync: bool):
+        if self._fh is None:
+            return
+        try:
+            self._fh.flush()
+            if sync:
+                os.fsync(self._fh.fileno())
+        finally:
+            self._fh.close()
+            self._fh = None
+
+    def _rotate(self):
+        path = self._path
+        self._close(sync=True)
+        self._compress(path)
+        self.stats["rotations"] += 1
+        self._prune()
+
+    @staticmethod
+    def _compress(path: Path):
+        gz = path.with_suffix(".jsonl.gz")
+        with open(path, "rb") as src, gzip.open(gz, "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        path.unlink()
+
+    def _compress_leftovers(self):
+        for p in sorted(self.dir.glob(f"{self.prefix}-*.jsonl")):
+            try:
+                self._compress(p)
+            except Exception:
+                self.stats["errors"] += 1
+        self._prune()
+
+    def _prune(self):
+        gz = sorted(self.dir.glob(f"{self.prefix}-*.jsonl.gz"), key=lambda p: _file_key(p, self.prefix))
+        for p in gz[:max(0, len(gz) - self.keep)]:
+            try:
+                p.unlink()
+            except OSError:
+                pass
+
+
+# ============== Query ==============
+
+def _file_key(p: Path, prefix: str):
+    """文件名 <prefix>-YYYYmmdd-HHMMSS[-n].jsonl[.gz] → (起始时间戳, n)。"""
+    stem = p.name[len(prefix) + 1:].split(".", 1)[0]
+    stamp, _, n = stem[:15], stem[15:16], stem[16:]
+    try:
+        start = datetime.strptime(stamp, _STAMP).timestamp()
+    except ValueError:
+        start = 0.0
+    return start, int(n) if n.isdigit() else 0
+
+
+def archive_files(directory, prefix: str = "events") -> List[Path]:
+    d = Path(directory)
+    files = list(d.glob(f"{prefix}-*.jsonl.gz")) + list(d.glob(f"{prefix}-*.jsonl"))
+    return sorted(files, key=lambda p: _file_key(p, prefix))
+
+
+def iter_events(directory, *, target: Optional[str] = None, worker: Optional[str] = None,
+                since: Optional[float] = None, until: Optional[float] = None,
+                grep: Optional[str] = None, prefix: str = "events") -> Iterator[dict]:
+    """按文件名（即起始时间）顺序流式读取；整段早于 since 的文件直接跳过。"""
+    files = archive_files(directory, prefix)
+    starts = [_file_key(p, prefix)[0] for p in files]
+    for i, p in enumerate(files):
+        if until is not None and starts[i] > until:
+            break
+        nxt = starts[i + 1] if i + 1 < len(files) else None
+        if since is not None and nxt is not None and nxt + 1.0 < since:  # 文件名只精确到秒
+            continue
+        opener = gzip.open if p.suffix == ".gz" else open
+        try:
+            fh = opener(p, "rt", encoding="utf-8")
+        except OSError:
+            continue
+        with fh:
+            for line in fh:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # 异常退出时的半行
+                ts = rec.get("ts") or 0.0
+                if since is not None and ts < since:
+                    continue
+                if until is not None and ts > until:
+                    continue
+                if target is not None and str(rec.get("target")) != str(target):
+                    continue
+                if worker is not None and rec.get("worker") != worker:
+                    continue
+                if grep and grep not in (rec.get("msg") or ""):
+                    continue
+                yield rec
+
+
+def _parse_time(s: Optional[str]) -> Optional[float]:
+    if not s:
+        return None
+    try:
+        return float(s)
+    except ValueError:
+        pass
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(s, fmt).timestamp()
+        except ValueError:
+            continue
+    raise SystemExit(f"bad time: {s!r} (use epoch seconds or 'YYYY-mm-dd HH:MM[:SS]')")
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    ap = argparse.ArgumentParser(description="Query the orchestrator event archive")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    q = sub.add_parser("query")
+    q.add_argument("--dir", default=str(Path(__file__).resolve().parent.parent / "logs"))
+    q.add_argument("--prefix", default="events")
+    q.add_argument("--target")
+    q.add_argument("--worker")
+    q.add_argument("--since")
+    q.add_argument("--until")
+    q.add_argument("--grep")
+    q.add_argument("--json", action="store_true", help="print raw JSONL records")
+    a = ap.parse_args()
+
+    n = 0
+    for rec in iter_events(a.dir, target=a.target, worker=a.worker, since=_parse_time(a.since),
+                           until=_parse_time(a.until), grep=a.grep, prefix=a.prefix):
+        n += 1
+        if a.json:
+            sys.stdout.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        else:
+            ts = datetime.fromtimestamp(rec.get("ts") or 0).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+            sys.stdout.write(f"[{ts}] [{rec.get('worker') or '-'}][{rec.get('target') or '-'}] {rec.get('msg')}\n")
+    sys.stderr.write(f"{n} events\n")
@@ -0,0 +1,260 @@
+"""
+日志存储 + 虚拟化显示。
+
+LogStore（纯 Python，不依赖 Tk）：
+  - 每条记录是一个元组 (seq, line, tag, worker)，tag 为 "T{tid}" 或 None
+  - 全局顺序环 + 每个 target 一个环（同一元组的引用，不复制文本）
+  - 总量上限 capacity：满了丢全局最旧的一条，并从它所属 target 的环头部弹出
+    （全局最旧必然也是该 target 最旧），内存严格有界
+  - filter(target, worker, text) 返回匹配记录的列表（视图）：
+      target 过滤直接取该 target 的环；worker / text 再做一次线性筛选；
+      新关键字包含旧关键字时只在上一次结果里继续筛（边打字边过滤）
+  - 新记录追加时只检测新记录是否匹配当前视图（增量），不重算
+
+VirtualLogView（Tk）：Text 里只放可见的那几十行；滚动条按视图下标换算，
+所以缓存一百万条记录时滚动 / 过滤的代价与可见行数相关，而不是与总量相关。
+"""
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+Record = Tuple[int, str, Optional[str], Optional[str]]   # (seq, line, tag, worker)
+
+ANY = ""   # 过滤条件“全部”
+
+
+class LogStore:
+    def __init__(self, capacity: int = 1_000_000):
+        self.capacity = max(1, int(capacity))
+        self._all: deque = deque()
+        self._by_tag: Dict[Optional[str], deque] = {}
+        self._seq = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._all)
+
+    @property
+    def first_seq(self) -> int:
+        return self._all[0][0] if self._all else self._seq + 1
+
+    def tags(self) -> List[Optional[str]]:
+        return [t for t, ring in self._by_tag.items() if ring]
+
+    def append(self, line: str, tag: Optional[str] = None, worker: Optional[str] = None) -> Record:
+        if len(self._all) >= self.capacity:
+            old = self._all.popleft()
+            self._by_tag[old[2]].popleft()
+            self.evicted += 1
+        self._seq += 1
+        rec = (self._seq, line, tag, worker)
+        self._all.append(rec)
+        ring = self._by_tag.get(tag)
+        if ring is None:
+            ring = self._by_tag[tag] = deque()
+        ring.append(rec)
+        return rec
+
+    def clear(self):
+        self._all.clear()
+        self._by_tag.clear()
+
+    @staticmethod
+    def matcher(target: str = ANY, worker: str = ANY, text: str = ANY):
+        """返回 rec -> bool；text 为小写时大小写不敏感（smart-case）。"""
+        tag = f"T{target}" if target else None
+        fold = text == text.lower()
+
+        def match(rec: Record) -> bool:
+            if target and rec[2] != tag:
+                return False
+            if worker and rec[3] != worker:
+                return False
+            if text:
+                return text in (rec[1].lower() if fold else rec[1])
+            return True
+        return match
+
+    def filter(self, target: str = ANY, worker: str = ANY, text: str = ANY,
+               within: Optional[List[Record]] = None) -> List[Record]:
+        if within is not None:
+            src = within
+        elif target:
+            src = self._by_tag.get(f"T{target}") or ()
+        else:
+            src = self._all
+        if not worker and not text:
+            return list(src)
+        fold = text == text.lower()
+        if worker and not text:
+            return [r for r in src if r[3] == worker]
+        if fold:
+            if worker:
+                return [r for r in src if r[3] == worker and text in r[1].lower()]
+            return [r for r in src if text in r[1].lower()]
+        if worker:
+            return [r for r in src if r[3] == worker and text in r[1]]
+        return [r for r in src if text in r[1]]
+
+
+class LogView:
+    """当前过滤条件下的记录视图；随新记录增量追加、随淘汰裁头。"""
+
+    def __init__(self, store: LogStore):
+        self.store = store
+        self.criteria: Tuple[str, str, str] = (ANY, ANY, ANY)
+        self.rows: List[Record] = []
+        self._match = LogStore.matcher()
+
+    def set_filter(self, target: str = ANY, worker: str = ANY, text: str = ANY):
+        new = (target or ANY, worker or ANY, text or ANY)
+        old = self.criteria
+        refine = (new[0] == old[0] and new[1] == old[1] and old[2] and new[2] != old[2]
+                  and old[2] in new[2] and (old[2] == old[2].lower()) == (new[2] == new[2].lower()))
+        self.rows = self.store.filter(*new, within=self.rows if refine else None)
+        self.criteria = new
+        self._match = LogStore.matcher(*new)
+
+    def extend(self, recs: List[Record]) -> int:
+        """新记录中匹配的追加到视图末尾；返回追加条数。"""
+        first = self.store.first_seq
+        if self.rows and self.rows[0][0] < first:
+            k = 0
+            while k < len(self.rows) and self.rows[k][0] < first:
+                k += 1
+            del self.rows[:k]
+        added = [r for r in recs if r[0] >= first and self._match(r)]
+        self.rows.extend(added)
+        return len(added)
+
+    def reset(self):
+        self.rows = []
+
+
+try:
+    import tkinter as tk
+except ImportError:  # 仅用 LogStore（如基准脚本）时不需要 Tk
+    tk = None
+
+
+if tk is not None:
+    class VirtualLogView(tk.Frame):
+        """只渲染可见行的日志控件：Text(wrap=none) + 自管的纵向滚动条。"""
+
+        def __init__(self, parent, view: LogView, font=None, tag_colors: Optional[Dict[str, str]] = None,
+                     **kw):
+            super().__init__(parent, **kw)
+            self.view = view
+            self.top = 0                 # 视图中第一条可见记录的下标
+            self.follow = True           # 停在底部时随新日志滚动
+            self.text = tk.Text(self, wrap="none", height=18, state="disabled", font=font)
+            self.vbar = tk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+            self.hbar = tk.Scrollbar(self, orient="horizontal", command=self.text.xview)
+            self.text.configure(xscrollcommand=self.hbar.set)
+            self.text.grid(row=0, column=0, sticky="nsew")
+            self.vbar.grid(row=0, column=1, sticky="ns")
+            self.hbar.grid(row=1, column=0, sticky="ew")
+            self.rowconfigure(0, weight=1)
+            self.columnconfigure(0, weight=1)
+            for tag, color in (tag_colors or {}).items():
+                self.text.tag_configure(tag, foreground=color)
+            self.text.bind("<MouseWheel>", self._on_wheel)
+            self.text.bind("<Button-4>", lambda e: self.scroll(-3))
+            self.text.bind("<Button-5>", lambda e: self.scroll(3))
+            self.text.bind("<Configure>", lambda e: self.render())
+            for key, delta in (("<Prior>", "-page"), ("<Next>", "page"), ("<Up>", -1), ("<Down>", 1)):
+                self.text.bind(key, lambda e, d=delta: (self.scroll(d), "break")[1])
+            self.text.bind("<Home>", lambda e: (self.goto(0), "break")[1])
+            self.text.bind("<End>", lambda e: (self.goto_end(), "break")[1])
+            self._rendered: Tuple = ()
+
+        # ---- 几何 ----
+
+        def visible_rows(self) -> int:
+            h = self.text.winfo_height()
+            lh = max(1, int(self.text.tk.call("font", "metrics", self.text.cget("font"), "-linespace")))
+            return max(1, h // lh)
+
+        def _max_top(self) -> int:
+            return max(0, len(self.view.rows) - self.visible_rows())
+
+        # ---- 滚动 ----
+
+        def goto(self, top: int):
+            self.top = min(max(0, int(top)), self._max_top())
+            self.follow = self.top >= self._max_top()
+            self.render()
+
+        def goto_end(self):
+            self.follow = True
+            self.render()
+
+        def scroll(self, delta):
+            if delta in ("page", "-page"):
+                delta = self.visible_rows() * (1 if delta == "page" else -1)
+            self.goto(self.top + int(delta))
+
+        def _on_wheel(self, e):
+            self.scroll(-3 * int(e.delta / 120) if e.delta else 0)
+            return "break"
+
+        def _on_scrollbar(self, *args):
+            if args[0] == "moveto":
+                self.goto(float(args[1]) * len(self.view.rows))
+            elif args[0] == "scroll":
+                n = int(args[1])
+                self.scroll(n * self.visible_rows() if args[2] == "pages" else n)
+
+        # ---- 渲染 ----
+
+        def render(self, force: bool = False):
+            rows = self.view.rows
+            n = self.visible_rows()
+            if self.follow:
+                self.top = max(0, len(rows) - n)
+            self.top = min(self.top, max(0, len(rows) - n))
+            window = rows[self.top:self.top + n]
+            key = (window[0][0] if window else 0, window[-1][0] if window else 0, len(window))
+            total = max(len(rows), 1)
+            self.vbar.set(self.top / total, min(1.0, (self.top + n) / total))
+            if key == self._rendered and not force:
+                return
+            self._rendered = key
+            args: list = []
+            for rec in window:
+                args.append(rec[1])
+                args.append(rec[2] or ())
+            self.text.configure(state="normal")
+            self.text.delete("1.0", "end")
+            if args:
+                self.text.insert("end", *args)
+            self.text.configure(state="disabled")
+
+
+def _bench(n: int = 1_000_000, targets: int = 8):
+    import random
+    import time
+    store = LogStore(capacity=n)
+    words = ["launch OK", "join_game start", "bo_command FAIL → timeout", "wait_window: 812 ms",
+             "post_launch: ready", "[events] dropped", "leave_game OK"]
+    workers = ["Worker-MSI-Desktop", "Worker-ASUS-ROG-Laptop"]
+    t0 = time.perf_counter()
+    for i in range(n):
+        tid = str(random.randint(1, targets))
+        wn = workers[int(tid) % 2]
+        store.append(f"[2026-10-16 12:00:00.000] [{wn}][{tid}] {random.choice(words)} #{i}\n", f"T{tid}", wn)
+    print(f"append {n}: {(time.perf_counter() - t0) * 1e3:.0f} ms")
+    view = LogView(store)
+    for crit in [(ANY, ANY, ANY), ("5", ANY, ANY), (ANY, workers[0], ANY), (ANY, ANY, "fail"),
+                 ("5", ANY, "fail"), (ANY, ANY, "FAIL")]:
+        t0 = time.perf_counter()
+        view.set_filter(*crit)
+        print(f"filter {crit}: {len(view.rows)} rows in {(time.perf_counter() - t0) * 1e3:.1f} ms")
+    view.set_filter(ANY, ANY, "f")
+    for text in ("fa", "fai", "fail"):
+        t0 = time.perf_counter()
+        view.set_filter(ANY, ANY, text)
+        print(f"refine '{text}': {len(view.rows)} rows in {(time.perf_counter() - t0) * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    _bench()
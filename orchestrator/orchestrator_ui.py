@@ -4,10 +4,10 @@ import threading
 import time
 from pathlib import Path
 import tkinter as tk
-from tkinter import messagebox, scrolledtext
+from tkinter import messagebox
 from tkinter import font as tkfont
 from datetime import datetime
-from collections import defaultdict
+from collections import defaultdict, deque
 import tempfile, os
 from datetime import timezone
 from tkinter import ttk 
@@ -15,7 +15,17 @@ from typing import Callable, Dict, Any, Iterable, List, Optional
 from functools import partial
 import requests
 
-CFG_PATH = (Path(__file__).resolve().parent.parent / "config.json")
+from eventarchive import EventArchive
+from logview import ANY, LogStore, LogView, VirtualLogView
+from runtrace import ClockSync, RunTrace
+from scheduling import LEARN_OPS, GapTable, TokenBucket
+from workerhealth import HealthMonitor, CircuitBreaker, CLOSED
+from workerhttp import WorkerHttp
+
+# D2R_ORCH_CONFIG：改用其它 config（如 worker/simcluster.py 生成的模拟集群）
+CFG_PATH = Path(os.environ.get("D2R_ORCH_CONFIG") or (Path(__file__).resolve().parent.parent / "config.json"))
+# D2R_ORCH_HEADLESS：不建窗口，直接跑这些 op（见下方 run_headless）
+HEADLESS_OPS = [o.strip() for o in os.environ.get("D2R_ORCH_HEADLESS", "").split(",") if o.strip()]
 
 COLOR_MAP = {
     "1": "DeepSkyBlue4",
@@ -61,6 +71,8 @@ def save_config_debounced():
         except Exception as e:
             log_target(f"Save error: write {CFG_PATH.name} failed: {e}")
 
+    if HEADLESS_OPS:  # 无 UI 运行只读 config（也没有 Tk 主循环可挂定时保存），不写回
+        return
     delay_ms = int(PREFS.get("autosave_debounce_ms", 400))
     if _autosave_timer:
         root.after_cancel(_autosave_timer)
@@ -154,27 +166,131 @@ def _on_assign_change(tid: str, *_):
 
 # ---- HTTP helper with clearer errors ----
 
-def api(worker_name, path, method="GET", payload=None, timeout=10):
+# 每个 worker 一个 keep-alive 连接池；connect / read 超时按端点类别，调用方给 timeout 时覆盖 read
+HTTP = WorkerHttp(
+    pool_maxsize=int(PREFS.get("http_pool_size", 8)),
+    connect_timeouts=PREFS.get("http_connect_timeouts"),
+    read_timeouts=PREFS.get("http_read_timeouts"),
+)
+
+def api(worker_name, path, method="GET", payload=None, timeout=None):
     base = WORKERS[worker_name]
     url = f"{base['url'].rstrip('/')}{path}"
     try:
         if method == "GET":
-            r = requests.get(url, timeout=timeout)
+            r = HTTP.request(worker_name, base["url"], "GET", path, timeout=timeout)
         else:
-            r = requests.post(url, json=payload or {}, timeout=timeout)
+            r = HTTP.request(worker_name, base["url"], "POST", path, json=payload or {}, timeout=timeout)
+        HEALTH.record_success(worker_name)  # 有 HTTP 响应即说明 worker 可达
         r.raise_for_status()
         return r.json()
     except requests.exceptions.ConnectTimeout:
+        HEALTH.record_failure(worker_name, "ConnectTimeout")
         return {"ok": False, "error": f"ConnectTimeout: {url}"}
     except requests.exceptions.ReadTimeout:
         return {"ok": False, "error": f"ReadTimeout: {url}"}
     except requests.exceptions.ConnectionError as e:
+        HEALTH.record_failure(worker_name, f"ConnectionError ({e.__class__.__name__})")
         return {"ok": False, "error": f"ConnectionError: {url} ({e.__class__.__name__})"}
     except requests.exceptions.HTTPError as e:
         return {"ok": False, "error": f"HTTPError: {url} ({e})"}
     except Exception as e:
         return {"ok": False, "error": str(e)}
 
+def _health_probe(worker_name: str) -> dict:
+    """心跳：GET /health（旧版 worker 404 → /admin_status）。直接走 HTTP 层，不经 api() 计数。"""
+    base = WORKERS[worker_name]["url"]
+    try:
+        t_send = time.time()
+        r = HTTP.request(worker_name, base, "GET", "/health")
+        t_recv = time.time()
+        if r.status_code == 404:
+            r = HTTP.request(worker_name, base, "GET", "/admin_status")
+            r.raise_for_status()
+            return {"ok": True, "is_admin": r.json().get("is_admin"), "version": "legacy"}
+        r.raise_for_status()
+        data = r.json()
+        if isinstance(data.get("time"), (int, float)):
+            CLOCKS.sample(worker_name, t_send, data["time"], t_recv)
+        return data
+    except requests.exceptions.RequestException as e:
+        return {"ok": False, "error": f"{e.__class__.__name__}"}
+
+def _on_circuit_change(worker_name: str, state: str, reason: str):
+    if state == CLOSED:
+        log_target(worker_name, None, f"[health] circuit closed ({reason})")
+    else:
+        log_target(worker_name, None, f"[health] circuit OPEN ({reason}) → fail fast until probe succeeds")
+
+# worker 时钟偏移（心跳样本），用于把 worker 端 span 对齐到本机时间线
+CLOCKS = ClockSync()
+
+_HEALTH_CFG = PREFS.get("health", {}) or {}
+HEALTH = HealthMonitor(
+    _health_probe,
+    interval=float(_HEALTH_CFG.get("interval_sec", 2.0)),
+    breaker_factory=lambda: CircuitBreaker(
+        fail_threshold=int(_HEALTH_CFG.get("fail_threshold", 3)),
+        open_sec=float(_HEALTH_CFG.get("open_sec", 5.0)),
+        max_open_sec=float(_HEALTH_CFG.get("max_open_sec", 60.0)),
+    ),
+    on_change=_on_circuit_change,
+)
+
+def worker_unavailable(worker_name: str) -> Optional[dict]:
+    """熔断打开 → 返回错误结果（调用方直接用作 target 的结果）；可用 → None。"""
+    if HEALTH.allow(worker_name):
+        return None
+    h = HEALTH.snapshot(worker_name)
+    return {"ok": False, "error": f"worker unavailable (circuit {h['circuit']}, "
+                                  f"last error: {h['last_error']}, retry in {h['retry_in']}s)"}
+
+def _is_http_404(res: dict) -> bool:
+    return isinstance(res, dict) and res.get("ok") is False and str(res.get("error", "")).startswith("HTTPError") \
+        and "404" in str(res.get("error"))
+
+def api_job(worker_name, action, target_id, args=None, *, timeout=90, fallback_path=None):
+    """
+    长动作走 worker 的 job API：POST /jobs 立即拿到 job_id，再用
+    GET /jobs/{id}/result?wait=… 长轮询（每次 ≤10s），不会长时间占住一条 HTTP 连接。
+    超时 → 主动 cancel；旧版 worker（/jobs 404）→ 回退到同步端点 fallback_path。
+    """
+    tid = str(target_id)
+    sub = api(worker_name, "/jobs", method="POST",
+              payload={"action": action, "target_id": tid, "args": args or {}})
+    if _is_http_404(sub) and fallback_path:
+        return api(worker_name, fallback_path, method="POST",
+                   payload={"target_id": tid, **(args or {})}, timeout=timeout)
+    job_id = (sub or {}).get("job_id")
+    if not job_id:
+        return sub or {"ok": False, "error": "job submit failed"}
+    return api_job_wait(worker_name, job_id, timeout=timeout)
+
+def api_job_wait(worker_name, job_id, *, timeout=90, cancel_on_timeout=True):
+    """长轮询等一个已提交的 job（也用于等 launch 顺带排进去的 post_launch）；超时默认 cancel。"""
+    deadline = time.time() + timeout
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            if not cancel_on_timeout:
+                return {"ok": False, "error": f"job {job_id} still running after {timeout}s", "job_id": job_id}
+            api(worker_name, f"/jobs/{job_id}/cancel", method="POST")
+            return {"ok": False, "error": f"job {job_id} timeout after {timeout}s (cancelled)", "job_id": job_id}
+        wait = min(10.0, remaining)
+        st = api(worker_name, f"/jobs/{job_id}/result?wait={wait:.1f}", timeout=wait + 5)
+        status = (st or {}).get("status")
+        if status is None:
+            return st or {"ok": False, "error": f"job {job_id} status unavailable"}
+        if status in ("done", "failed"):
+            res = dict(st.get("result") or {})
+            if status == "failed" and st.get("error"):
+                res.update(ok=False, error=st["error"])
+            res.setdefault("ok", status == "done")
+            res["job_id"] = job_id
+            return res
+        if status == "cancelled":
+            return {"ok": False, "error": f"job {job_id} cancelled", "job_id": job_id}
+
 # ---- logging helpers ----
 
 def _human_id(tid: str) -> str:
@@ -184,18 +300,72 @@ def _human_id(tid: str) -> str:
         nm = ""
     return f"{tid}:{nm}" if nm else str(tid)
 
-def _do_insert_log(line: str, tag: str | None):
-    text_log.configure(state="normal")
-    text_log.insert(tk.END, line, tag if tag else None)
-    text_log.see(tk.END)
-    text_log.configure(state="disabled")
-
-def log_target(worker_or_msg=None, target_id=None, text=None):
+# ---- 日志汇聚：任意线程入队，主线程每 LOG_FLUSH_MS 批量写入一次 ----
+# deque 的 append / popleft 线程安全；超过 LOG_QUEUE_MAX 时丢最旧的行并计数。
+# 出队的记录进入 LOG_STORE（按 target 分环、总量有界），日志控件只渲染当前过滤视图的可见行。
+LOG_FLUSH_MS = int(PREFS.get("log_flush_ms", 50))
+LOG_MAX_RECORDS = int(PREFS.get("log_max_records", 1_000_000))   # 内存里最多保留的日志条数
+LOG_QUEUE_MAX = int(PREFS.get("log_queue_max", 50000))
+LOG_BATCH_MAX = 5000                                             # 单次 flush 最多处理的条数
+LOG_QUEUE: deque = deque(maxlen=LOG_QUEUE_MAX)
+LOG_STORE = LogStore(capacity=LOG_MAX_RECORDS)
+LOG_VIEW = LogView(LOG_STORE)
+# 事件归档：后台线程写滚动压缩的 JSONL（查询：python orchestrator/eventarchive.py query …）
+_ARCHIVE_CFG = PREFS.get("archive", {}) or {}
+ARCHIVE: Optional[EventArchive] = None
+if _ARCHIVE_CFG.get("enabled", True):
+    ARCHIVE = EventArchive(
+        CFG_PATH.parent / _ARCHIVE_CFG.get("dir", "logs"),
+        max_bytes=int(float(_ARCHIVE_CFG.get("max_mb", 16)) * 1024 * 1024),
+        keep=int(_ARCHIVE_CFG.get("keep", 50)),
+    )
+LOG_STATS = {"enqueued": 0, "dropped": 0, "flushes": 0, "flushed": 0,
+             "max_depth": 0, "last_flush_ms": 0.0, "max_flush_ms": 0.0}
+
+def _enqueue_log(line: str, tag: str | None, worker_name: str | None = None):
+    depth = len(LOG_QUEUE)
+    if depth >= LOG_QUEUE_MAX:
+        LOG_STATS["dropped"] += 1
+    LOG_QUEUE.append((line, tag, worker_name))
+    LOG_STATS["enqueued"] += 1
+    if depth + 1 > LOG_STATS["max_depth"]:
+        LOG_STATS["max_depth"] = depth + 1
+
+def _flush_log_queue():
+    """主线程：出队 → 存储 → 视图增量追加 → 只重绘可见行。"""
+    try:
+        n = min(len(LOG_QUEUE), LOG_BATCH_MAX)
+        if n:
+            t0 = time.perf_counter()
+            recs = []
+            for _ in range(n):
+                line, tag, wn = LOG_QUEUE.popleft()
+                recs.append(LOG_STORE.append(line, tag, wn))
+            LOG_VIEW.extend(recs)
+            log_widget.render()
+            ms = (time.perf_counter() - t0) * 1000.0
+            LOG_STATS["flushes"] += 1
+            LOG_STATS["flushed"] += n
+            LOG_STATS["last_flush_ms"] = ms
+            LOG_STATS["max_flush_ms"] = max(LOG_STATS["max_flush_ms"], ms)
+    finally:
+        root.after(LOG_FLUSH_MS, _flush_log_queue)
+
+def log_stats_text() -> str:
+    st = LOG_STATS
+    return (f"showing {len(LOG_VIEW.rows)}/{len(LOG_STORE)} · queue={len(LOG_QUEUE)} (max {st['max_depth']}) "
+            f"· flush {st['last_flush_ms']:.1f}ms (max {st['max_flush_ms']:.1f}ms) "
+            f"· lines in/out={st['enqueued']}/{st['flushed']} · evicted={LOG_STORE.evicted} "
+            f"· dropped={st['dropped']}"
+            + (f" · archived={ARCHIVE.stats['written']}" if ARCHIVE is not None else ""))
+
+def log_target(worker_or_msg=None, target_id=None, text=None, *, event: Optional[dict] = None):
     """
     通用日志入口（线程安全）：
       - log_target("config saved")
       - log_target("Worker-MSI-Desktop", None, "worker online")
       - log_target("Worker-MSI-Desktop", 3, "launch OK")
+    event：来自 worker 的原始事件（带 seq / ts），归档时一并记录。
     """
     # 兼容仅消息用法：log_target("msg")
     if text is None and target_id is None and isinstance(worker_or_msg, str):
@@ -221,28 +391,40 @@ def log_target(worker_or_msg=None, target_id=None, text=None):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
     line = f"[{timestamp}] {prefix}{msg}\n"
 
-    if threading.current_thread() is threading.main_thread():
-        _do_insert_log(line, tag)
-    else:
-        root.after(0, lambda: _do_insert_log(line, tag))
+    _enqueue_log(line, tag, worker_name)
+    if ARCHIVE is not None:
+        rec = {"ts": time.time(), "worker": worker_name,
+               "target": None if target_id is None else str(target_id), "msg": msg}
+        if event:
+            rec["seq"] = event.get("seq")
+            rec["worker_ts"] = event.get("ts")
+        ARCHIVE.write(rec)
 
 def clear_log():
-    text_log.configure(state="normal")
-    text_log.delete(1.0, tk.END)
-    text_log.configure(state="disabled")
+    LOG_QUEUE.clear()
+    LOG_STORE.clear()
+    LOG_VIEW.reset()
+    log_widget.render(force=True)
 
 # ---- actions ----
 
+def worker_enabled(worker_name: str) -> bool:
+    return (WORKERS.get(worker_name) or {}).get("enabled", True) is not False
+
+def enabled_workers() -> List[str]:
+    return [wn for wn in WORKERS.keys() if worker_enabled(wn)]
+
 def list_all():
-    def worker_thread():
-        for worker_name in WORKERS.keys():
-            res = api(worker_name, "/list", timeout=2)  # list 限制 2s，无重试
-            if not res or res.get("ok") is False:
-                log_target(worker_name, None, f"/list FAILED → {res}")
-            else:
-                n = len(res.get("targets", []))
-                log_target(worker_name, None, f"/list OK → targets={n}")
-    threading.Thread(target=worker_thread, daemon=True).start()
+    # 每个 worker 各自一条线程：一个离线 worker 的超时不会拖慢其它 worker
+    def worker_thread(worker_name):
+        res = api(worker_name, "/list")  # poll 类：read 2s，无重试
+        if not res or res.get("ok") is False:
+            log_target(worker_name, None, f"/list FAILED → {res}")
+        else:
+            n = len(res.get("targets", []))
+            log_target(worker_name, None, f"/list OK → targets={n}")
+    for worker_name in enabled_workers():
+        threading.Thread(target=worker_thread, args=(worker_name,), daemon=True).start()
 
 
 def _log_launch_details(worker_name, tid, res):
@@ -269,6 +451,86 @@ def _log_launch_details(worker_name, tid, res):
     if post:
         log_target(worker_name, tid, f"post_launch: {post}")
 
+def api_batch(worker_name, items, *, mode="serial", delay_sec=0.0, delay_ok_sec=None, timeout=90, on_item=None):
+    """
+    同一 worker 的多项操作合成一次 POST /batch（worker 端整批只 refresh 一次、加载一次 UiMap），
+    再用 GET /batch/{id}?wait=…&done_gt=k 长轮询，每有新完成项就回调 on_item(index, result)。
+    旧版 worker（/batch 404）→ 返回 None，由调用方回退到逐 target 调用；
+    超时 → 主动 cancel，未完成项以错误结果补齐。
+    """
+    sub = api(worker_name, "/batch", method="POST",
+              payload={"items": items, "mode": mode, "delay_sec": delay_sec, "delay_ok_sec": delay_ok_sec})
+    if _is_http_404(sub):
+        return None
+    results: List[Optional[dict]] = [None] * len(items)
+
+    def _settle(i, r):
+        results[i] = r
+        if on_item:
+            on_item(i, r)
+
+    def _fill(error):
+        for i, r in enumerate(results):
+            if r is None:
+                _settle(i, {"ok": False, "error": error})
+        return results
+
+    batch_id = (sub or {}).get("batch_id")
+    if not batch_id:
+        return _fill((sub or {}).get("error") or "batch submit failed")
+
+    deadline = time.time() + timeout
+    done = 0
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            api(worker_name, f"/batch/{batch_id}/cancel", method="POST")
+            return _fill(f"batch {batch_id} timeout after {timeout}s (cancelled)")
+        wait = min(10.0, remaining)
+        st = api(worker_name, f"/batch/{batch_id}?wait={wait:.1f}&done_gt={done}", timeout=wait + 5)
+        status = (st or {}).get("status")
+        if status is None:
+            return _fill((st or {}).get("error") or f"batch {batch_id} status unavailable")
+        for r in st.get("results") or []:
+            i = (r or {}).get("index")
+            if isinstance(i, int) and 0 <= i < len(results) and results[i] is None:
+                _settle(i, r)
+        done = sum(1 for r in results if r is not None)
+        if status != "running":
+            return _fill(f"batch {batch_id} {status}")
+
+
+# 同一 worker 相邻 target 的间隔：config 的 join_delay_sec 为上限；
+# learn_ops 里的操作按 worker 的确认（confirmed）学习，最低到上限 × min_gap_frac
+_SCHED_CFG = PREFS.get("schedule", {}) or {}
+GAPS = GapTable(floor=float(_SCHED_CFG.get("min_gap_sec", 0.0)),
+                floor_frac=float(_SCHED_CFG.get("min_gap_frac", 0.5)),
+                learn_ops=_SCHED_CFG.get("learn_ops", LEARN_OPS))
+POST_LAUNCH_CONFIRM_TIMEOUT = float(_SCHED_CFG.get("post_launch_confirm_sec", 180))
+
+# 跨 worker 的全局令牌桶：launch / join_game 都要登录 battle.net，过快会被限流
+_RATE_CFG = PREFS.get("join_rate", {}) or {}
+RATE_LIMITED_OPS = set(_RATE_CFG.get("ops", ["launch", "join_game"]))
+JOIN_LIMITER: Optional[TokenBucket] = None
+if _RATE_CFG.get("enabled", True) and float(_RATE_CFG.get("interval_sec", 3.0)) > 0:
+    JOIN_LIMITER = TokenBucket(rate=1.0 / float(_RATE_CFG.get("interval_sec", 3.0)),
+                               burst=int(_RATE_CFG.get("burst", 2)))
+
+# 每次 orchestrate() 的时间线导出为 Chrome / Perfetto trace JSON；最近一次的摘要显示在界面上
+_TRACE_CFG = PREFS.get("trace", {}) or {}
+TRACE_DIR = CFG_PATH.parent / _TRACE_CFG.get("dir", "logs/traces")
+LAST_RUN: Dict[str, Any] = {"text": "", "summary": None, "path": None}
+
+def _save_trace(trace: RunTrace):
+    LAST_RUN.update(text=trace.summary_text(), summary=trace.summary())
+    if not _TRACE_CFG.get("enabled", True):
+        return
+    try:
+        LAST_RUN["path"] = str(trace.save(TRACE_DIR, keep=int(_TRACE_CFG.get("keep", 20))))
+        log_target(f"[{trace.op_name}] trace → {LAST_RUN['path']}")
+    except Exception as e:
+        log_target(f"[{trace.op_name}] trace export failed: {e}")
+
 def orchestrate(
     selected_ids,
     handler,
@@ -276,47 +538,183 @@ def orchestrate(
     op_name: str,
     max_parallel_workers: Optional[int] = None,
     delay_override: Optional[float] = None,
+    batch_item=None,
+    before=None,
+    after=None,
+    item_timeout: float = 90,
 ) -> threading.Thread:
     """
     同一 worker 内按 selected_ids 出现顺序串行，不同 worker 之间并行。
+    上一个 target 一完成就开始下一个，中间只等 GapLearner 给出的间隔
+    （成功后为学到的 gap，失败后为上限 join_delay_sec / delay_override）；结束时记录 makespan，
+    并把 orchestrator 端计时 + worker 返回的 spans 导出为 trace（见 runtrace.py）。
+    op_name 属于 RATE_LIMITED_OPS 时，每个 target 还要从全局令牌桶 JOIN_LIMITER 取令牌：
+    逐个调用时在间隔开始时预约，等 max(间隔, 令牌等待)；走 /batch 时开跑前按 worker 轮转预约全部令牌，
+    放行时刻换算成 worker 时钟作为每项的 not_before，由 worker 端与间隔重叠等待。
     handler: (worker_name, tid) -> result(dict-like, 期望包含 ok 字段)
+    batch_item: (worker_name, tid) -> (action, args)；提供时每个 worker 只发一次 /batch，
+                worker 不支持时回退到逐个调用 handler
+    before / after: 每个 target 开始前 / 拿到结果后的钩子（更新 STATE、打印详情等）
     返回最外层 orchestrator 线程对象（daemon）。
     """
 
-    def run_for_worker(worker_name: str, tids_for_worker: List[str]):
-        delay = (
+    trace = RunTrace(op_name, CLOCKS)
+    began: Dict[str, float] = {}
+
+    def _begin(worker_name: str, tid: str):
+        began[tid] = time.time()
+        log_target(worker_name, tid, f"{op_name} start")
+        if before:
+            before(worker_name, tid)
+
+    def _finish(worker_name: str, tid: str, res):
+        res = res or {}
+        now = time.time()
+        start = began.get(tid, now)
+        if res.get("elapsed_ms") is not None:  # batch 项：以 worker 实际执行时长倒推开始时刻
+            start = max(start, now - res["elapsed_ms"] / 1000.0)
+        trace.request(worker_name, tid, start, now, ok=res.get("ok"),
+                      **({"error": str(res["error"])} if res.get("error") else {}))
+        trace.worker_spans(worker_name, tid, res.pop("spans", None), gap_ms=res.get("gap_ms"))
+        if after:
+            try:
+                after(worker_name, tid, res)
+            except Exception as e:
+                log_target(worker_name, tid, f"{op_name} after-hook error: {e}")
+        if res.get("ok") is False or not res:
+            log_target(worker_name, tid, f"{op_name} FAIL → {res}")
+        else:
+            log_target(worker_name, tid, f"{op_name} OK → " + ", ".join(
+                f"{k}={v}" for k, v in res.items() if k in ("pid", "hwnd", "extra")
+            ))
+
+    limiter = JOIN_LIMITER if op_name in RATE_LIMITED_OPS else None
+    limiter_wait = [0.0]
+
+    def _gaps_for(worker_name: str):
+        ceiling = (
             delay_override
             if delay_override is not None
             else float(WORKERS.get(worker_name, {}).get("join_delay_sec", 0))
         )
+        return GAPS.get(worker_name, op_name, ceiling)
+
+    def _record_gap(worker_name: str, gaps, tid: str, res: dict, gap: float):
+        """按结果学习间隔；launch 的确认要等 post_launch job 结束，在后台线程里补记。"""
+        ok = bool(res.get("ok"))
+        gaps.record(ok, gap, res.get("confirmed"))
+        if ok and gaps.learn and res.get("confirmed") is None and res.get("post_job"):
+            def _confirm_later(job_id=res["post_job"]):
+                post = api_job_wait(worker_name, job_id, timeout=POST_LAUNCH_CONFIRM_TIMEOUT, cancel_on_timeout=False)
+                c = post.get("confirmed")
+                if c is None and post.get("ok") is False and "timings" in post:
+                    c = False  # post_launch 跑了但出错（超时 / 取消 / 不可达不算）
+                if c is not None:
+                    gaps.confirm(bool(c), gap)
+                    log_target(worker_name, tid, f"{op_name} gap learn: post_launch confirmed={c} → gap {gaps.gap:.1f}s")
+            threading.Thread(target=_confirm_later, daemon=True).start()
+
+    def run_for_worker(worker_name: str, tids_for_worker: List[str]):
+        gaps = _gaps_for(worker_name)
+        prev_ok = True
         for idx, tid in enumerate(tids_for_worker):
-            log_target(worker_name, tid, f"{op_name} start")
+            # 仅在同一 worker 的队列内部，任务之间等待（上一个已完成，只等冷却间隔）
+            gap = gaps.next_gap(prev_ok) if idx else 0.0
+            # 令牌在间隔开始时预约：两段等待重叠，只等较长者
+            t_gap = time.time()
+            waited = limiter.reserve() if limiter else 0.0
+            wait = max(gap, waited)
+            if wait:
+                time.sleep(wait)
+                if gap:
+                    trace.span(worker_name, None, "gap", t_gap, t_gap + gap, target=tid, prev_ok=prev_ok)
+                if waited > gap:
+                    trace.span(worker_name, tid, "rate_limit", t_gap + gap, time.time())
+            if limiter:
+                extra = max(0.0, waited - gap)
+                limiter_wait[0] += extra
+                if extra >= 0.1:
+                    log_target(worker_name, tid, f"{op_name} waited {extra:.1f}s beyond gap for global rate limit")
+            # 熔断打开：剩余 target 立即报错，不再逐个等 ConnectTimeout
+            down = worker_unavailable(worker_name)
+            if down:
+                for rest in tids_for_worker[idx:]:
+                    _finish(worker_name, rest, down)
+                return
+            _begin(worker_name, tid)
             try:
                 res = handler(worker_name, tid) or {}
             except Exception as e:
                 res = {"ok": False, "error": f"{op_name} error: {e}"}
-
-            if not res or res.get("ok") is False:
-                log_target(worker_name, tid, f"{op_name} FAIL → {res}")
-            else:
-                log_target(worker_name, tid, f"{op_name} OK → " + ", ".join(
-                    f"{k}={v}" for k, v in res.items() if k in ("pid", "hwnd", "extra")
-                ))
-
-            # 仅在同一 worker 的队列内部，任务之间 sleep
-            if delay and (idx + 1) < len(tids_for_worker):
-                time.sleep(delay)
-
+            _finish(worker_name, tid, res)
+            prev_ok = bool(res.get("ok"))
+            if idx:
+                _record_gap(worker_name, gaps, tid, res, wait)
+
+    # 全局令牌的预约放行时刻（本机时钟），仅 /batch + limiter 时由 orchestrator_thread 填写
+    not_before: Dict[str, float] = {}
+
+    def run_batch_for_worker(worker_name: str, tids_for_worker: List[str]):
+        down = worker_unavailable(worker_name)
+        if down:
+            for tid in tids_for_worker:
+                _finish(worker_name, tid, down)
+            return
+        gaps = _gaps_for(worker_name)
+        items = []
+        for tid in tids_for_worker:
+            try:
+                action, args = batch_item(worker_name, tid)
+            except Exception as e:
+                _finish(worker_name, tid, {"ok": False, "error": f"{op_name} error: {e}"})
+                continue
+            items.append({"target_id": tid, "action": action, "args": args or {}})
+        if not items:
+            return
+        tids = [it["target_id"] for it in items]
+        rate_wait = 0.0
+        if not_before:
+            offset = CLOCKS.offset(worker_name)[0]
+            for it in items:
+                nb = not_before.get(it["target_id"])
+                if nb is not None:
+                    it["not_before"] = nb + offset
+            rate_wait = max(0.0, max(not_before.get(t, 0.0) for t in tids) - time.time())
+
+        # serial：worker 端上一项结束后才开始下一项，所以 start 在上一项结果回来时再标
+        _begin(worker_name, tids[0])
+
+        def _on_item(i, r):
+            _finish(worker_name, tids[i], r)
+            limiter_wait[0] += r.get("rate_wait_ms", 0) / 1000.0
+            if i and "gap_ms" in r:  # 第一项前没有间隔，不参与学习
+                _record_gap(worker_name, gaps, tids[i], r, r["gap_ms"] / 1000.0)
+            if "elapsed_ms" in r and i + 1 < len(tids):  # 超时 / 提交失败补齐的结果不算开始
+                _begin(worker_name, tids[i + 1])
+
+        # worker 端串行执行：上一项完成后，成功等 delay_ok_sec（学到的 gap），失败等 delay_sec（上限）
+        results = api_batch(
+            worker_name, items, mode="serial", delay_sec=gaps.ceiling, delay_ok_sec=gaps.next_gap(True),
+            timeout=item_timeout * len(items) + gaps.ceiling * (len(items) - 1) + rate_wait,
+            on_item=_on_item,
+        )
+        if results is None:
+            log_target(worker_name, None, f"{op_name}: /batch unsupported, fallback to per-target calls")
+            run_for_worker(worker_name, tids)
 
     def orchestrator_thread():
         # 1) 按出现顺序分组
         worker_queues: Dict[str, List[str]] = defaultdict(list)
         worker_order: List[str] = []
         for tid in selected_ids:
+            tid = str(tid)
             wn = ASSIGN.get(tid)
             if not wn:
                 log_target("<unknown>", tid, f"{op_name} skipped: no assignment")
                 continue
+            if not worker_enabled(wn):
+                log_target(wn, tid, f"{op_name} skipped: worker disabled")
+                continue
             if wn not in worker_queues:
                 worker_order.append(wn)
             worker_queues[wn].append(tid)
@@ -324,178 +722,261 @@ def orchestrate(
         # 2) 控制并发的 worker 数量（可选）
         limit = max_parallel_workers or len(worker_order)
         sem = threading.Semaphore(limit)
+        run = run_batch_for_worker if batch_item else run_for_worker
+        if batch_item and limiter:
+            # 开跑前按 worker 轮转预约全部令牌（每个 worker 的第 k 项依次取），worker 端按 not_before 放行
+            for k in range(max((len(worker_queues[wn]) for wn in worker_order), default=0)):
+                for wn in worker_order:
+                    if k < len(worker_queues[wn]):
+                        not_before[worker_queues[wn][k]] = time.time() + limiter.reserve()
 
         # 3) 为每个 worker 开线程并行，线程内保持顺序
+        t_start = time.monotonic()
+        elapsed: Dict[str, float] = {}
+        threads = []
         for wn in worker_order:
             sem.acquire()
             def _start_worker(wn=wn):
+                t0 = time.monotonic()
+                t_wall = time.time()
                 try:
-                    run_for_worker(wn, worker_queues[wn])
+                    run(wn, worker_queues[wn])
                 finally:
+                    elapsed[wn] = time.monotonic() - t0
+                    trace.span(wn, None, f"{op_name} queue", t_wall, time.time(),
+                               targets=len(worker_queues[wn]))
                     sem.release()
-            threading.Thread(target=_start_worker, daemon=True).start()
+            th = threading.Thread(target=_start_worker, daemon=True)
+            th.start()
+            threads.append(th)
+
+        # 4) 全部完成后记录 makespan（从第一个 worker 开始到最后一个 worker 结束）
+        for th in threads:
+            th.join()
+        if worker_order:
+            total = time.monotonic() - t_start
+            n = sum(len(worker_queues[wn]) for wn in worker_order)
+            per_worker = ", ".join(
+                f"{wn}={elapsed.get(wn, 0.0):.1f}s/{len(worker_queues[wn])} gap={_gaps_for(wn).gap:.1f}s"
+                for wn in worker_order)
+            if limiter:
+                per_worker += f"; rate-limit wait {limiter_wait[0]:.1f}s total"
+            log_target(f"[{op_name}] makespan {total:.1f}s for {n} targets ({per_worker})")
+            trace.finish()
+            _save_trace(trace)
 
     t = threading.Thread(target=orchestrator_thread, daemon=True)
     t.start()
     return t
 
-def _launch_handler(worker_name: str, tid: str):
-    # 组装 payload：优先带上 resolved shortcut_path
-    payload = {"target_id": str(tid)}
+
+def _set_state(tid: str, state: str):
+    STATE[tid] = state
+    refresh_row_enabled(tid)
+
+
+def _launch_item(worker_name: str, tid: str):
+    # 组装 args：优先带上 resolved shortcut_path
     try:
         path = resolved_shortcut_for(str(tid))
     except Exception:
         path = None
     if path:
-        payload["shortcut_path"] = path
         log_target(worker_name, tid, f"launch with shortcut_path → {path}")
-    else:
-        log_target(worker_name, tid, "launch without shortcut_path (fallback)")
+        return "launch", {"shortcut_path": path}
+    log_target(worker_name, tid, "launch without shortcut_path (fallback)")
+    return "launch", {}
 
-    # 发起调用（其余逻辑不变）
-    return api(worker_name, "/launch", method="POST", payload=payload, timeout=90) or {}
+def _launch_handler(worker_name: str, tid: str):
+    action, args = _launch_item(worker_name, tid)
+    return api_job(worker_name, action, tid, args, timeout=90, fallback_path="/launch") or {}
 
 
 def run_launch(selected_ids):
-    def _wrapped_handler(wn, tid):
-        tid = str(tid)
-        STATE[tid] = "Launching"
-        refresh_row_enabled(tid)
+    def _before(wn, tid):
+        _set_state(tid, "Launching")
         # （可选）打印解析出的完整路径，便于核对
         path = resolved_shortcut_for(tid)
         log_target(wn, tid, f"resolved shortcut → {path or '<unavailable>'}")
-        try:
-            res = _launch_handler(wn, tid) or {}
-        except Exception as e:
-            res = {"ok": False, "error": f"{e}"}
-        STATE[tid] = "Running" if res.get("ok") else "Error"
-        refresh_row_enabled(tid)
-        return res
+
+    def _after(wn, tid, res):
+        _set_state(tid, "Running" if res.get("ok") else "Error")
 
     return orchestrate(
         selected_ids,
-        handler=_wrapped_handler,
+        handler=_launch_handler,
+        batch_item=_launch_item,
+        before=_before,
+        after=_after,
         op_name="launch",
+        item_timeout=90,
         max_parallel_workers=None
     )
 
 
 def _stop_handler(worker_name: str, tid: str) -> Dict[str, Any]:
-    res = api(worker_name, "/stop", method="POST", payload={"target_id": tid}, timeout=90) or {}
-    if res.get("ok"):
-        _log_launch_details(worker_name, tid, res)
-    return res
+    return api(worker_name, "/stop", method="POST", payload={"target_id": tid}, timeout=90) or {}
 
 def run_stop(selected_ids):
-    def _wrapped_handler(wn, tid):
-        tid = str(tid)
-        STATE[tid] = "Stopping"
-        refresh_row_enabled(tid)
-        try:
-            res = _stop_handler(wn, tid) or {}
-        except Exception as e:
-            res = {"ok": False, "error": f"{e}"}
-        STATE[tid] = "Idle" if res.get("ok") else "Error"
-        refresh_row_enabled(tid)
-        return res
+    def _after(wn, tid, res):
+        if res.get("ok"):
+            _log_launch_details(wn, tid, res)
+        _set_state(tid, "Idle" if res.get("ok") else "Error")
 
     return orchestrate(
         selected_ids,
-        handler=_wrapped_handler,
+        handler=_stop_handler,
+        batch_item=lambda wn, tid: ("stop", {}),
+        before=lambda wn, tid: _set_state(tid, "Stopping"),
+        after=_after,
         op_name="stop",
         delay_override=1.0,
+        item_timeout=90,
         max_parallel_workers=None
     )
 
 
 # ---- BO handlers ----
 def _bo_handler(worker_name: str, tid: str) -> Dict[str, Any]:
-    return api(worker_name, "/bo", method="POST", payload={"target_id": tid}, timeout=30) or {}
+    return api_job(worker_name, "bo", tid, timeout=30, fallback_path="/bo") or {}
 
 def run_bo(selected_ids):
-    def _wrapped_handler(wn, tid):
-        tid = str(tid)
+    prev: Dict[str, str] = {}
+
+    def _before(wn, tid):
         # bo 是瞬时动作，也把状态临时标记为 Running 以锁编辑
-        prev = STATE.get(tid, "Idle")
-        STATE[tid] = "Running"
-        refresh_row_enabled(tid)
-        try:
-            res = _bo_handler(wn, tid) or {}
-        except Exception as e:
-            res = {"ok": False, "error": f"{e}"}
+        prev[tid] = STATE.get(tid, "Idle")
+        _set_state(tid, "Running")
+
+    def _after(wn, tid, res):
         # bo 完成后：若之前是 Idle 就回 Idle；否则保持 Running（按你需要可调整）
-        STATE[tid] = prev if res.get("ok") else "Error"
-        refresh_row_enabled(tid)
-        return res
+        _set_state(tid, prev.get(tid, "Idle") if res.get("ok") else "Error")
 
     return orchestrate(
         selected_ids,
-        handler=_wrapped_handler,
+        handler=_bo_handler,
+        batch_item=lambda wn, tid: ("bo", {}),
+        before=_before,
+        after=_after,
         op_name="bo_command",
+        item_timeout=30,
         max_parallel_workers=None
     )
 
 
 
 def _join_handler(worker_name: str, tid: str, game: str, pwd: str) -> Dict[str, Any]:
-    res = api(worker_name, "/join_game", method="POST", payload={"target_id": tid, "game_name": game, "password": pwd}, timeout=60) or {}
-    if res.get("ok"):
-        _log_launch_details(worker_name, tid, res)
-    return res
+    return api_job(worker_name, "join_game", tid, {"game_name": game, "password": pwd},
+                   timeout=60, fallback_path="/join_game") or {}
 
 def run_join(selected_ids, game, pwd):
-    def _wrapped_handler(wn, tid):
-        tid = str(tid)
-        # join 期间也算 Running（防止编辑）
-        prev = STATE.get(tid, "Idle")
-        STATE[tid] = "Running"
-        refresh_row_enabled(tid)
-        try:
-            res = _join_handler(wn, tid, game, pwd) or {}
-        except Exception as e:
-            res = {"ok": False, "error": f"{e}"}
+    def _after(wn, tid, res):
+        if res.get("ok"):
+            _log_launch_details(wn, tid, res)
         # join 失败 → Error；成功保持 Running
-        STATE[tid] = "Running" if res.get("ok") else "Error"
-        refresh_row_enabled(tid)
-        return res
+        _set_state(tid, "Running" if res.get("ok") else "Error")
 
     return orchestrate(
         selected_ids,
-        handler=_wrapped_handler,
+        handler=lambda wn, tid: _join_handler(wn, tid, game, pwd),
+        batch_item=lambda wn, tid: ("join_game", {"game_name": game, "password": pwd}),
+        # join 期间也算 Running（防止编辑）
+        before=lambda wn, tid: _set_state(tid, "Running"),
+        after=_after,
         op_name="join_game",
+        item_timeout=60,
         max_parallel_workers=None
     )
 
 
 def _leave_handler(worker_name: str, tid: str) -> Dict[str, Any]:
-    res = api(worker_name, "/leave_game", method="POST", payload={"target_id": tid}, timeout=30) or {}
-    if res.get("ok"):
-        _log_launch_details(worker_name, tid, res)
-    return res
+    return api_job(worker_name, "leave_game", tid, timeout=30, fallback_path="/leave_game") or {}
 
 def run_leave(selected_ids):
-    def _wrapped_handler(wn, tid):
-        tid = str(tid)
-        STATE[tid] = "Stopping"
-        refresh_row_enabled(tid)
-        try:
-            res = _leave_handler(wn, tid) or {}
-        except Exception as e:
-            res = {"ok": False, "error": f"{e}"}
+    def _after(wn, tid, res):
+        if res.get("ok"):
+            _log_launch_details(wn, tid, res)
         # leave 成功 → 回 Idle；失败 → Error
-        STATE[tid] = "Idle" if res.get("ok") else "Error"
-        refresh_row_enabled(tid)
-        return res
+        _set_state(tid, "Idle" if res.get("ok") else "Error")
 
     return orchestrate(
         selected_ids,
-        handler=_wrapped_handler,
+        handler=_leave_handler,
+        batch_item=lambda wn, tid: ("leave_game", {}),
+        before=lambda wn, tid: _set_state(tid, "Stopping"),
+        after=_after,
         op_name="leave_game",
         delay_override=1.0,
+        item_timeout=30,
         max_parallel_workers=None
     )
 
 
+# -------------- Headless ----------------
+# D2R_ORCH_HEADLESS="launch,join_game,leave_game"：不建窗口，对全部 target（按 target_order）依次跑这些 op。
+# 走的是和按钮相同的 run_*（gap 学习、令牌桶、熔断、trace 导出都生效），日志打印到 stdout；
+# D2R_ORCH_GAME / D2R_ORCH_PASSWORD 给 join_game，D2R_ORCH_REPORT 指定时把每个 op 的摘要另存为 JSON。
+# worker/simcluster.py --drive 默认用它对模拟集群压测（--direct 则绕过 orchestrator）。
+
+def _drain_log_queue_to_stdout():
+    while LOG_QUEUE:
+        line, _tag, _wn = LOG_QUEUE.popleft()
+        print(line, end="", flush=True)
+
+def run_headless(ops: List[str]) -> int:
+    game = os.environ.get("D2R_ORCH_GAME", "")
+    pwd = os.environ.get("D2R_ORCH_PASSWORD", "")
+    runners = {
+        "launch": run_launch,
+        "stop": run_stop,
+        "bo": run_bo,
+        "join_game": lambda ids: run_join(ids, game, pwd),
+        "leave_game": run_leave,
+    }
+    unknown = [op for op in ops if op not in runners]
+    if unknown:
+        print(f"[headless] unknown op(s): {', '.join(unknown)} (known: {', '.join(runners)})", flush=True)
+        return 2
+    ids = [t for t in PREFS.get("target_order", []) if t in TARGETS] or list(TARGETS.keys())
+    if ARCHIVE is not None:
+        ARCHIVE.start()
+    for wn in enabled_workers():
+        HEALTH.start(wn)
+    report = []
+    failed_total = 0
+    try:
+        for op in ops:
+            LAST_RUN.update(text="", summary=None, path=None)
+            th = runners[op](ids)
+            while th.is_alive():
+                th.join(0.2)
+                _drain_log_queue_to_stdout()
+            _drain_log_queue_to_stdout()
+            failed = sorted((t for t in ids if STATE.get(t) == "Error"), key=lambda x: int(x) if x.isdigit() else x)
+            failed_total += len(failed)
+            report.append({"op": op, "summary": LAST_RUN["summary"], "trace": LAST_RUN["path"], "failed": failed})
+            print(f"[headless] {LAST_RUN['text'] or op} · failed {len(failed)}"
+                  + (f" ({', '.join(failed[:10])}{' …' if len(failed) > 10 else ''})" if failed else ""), flush=True)
+            for t in failed:  # 下一个 op 重新计数
+                STATE[t] = "Idle"
+    finally:
+        HEALTH.stop()
+        if ARCHIVE is not None:
+            ARCHIVE.stop()
+        rep_path = os.environ.get("D2R_ORCH_REPORT")
+        if rep_path:
+            Path(rep_path).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    for wn, st in HTTP.stats().items():
+        print(f"[headless] [{wn}] http req={st['requests']} err={st['errors']} avg={st['avg_ms']}ms "
+              f"max={st['max_ms']}ms reused={st['reused']}", flush=True)
+    if JOIN_LIMITER is not None:
+        print(f"[headless] rate {JOIN_LIMITER.to_dict()}", flush=True)
+    return 1 if failed_total else 0
+
+if HEADLESS_OPS:
+    raise SystemExit(run_headless(HEADLESS_OPS))
+
+
 # -------------- UI ----------------
 root = tk.Tk()
 root.title("D2R Orchestrator")
@@ -853,34 +1334,307 @@ btn_list.pack(side="left")
 btn_clear = tk.Button(frame_ops, text="Clear Log", command=clear_log)
 btn_clear.pack(side="left", padx=(6,0))
 
+def show_stats():
+    stats = HTTP.stats()
+    if not stats:
+        log_target("[http] no requests yet")
+    for wn, st in stats.items():
+        log_target(wn, None, f"[http] req={st['requests']} err={st['errors']} "
+                             f"conn={st['connections']} reused={st['reused']} "
+                             f"last={st['last_ms']}ms avg={st['avg_ms']}ms max={st['max_ms']}ms "
+                             f"by_class={st['by_class']}")
+        lp = st["latency_by_class"].get("longpoll")
+        if lp:
+            log_target(wn, None, f"[http] longpoll avg={lp['avg_ms']}ms max={lp['max_ms']}ms (not in avg)")
+
+    if JOIN_LIMITER is not None:
+        log_target(f"[rate] {JOIN_LIMITER.to_dict()}")
+    for key, g in GAPS.snapshot().items():
+        log_target(f"[gap] {key}: {g}")
+    for wn, c in CLOCKS.snapshot().items():
+        log_target(wn, None, f"[clock] offset={c['offset_ms']}ms rtt={c['rtt_ms']}ms")
+    sm = LAST_RUN.get("summary")
+    if sm:
+        log_target(f"[last run] {LAST_RUN['text']}" + (f" · trace {LAST_RUN['path']}" if LAST_RUN.get("path") else ""))
+        for wn, w in sm["workers"].items():
+            log_target(wn, None, f"[last run] targets={w['targets']} busy={w['busy_s']}s gap={w['gap_s']}s "
+                                 f"rate-limit={w['rate_limit_s']}s idle at end={w['idle_tail_s']}s")
+
+btn_stats = tk.Button(frame_ops, text="Stats", command=show_stats)
+btn_stats.pack(side="left", padx=(6,0))
+
+# 最近一次 orchestrate() 的 makespan 摘要（详情：Stats 按钮 / trace 文件）
+lbl_last_run = tk.Label(frame_ops, anchor="w", fg="gray30")
+lbl_last_run.pack(side="left", padx=(10,0))
+
+def refresh_last_run():
+    text = LAST_RUN.get("text")
+    lbl_last_run.configure(text=f"Last run · {text}" if text else "")
+    root.after(1000, refresh_last_run)
+
+frame_workers = tk.LabelFrame(root, text="Workers")
+frame_workers.pack(padx=10, pady=(0, 6), fill="x")
+LIVENESS_COLORS = {
+    "online": "ForestGreen",
+    "connecting": "DarkGoldenrod",
+    "retrying": "DarkOrange3",
+    "offline": "Firebrick3",
+    "disabled": "gray50",
+}
+worker_status_labels: dict[str, tk.Label] = {}
+for _wn in WORKERS.keys():
+    _lbl = tk.Label(frame_workers, anchor="w")
+    _lbl.pack(side="left", padx=8, pady=2)
+    worker_status_labels[_wn] = _lbl
+
+def refresh_worker_status():
+    now = time.time()
+    for wn, lbl in worker_status_labels.items():
+        lv = WORKER_LIVENESS.get(wn) or {}
+        state = lv.get("state", "connecting")
+        text = f"● {wn}: {state}"
+        if state == "online" and lv.get("mode"):
+            text += f" ({lv['mode']})"
+        elif state in ("retrying", "offline") and lv.get("retry_at"):
+            text += f" · retry in {max(0.0, lv['retry_at'] - now):.0f}s"
+        if state != "disabled":
+            h = HEALTH.snapshot(wn)
+            if h["circuit"] != CLOSED:
+                text += f" · circuit {h['circuit']}"
+                state = "offline"
+            elif h["latency_ms"] is not None:
+                text += f" · {h['latency_ms']:.0f}ms"
+                if h.get("version"):
+                    text += f" v{h['version']}"
+                if h.get("is_admin") is False:
+                    text += " · not admin"
+        lbl.configure(text=text, fg=LIVENESS_COLORS.get(state, "black"))
+    root.after(500, refresh_worker_status)
+
 frame_log = tk.LabelFrame(root, text="Log")
 frame_log.pack(padx=10, pady=6, fill="both", expand=True)
-text_log = scrolledtext.ScrolledText(frame_log, height=18, state="disabled")
+
+# 过滤条：target / worker / 文本（小写关键字大小写不敏感）
+frame_log_filter = tk.Frame(frame_log)
+frame_log_filter.pack(fill="x", pady=(2, 2))
+ALL_LABEL = "All"
+var_log_target = tk.StringVar(value=ALL_LABEL)
+var_log_worker = tk.StringVar(value=ALL_LABEL)
+var_log_text = tk.StringVar(value="")
+tk.Label(frame_log_filter, text="Target").pack(side="left", padx=(4, 2))
+ttk.Combobox(frame_log_filter, textvariable=var_log_target, state="readonly", width=6,
+             values=[ALL_LABEL] + sorted(TARGETS.keys(), key=lambda x: int(x) if x.isdigit() else x)
+             ).pack(side="left")
+tk.Label(frame_log_filter, text="Worker").pack(side="left", padx=(10, 2))
+ttk.Combobox(frame_log_filter, textvariable=var_log_worker, state="readonly", width=24,
+             values=[ALL_LABEL] + list(WORKERS.keys())).pack(side="left")
+tk.Label(frame_log_filter, text="Find").pack(side="left", padx=(10, 2))
+ttk.Entry(frame_log_filter, textvariable=var_log_text, width=28).pack(side="left")
+
+_log_filter_timer = None
+
+def apply_log_filter():
+    global _log_filter_timer
+    _log_filter_timer = None
+    tgt = var_log_target.get()
+    wn = var_log_worker.get()
+    LOG_VIEW.set_filter(ANY if tgt == ALL_LABEL else tgt, ANY if wn == ALL_LABEL else wn, var_log_text.get())
+    log_widget.goto_end()
+
+def _on_log_filter_change(*_):
+    # 文本框边打字边过滤：150ms 去抖
+    global _log_filter_timer
+    if _log_filter_timer:
+        root.after_cancel(_log_filter_timer)
+    _log_filter_timer = root.after(150, apply_log_filter)
+
+for _v in (var_log_target, var_log_worker, var_log_text):
+    _v.trace_add("write", _on_log_filter_change)
+
 LOG_FONT = tkfont.nametofont("TkFixedFont").copy()
 if "Consolas" in tkfont.families():
     LOG_FONT.configure(family="Consolas")
 LOG_FONT.configure(size=10)
-text_log.configure(font=LOG_FONT)
-for k, color in COLOR_MAP.items():
-    text_log.tag_configure(f"T{k}", foreground=color)
-text_log.pack(fill="both", expand=True)
+log_widget = VirtualLogView(frame_log, LOG_VIEW, font=LOG_FONT,
+                            tag_colors={f"T{k}": color for k, color in COLOR_MAP.items()})
+log_widget.pack(fill="both", expand=True)
+lbl_log_stats = tk.Label(frame_log, anchor="w", fg="gray40")
+lbl_log_stats.pack(fill="x")
+
+def refresh_log_stats():
+    lbl_log_stats.configure(text=log_stats_text())
+    root.after(1000, refresh_log_stats)
 frame_assign = build_assignment_panel(root)
 
-def poll_worker_logs():
+# 每个 worker 一个读游标：/events 是非破坏性读取，多个读者互不干扰
+LOG_CURSORS: dict[str, dict] = {}   # worker_name -> {"after": int, "boot_id": str|None}
+SSE_READ_TIMEOUT = 45               # > worker 心跳间隔（15s）的 2 倍，超时即视为断线重连
+
+def _handle_worker_event(worker_name: str, cur: dict, ev: dict):
+    seq = int(ev.get("seq") or 0)
+    if seq and seq <= cur["after"]:
+        return  # 重连后的重复事件
+    log_target(worker_name, ev.get("target_id", "?"), ev.get("msg", ""), event=ev)
+    if seq:
+        cur["after"] = seq
+
+def _check_boot(worker_name: str, cur: dict, boot_id) -> bool:
+    """boot_id 变化（worker 重启）→ 游标复位；返回 True 表示已复位。"""
+    if cur["boot_id"] is not None and boot_id and boot_id != cur["boot_id"]:
+        log_target(worker_name, None, "worker restarted → event cursor reset")
+        cur.update(after=0, boot_id=boot_id)
+        return True
+    if boot_id:
+        cur["boot_id"] = boot_id
+    return False
+
+def _stream_worker_logs(worker_name: str, cur: dict, on_connect: Optional[Callable[[], None]] = None):
+    """
+    订阅 GET /events/stream（SSE），阻塞直到断线；连上后调用 on_connect()。
+    返回 False 表示 worker 不支持流式端点（旧版），调用方改用轮询。
+    """
+    with HTTP.request(worker_name, WORKERS[worker_name]["url"], "GET", "/events/stream",
+                      params={"after": cur["after"]}, stream=True, timeout=SSE_READ_TIMEOUT,
+                      headers={"Accept": "text/event-stream"}) as r:
+        if r.status_code == 404:
+            return False
+        r.raise_for_status()
+        if on_connect:
+            on_connect()
+        event, data = "message", []
+        for line in r.iter_lines(decode_unicode=True):
+            if line is None:
+                continue
+            if line == "":
+                if data:
+                    try:
+                        payload = json.loads("\n".join(data))
+                    except ValueError:
+                        payload = {}
+                    if event == "log":
+                        _handle_worker_event(worker_name, cur, payload)
+                    elif event == "hello":
+                        if _check_boot(worker_name, cur, payload.get("boot_id")):
+                            return True  # 立即按新游标重连
+                    elif event == "dropped":
+                        log_target(worker_name, None, f"[events] {payload.get('count')} events dropped (ring overflow)")
+                    # heartbeat：只用于保活（读超时）
+                event, data = "message", []
+                _touch_liveness(worker_name)
+                continue
+            if line.startswith(":"):
+                continue
+            field, _, value = line.partition(":")
+            value = value[1:] if value.startswith(" ") else value
+            if field == "event":
+                event = value
+            elif field == "data":
+                data.append(value)
+    return True
+
+def _poll_worker_logs_once(worker_name: str, cur: dict) -> bool:
+    res = api(worker_name, "/events", method="POST",
+              payload={"after": cur["after"], "max_items": 200})
+    if not res or res.get("events") is None:
+        return False
+    if _check_boot(worker_name, cur, res.get("boot_id")):
+        return True
+    if res.get("dropped"):
+        log_target(worker_name, None, f"[events] {res['dropped']} events dropped (ring overflow)")
+    for ev in res["events"]:
+        _handle_worker_event(worker_name, cur, ev)
+    cur["after"] = max(cur["after"], int(res.get("next", cur["after"])))
+    return True
+
+# ---- worker 存活状态（由各自的日志订阅线程维护，UI 定时读取）----
+# state: connecting | online | retrying | offline | disabled
+WORKER_LIVENESS: dict[str, dict] = {}
+LIVENESS_OFFLINE_AFTER = 3          # 连续失败次数 ≥ 此值 → offline
+BACKOFF_MIN, BACKOFF_MAX = 0.5, 30.0
+
+def _set_liveness(worker_name: str, state: str, **kw):
+    lv = WORKER_LIVENESS.setdefault(worker_name, {"state": "connecting", "mode": None, "failures": 0,
+                                                  "last_ok": None, "retry_at": None})
+    prev = lv["state"]
+    lv.update(state=state, **kw)
+    if prev != state and state in ("online", "offline"):
+        log_target(worker_name, None, f"[worker] {prev} → {state}")
+
+def _touch_liveness(worker_name: str):
+    lv = WORKER_LIVENESS.get(worker_name)
+    if lv is not None:
+        lv["last_ok"] = time.time()
+
+def _mark_ok(worker_name: str, mode: str):
+    _set_liveness(worker_name, "online", mode=mode, failures=0, last_ok=time.time(), retry_at=None)
+
+def _mark_failed(worker_name: str, backoff: float) -> float:
+    """记一次失败，返回下一次的退避秒数（指数增长，上限 BACKOFF_MAX）。"""
+    lv = WORKER_LIVENESS.get(worker_name) or {}
+    failures = int(lv.get("failures") or 0) + 1
+    state = "offline" if failures >= LIVENESS_OFFLINE_AFTER else "retrying"
+    _set_liveness(worker_name, state, failures=failures, retry_at=time.time() + backoff)
+    return min(backoff * 2, BACKOFF_MAX)
+
+def subscribe_worker_logs(worker_name: str):
+    """
+    每个 worker 一条独立线程、一条长连接；断线后带游标重连，失败按 0.5s→30s 指数退避，
+    旧版 worker 回退到 0.3s 轮询（轮询失败同样退避）。worker 之间互不阻塞。
+    """
+    def _sleep_backoff(backoff: float):
+        time.sleep(backoff * random.uniform(0.8, 1.2))
+
     def worker_thread():
+        cur = LOG_CURSORS.setdefault(worker_name, {"after": 0, "boot_id": None})
+        backoff = BACKOFF_MIN
+        streaming = True
         while True:
-            for worker_name in WORKERS.keys():
-                res = api(worker_name, "/drain_logs", method="POST", payload={"max_items": 200}, timeout=2)
-                if not res or res.get("events") is None:
-                    continue
-                for ev in res["events"]:
-                    tid = ev.get("target_id", "?")
-                    msg = ev.get("msg", "")
-                    log_target(worker_name, tid, msg)
-            time.sleep(0.3)
-    threading.Thread(target=worker_thread, daemon=True).start()
-
-# 在创建完 text_log、配置好颜色 tag 之后调用：
+            if not streaming:
+                if _poll_worker_logs_once(worker_name, cur):
+                    _mark_ok(worker_name, "poll")
+                    backoff = BACKOFF_MIN
+                    time.sleep(0.3)
+                else:
+                    nxt = _mark_failed(worker_name, backoff)
+                    _sleep_backoff(backoff)
+                    backoff = nxt
+                continue
+            try:
+                streaming = _stream_worker_logs(worker_name, cur, on_connect=lambda: _mark_ok(worker_name, "stream"))
+                backoff = BACKOFF_MIN
+                if not streaming:
+                    log_target(worker_name, None, "[events] /events/stream unsupported → polling /events")
+                else:
+                    time.sleep(0.1)  # 正常断开（服务端关闭）后稍等再连
+            except Exception:
+                nxt = _mark_failed(worker_name, backoff)
+                _sleep_backoff(backoff)
+                backoff = nxt
+    _set_liveness(worker_name, "connecting")
+    threading.Thread(target=worker_thread, daemon=True, name=f"events-{worker_name}").start()
+
+def poll_worker_logs():
+    for worker_name in WORKERS.keys():
+        if worker_enabled(worker_name):
+            subscribe_worker_logs(worker_name)
+            HEALTH.start(worker_name)
+        else:
+            _set_liveness(worker_name, "disabled")
+            log_target(worker_name, None, "[worker] disabled in config → skipped")
+
+# 在创建完日志控件、配置好颜色 tag 之后调用：
+def _on_close():
+    if ARCHIVE is not None:
+        ARCHIVE.stop()  # 写完队列、fsync 当前文件
+    root.destroy()
+
+root.protocol("WM_DELETE_WINDOW", _on_close)
+if ARCHIVE is not None:
+    ARCHIVE.start()
+_flush_log_queue()
+refresh_log_stats()
+refresh_last_run()
 poll_worker_logs()
+refresh_worker_status()
 
 root.mainloop()
\ No newline at end of file
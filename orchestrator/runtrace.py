@@ -0,0 +1,250 @@
+"""
+orchestrate() 一次运行的时间线：orchestrator 端计时 + worker 端 span（按时钟偏移校正），
+导出为 Chrome / Perfetto trace JSON（chrome://tracing 或 ui.perfetto.dev 直接打开）。
+
+  - ClockSync：每次 /health 心跳记一个 (发送, worker 时间, 接收) 样本，
+    取最近 keep 个里 RTT 最小的一个：offset = worker_time - (发送 + 接收) / 2，误差 ≤ RTT/2
+  - RunTrace：线程安全地收集一次运行的区间 (worker, target, name, start, end, args)；
+    worker 的 span 减去 offset 换到本机时钟，并整体平移到该 target 请求的 [发出, 收到] 区间内
+    （偏移估计的残差不会让 worker 步骤跑到请求之外）
+  - 导出：每个 worker 一个 process，每个 target 一个 thread，worker 队列（间隔、整体耗时）在 thread 0；
+    另有一个 orchestrator process 画整次运行
+  - summary()：makespan、关键路径（最后结束的 target）、每个 worker 的忙 / 间隔 / 限速等待 / 收尾空闲
+"""
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+Interval = Tuple[str, Optional[str], str, str, float, float, dict]   # (worker, tid, name, cat, start, end, args)
+
+
+class ClockSync:
+    def __init__(self, keep: int = 8):
+        self.keep = max(1, int(keep))
+        self._lock = threading.Lock()
+        self._samples: Dict[str, deque] = {}
+
+    def sample(self, worker_name: str, t_send: float, worker_time: float, t_recv: float):
+        rtt = max(0.0, t_recv - t_send)
+        with self._lock:
+            dq = self._samples.get(worker_name)
+            if dq is None:
+                dq = self._samples[worker_name] = deque(maxlen=self.keep)
+            dq.append((rtt, float(worker_time) - (t_send + t_recv) / 2.0))
+
+    def offset(self, worker_name: str) -> Tuple[float, Optional[float]]:
+        """返回 (offset 秒, rtt 秒)；没有样本时 (0.0, None)。worker 时钟 = 本机 + offset。"""
+        with self._lock:
+            dq = self._samples.get(worker_name)
+            if not dq:
+                return 0.0, None
+            rtt, off = min(dq)
+            return off, rtt
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            names = list(self._samples)
+        out = {}
+        for wn in names:
+            off, rtt = self.offset(wn)
+            out[wn] = {"offset_ms": round(off * 1000.0, 1), "rtt_ms": None if rtt is None else round(rtt * 1000.0, 1)}
+        return out
+
+
+class RunTrace:
+    def __init__(self, op_name: str, clock: Optional[ClockSync] = None):
+        self.op_name = op_name
+        self.clock = clock
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self._lock = threading.Lock()
+        self.intervals: List[Interval] = []
+        self.requests: Dict[Tuple[str, str], Tuple[float, float]] = {}
+        self.offsets: Dict[str, dict] = {}
+
+    # ---- 记录（任意线程）----
+
+    def span(self, worker_name: str, tid: Optional[str], name: str, start: float, end: float,
+             cat: str = "orchestrator", **args):
+        with self._lock:
+            self.intervals.append((worker_name, None if tid is None else str(tid), name, cat,
+                                   start, max(start, end), args))
+
+    def request(self, worker_name: str, tid: str, start: float, end: float, **args):
+        """一个 target 的请求区间（orchestrator 端，从开始处理到拿到结果）。"""
+        self.span(worker_name, tid, self.op_name, start, end, **args)
+        with self._lock:
+            self.requests[(worker_name, str(tid))] = (start, max(start, end))
+
+    def worker_spans(self, worker_name: str, tid: str, spans: List[dict], gap_ms: Optional[int] = None):
+        """worker 响应里的 spans（worker 时钟）；gap_ms：batch 模式下这一项开始前 worker 端等待的间隔。"""
+        spans = [s for s in (spans or []) if isinstance(s, dict) and s.get("start") is not None]
+        if not spans:
+            return
+        off, rtt = self.clock.offset(worker_name) if self.clock else (0.0, None)
+        first = min(s["start"] for s in spans)
+        a = first - off
+        b = max(s["start"] + (s.get("dur_ms") or 0.0) / 1000.0 for s in spans) - off
+        shift = -off
+        win = self.requests.get((worker_name, str(tid)))
+        if win:
+            s0, e0 = win
+            if a < s0 or b - a > e0 - s0:
+                shift += s0 - a
+            elif b > e0:
+                shift -= b - e0
+        with self._lock:
+            self.offsets[worker_name] = {"offset_ms": round(off * 1000.0, 1),
+                                         "rtt_ms": None if rtt is None else round(rtt * 1000.0, 1)}
+        for s in spans:
+            st = s["start"] + shift
+            args = dict(s.get("attrs") or {})
+            if s.get("error"):
+                args["error"] = s["error"]
+            self.span(worker_name, tid, s.get("name") or "?", st, st + (s.get("dur_ms") or 0.0) / 1000.0,
+                      cat="worker", **args)
+        if gap_ms:
+            start = first + shift
+            self.span(worker_name, None, "gap", start - gap_ms / 1000.0, start, cat="worker", target=str(tid))
+
+    def finish(self):
+        self.finished = time.time()
+
+    def _end(self, ivs: List[Interval]) -> float:
+        end = self.finished or time.time()
+        return max([end] + [iv[5] for iv in ivs])
+
+    # ---- 分析 ----
+
+    def summary(self) -> dict:
+        with self._lock:
+            ivs = list(self.intervals)
+            reqs = dict(self.requests)
+        end = self._end(ivs)
+        workers: Dict[str, dict] = {}
+        for wn, tid, name, cat, s, e, args in ivs:
+            w = workers.setdefault(wn, {"targets": 0, "busy_s": 0.0, "gap_s": 0.0, "rate_limit_s": 0.0,
+                                        "end": self.started})
+            if tid is None and name == "gap":
+                w["gap_s"] += e - s
+            elif name == "rate_limit":
+                w["rate_limit_s"] += e - s
+        by_worker: Dict[str, list] = {}
+        for (wn, tid), (s, e) in reqs.items():
+            w = workers.setdefault(wn, {"targets": 0, "busy_s": 0.0, "gap_s": 0.0, "rate_limit_s": 0.0,
+                                        "end": self.started})
+            w["targets"] += 1
+            w["end"] = max(w["end"], e)
+            by_worker.setdefault(wn, []).append((s, e))
+        for wn, spans in by_worker.items():  # busy 取区间并集：重叠的请求窗口不重复计
+            cur_s = cur_e = None
+            for s, e in sorted(spans):
+                if cur_e is None or s > cur_e:
+                    if cur_e is not None:
+                        workers[wn]["busy_s"] += cur_e - cur_s
+                    cur_s, cur_e = s, e
+                else:
+                    cur_e = max(cur_e, e)
+            workers[wn]["busy_s"] += cur_e - cur_s
+        critical = None
+        if reqs:
+            (cw, ct), (cs, ce) = max(reqs.items(), key=lambda kv: kv[1][1])
+            critical = {"worker": cw, "target": ct, "end_s": round(ce - self.started, 2)}
+        per_worker = {wn: {"targets": w["targets"], "busy_s": round(w["busy_s"], 2), "gap_s": round(w["gap_s"], 2),
+                           "rate_limit_s": round(w["rate_limit_s"], 2),
+                           "idle_tail_s": round(max(0.0, end - w["end"]), 2)}
+                      for wn, w in workers.items()}
+        return {"op": self.op_name, "started": self.started, "makespan_s": round(end - self.started, 2),
+                "targets": len(reqs), "critical": critical, "workers": per_worker,
+                "clock": dict(self.offsets)}
+
+    def summary_text(self) -> str:
+        sm = self.summary()
+        text = f"{sm['op']}: {sm['targets']} targets, makespan {sm['makespan_s']:.1f}s"
+        c = sm["critical"]
+        if c:
+            text += f" · critical {c['worker']}/T{c['target']} (ends +{c['end_s']:.1f}s)"
+        gap = sum(w["gap_s"] for w in sm["workers"].values())
+        rate = sum(w["rate_limit_s"] for w in sm["workers"].values())
+        if gap:
+            text += f" · gaps {gap:.1f}s"
+        if rate:
+            text += f" · rate-limit {rate:.1f}s"
+        return text
+
+    # ---- 导出 ----
+
+    def to_chrome(self) -> dict:
+        with self._lock:
+            ivs = list(self.intervals)
+        t0 = self.started
+        end = self._end(ivs)
+        sm = self.summary()
+        crit = sm["critical"]
+
+        pids: Dict[str, int] = {}
+        tids: Dict[Tuple[str, Optional[str]], int] = {}
+        events: List[dict] = [
+            {"ph": "M", "name": "process_name", "pid": 0, "tid": 0, "args": {"name": "orchestrator"}},
+            {"ph": "M", "name": "process_sort_index", "pid": 0, "tid": 0, "args": {"sort_index": 0}},
+            {"ph": "X", "name": f"{self.op_name} run", "cat": "orchestrator", "pid": 0, "tid": 0,
+             "ts": 0, "dur": round((end - t0) * 1e6), "args": {k: v for k, v in sm.items() if k != "workers"}},
+        ]
+
+        def pid_of(wn: str) -> int:
+            if wn not in pids:
+                pids[wn] = len(pids) + 1
+                events.append({"ph": "M", "name": "process_name", "pid": pids[wn], "tid": 0, "args": {"name": wn}})
+                events.append({"ph": "M", "name": "process_sort_index", "pid": pids[wn], "tid": 0,
+                               "args": {"sort_index": pids[wn]}})
+                events.append({"ph": "M", "name": "thread_name", "pid": pids[wn], "tid": 0, "args": {"name": "queue"}})
+            return pids[wn]
+
+        def tid_of(wn: str, tid: Optional[str]) -> int:
+            key = (wn, tid)
+            if key not in tids:
+                if tid is None:
+                    tids[key] = 0
+                else:
+                    tids[key] = int(tid) if tid.isdigit() else 1000 + len(tids)
+                    events.append({"ph": "M", "name": "thread_name", "pid": pid_of(wn), "tid": tids[key],
+                                   "args": {"name": f"T{tid}"}})
+                    events.append({"ph": "M", "name": "thread_sort_index", "pid": pid_of(wn), "tid": tids[key],
+                                   "args": {"sort_index": tids[key]}})
+            return tids[key]
+
+        # 先外后内：同一 thread 上开始早 / 持续长的在前，查看器据此正确嵌套
+        for wn, tid, name, cat, s, e, args in sorted(ivs, key=lambda iv: (iv[4], -(iv[5] - iv[4]))):
+            ev = {"ph": "X", "name": name, "cat": cat, "pid": pid_of(wn), "tid": tid_of(wn, tid),
+                  "ts": round((s - t0) * 1e6), "dur": round((e - s) * 1e6), "args": args}
+            if crit and cat == "orchestrator" and name == self.op_name and wn == crit["worker"] \
+                    and tid == crit["target"]:
+                ev["args"] = dict(args, critical_path=True)
+                ev["cname"] = "terrible"
+            events.append(ev)
+        return {"traceEvents": events, "displayTimeUnit": "ms",
+                "otherData": {"op": self.op_name, "started": datetime.fromtimestamp(t0).isoformat(),
+                              "summary": sm}}
+
+    def save(self, directory, keep: int = 20) -> Path:
+        d = Path(directory)
+        d.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.fromtimestamp(self.started).strftime("%Y%m%d-%H%M%S")
+        path = d / f"{self.op_name}-{stamp}.json"
+        n = 1
+        while path.exists():
+            path = d / f"{self.op_name}-{stamp}-{n}.json"
+            n += 1
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome(), f, ensure_ascii=False, separators=(",", ":"))
+        old = sorted(d.glob("*.json"), key=lambda p: p.stat().st_mtime)
+        for p in old[:max(0, len(old) - int(keep))]:
+            try:
+                p.unlink()
+            except OSError:
+                pass
+        return path
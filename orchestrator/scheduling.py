@@ -0,0 +1,174 @@
+"""
+orchestrate() 的调度辅助。
+
+GapLearner：同一 worker 上相邻两个 target 之间的间隔（每个 worker × 操作各一个）。
+  - config 的 join_delay_sec（或 delay_override）是上限 ceiling：失败之后总是等满
+  - 下限 floor = max(floor, ceiling × floor_frac)，默认只允许缩到上限的一半
+  - 只按 worker 确认过的结果学习（learn=True 的操作）：ok 只代表按键已发出，不说明没被限流。
+    confirmed=True（join 后画面进入 in_game、launch 的 post_launch 按画面就绪并进了大厅）才缩短；
+    confirmed=False 与失败同样拉长；没有确认（无 UI 签名）时 gap 保持不变。
+    launch 的确认要等 post_launch 跑完，由 confirm() 事后补记
+  - 确认成功之后用学到的 gap：每次乘 shrink 缩小，但不低于 safe_min
+  - 失败时把当时用的 gap × grow 记为新的 safe_min（“这么短会出问题”），gap 回弹
+  - safe_min 每次成功按 decay 缓慢回落，避免一次偶发失败永久拖慢
+
+TokenBucket：跨 worker 的全局限速（launch / join_game 共用一个桶）。
+"""
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+
+class GapLearner:
+    def __init__(self, ceiling: float, floor: float = 0.0, shrink: float = 0.7, grow: float = 1.5,
+                 decay: float = 0.95, floor_frac: float = 0.5, learn: bool = True):
+        self.ceiling = max(0.0, float(ceiling))
+        self.min_floor = max(0.0, float(floor))
+        self.floor_frac = min(max(0.0, float(floor_frac)), 1.0)
+        self.floor = self._floor_for(self.ceiling)
+        self.learn = bool(learn)
+        self.shrink = float(shrink)
+        self.grow = float(grow)
+        self.decay = float(decay)
+        self.gap = self.ceiling          # 从上限开始，逐步学习
+        self.safe_min = self.floor
+        self.ok = 0
+        self.failed = 0
+        self.confirmed = 0
+        self.refuted = 0
+        self._lock = threading.Lock()
+
+    def _floor_for(self, ceiling: float) -> float:
+        return min(max(self.min_floor, ceiling * self.floor_frac), ceiling)
+
+    def set_ceiling(self, ceiling: float):
+        with self._lock:
+            self.ceiling = max(0.0, float(ceiling))
+            self.floor = self._floor_for(self.ceiling)
+            self.gap = min(max(self.gap, self.floor), self.ceiling)
+            self.safe_min = min(max(self.safe_min, self.floor), self.ceiling)
+
+    def next_gap(self, prev_ok: bool) -> float:
+        with self._lock:
+            return self.gap if prev_ok else self.ceiling
+
+    def record(self, ok: bool, gap_used: float, confirmed: Optional[bool] = None):
+        """
+        gap_used：这一项开始前实际等待的秒数（第一项为 0，不参与学习）。
+        confirmed：worker 对真实结果的确认（None = 无法确认 / 之后用 confirm() 补记）。
+        """
+        with self._lock:
+            if not ok:
+                self.failed += 1
+                self._grow(gap_used)
+                return
+            self.ok += 1
+            if self.learn and confirmed is not None:
+                self._learn(confirmed, gap_used)
+
+    def confirm(self, confirmed: bool, gap_used: float):
+        """事后到达的确认（例如 launch 之后的 post_launch 结果）。"""
+        with self._lock:
+            if self.learn:
+                self._learn(confirmed, gap_used)
+
+    def _learn(self, confirmed: bool, gap_used: float):
+        if confirmed:
+            self.confirmed += 1
+            self.safe_min = max(self.floor, self.safe_min * self.decay)
+            self.gap = max(self.safe_min, self.floor, self.gap * self.shrink)
+        else:
+            self.refuted += 1
+            self._grow(gap_used)
+
+    def _grow(self, gap_used: float):
+        if gap_used > 0:
+            self.safe_min = min(self.ceiling, max(self.safe_min, gap_used * self.grow))
+        self.gap = min(self.ceiling, max(self.safe_min, self.gap * self.grow))
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {"gap": round(self.gap, 2), "safe_min": round(self.safe_min, 2), "floor": round(self.floor, 2),
+                    "ceiling": self.ceiling, "learn": self.learn, "ok": self.ok, "failed": self.failed,
+                    "confirmed": self.confirmed, "refuted": self.refuted}
+
+
+LEARN_OPS = ("launch", "join_game")  # worker 会给出 confirmed 的操作
+
+
+class GapTable:
+    """(worker, op) → GapLearner；ceiling 每次取用时按当前 config 更新。只有 learn_ops 里的操作会缩短间隔。"""
+
+    def __init__(self, floor: float = 0.0, floor_frac: float = 0.5, learn_ops=LEARN_OPS):
+        self.floor = float(floor)
+        self.floor_frac = float(floor_frac)
+        self.learn_ops = set(learn_ops or ())
+        self._lock = threading.Lock()
+        self._learners: Dict[Tuple[str, str], GapLearner] = {}
+
+    def get(self, worker_name: str, op_name: str, ceiling: float) -> GapLearner:
+        key = (worker_name, op_name)
+        with self._lock:
+            lr = self._learners.get(key)
+            if lr is None:
+                lr = self._learners[key] = GapLearner(ceiling, floor=self.floor, floor_frac=self.floor_frac,
+                                                      learn=op_name in self.learn_ops)
+        if lr.ceiling != float(ceiling):
+            lr.set_ceiling(ceiling)
+        return lr
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            items = list(self._learners.items())
+        return {f"{wn}/{op}": lr.to_dict() for (wn, op), lr in items}
+
+
+class TokenBucket:
+    """
+    全局令牌桶（GCRA 形式，按预约排队）：rate 个/秒，最多攒 burst 个。
+    acquire() 立即算出自己的放行时刻并预约（FIFO，先到先得），再睡到该时刻；
+    因此多个 worker 线程同时排队时，放行严格按桶速率紧密排列，不会扎堆也不会空转。
+    """
+
+    def __init__(self, rate: float, burst: int = 1, clock=None, sleep=None):
+        self.interval = 1.0 / float(rate) if rate > 0 else 0.0
+        self.burst = max(1, int(burst))
+        self.clock = clock or time.monotonic
+        self.sleep = sleep or time.sleep
+        self._tat = 0.0                  # theoretical arrival time
+        self._lock = threading.Lock()
+        self.stats = {"acquired": 0, "waited": 0, "wait_total_s": 0.0, "wait_max_s": 0.0, "last_wait_s": 0.0}
+
+    def reserve(self) -> float:
+        """预约一个令牌，返回需要等待的秒数（不睡眠）。"""
+        if self.interval <= 0:
+            return 0.0
+        with self._lock:
+            now = self.clock()
+            tat = max(self._tat, now)
+            allow_at = tat - (self.burst - 1) * self.interval
+            wait = max(0.0, allow_at - now)
+            self._tat = tat + self.interval
+            st = self.stats
+            st["acquired"] += 1
+            st["last_wait_s"] = wait
+            if wait > 0:
+                st["waited"] += 1
+                st["wait_total_s"] += wait
+                st["wait_max_s"] = max(st["wait_max_s"], wait)
+            return wait
+
+    def acquire(self) -> float:
+        wait = self.reserve()
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            d = dict(self.stats)
+        d.update(rate_per_s=round(1.0 / self.interval, 3) if self.interval else None, burst=self.burst)
+        d["wait_total_s"] = round(d["wait_total_s"], 2)
+        d["wait_max_s"] = round(d["wait_max_s"], 2)
+        d["last_wait_s"] = round(d["last_wait_s"], 2)
+        return d
@@ -0,0 +1,157 @@
+"""
+worker 健康表 + 熔断器。
+
+  - HealthMonitor：每个 worker 一条心跳线程（GET /health，旧版回退 /admin_status），
+    记录 latency / last_seen / is_admin / version / boot_id / 最近错误
+  - CircuitBreaker：连续 fail_threshold 次连接级失败 → open；open 期间 allow() 直接返回 False，
+    调用方（orchestrate）立即报错而不是每个 target 各等一次 ConnectTimeout。
+    open_sec 到期后由心跳线程做一次 half-open 探测：成功 → closed；失败 → 再 open，
+    open_sec 翻倍（上限 max_open_sec）
+业务请求（api()）的成功/失败也通过 record_success / record_failure 喂给熔断器。
+"""
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, fail_threshold: int = 3, open_sec: float = 5.0, max_open_sec: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.fail_threshold = max(1, int(fail_threshold))
+        self.base_open_sec = float(open_sec)
+        self.max_open_sec = float(max_open_sec)
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.open_sec = self.base_open_sec
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """业务请求是否放行：只有 closed 放行；open / half_open 期间一律快速失败。"""
+        with self._lock:
+            return self.state == CLOSED
+
+    def probe_due(self) -> bool:
+        """open 时间到 → 进入 half_open，返回 True 表示调用方应发一次探测。"""
+        with self._lock:
+            if self.state == OPEN and self.clock() - self.opened_at >= self.open_sec:
+                self.state = HALF_OPEN
+                return True
+            return self.state == CLOSED
+
+    def retry_in(self) -> float:
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.opened_at + self.open_sec - self.clock())
+
+    def record_success(self) -> Optional[str]:
+        """返回状态变化（"closed"）或 None。"""
+        with self._lock:
+            changed = self.state != CLOSED
+            self.state = CLOSED
+            self.failures = 0
+            self.open_sec = self.base_open_sec
+            return CLOSED if changed else None
+
+    def record_failure(self) -> Optional[str]:
+        """返回状态变化（"open"）或 None。"""
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                # 探测失败：重新 open，等待时间翻倍（不算新的状态变化）
+                self.open_sec = min(self.open_sec * 2, self.max_open_sec)
+                self.state = OPEN
+                self.opened_at = self.clock()
+                return None
+            if self.state == OPEN or self.failures < self.fail_threshold:
+                return None
+            self.state = OPEN
+            self.opened_at = self.clock()
+            return OPEN
+
+
+class HealthMonitor:
+    def __init__(self, probe: Callable[[str], dict], interval: float = 2.0,
+                 breaker_factory: Callable[[], CircuitBreaker] = CircuitBreaker,
+                 on_change: Optional[Callable[[str, str, str], None]] = None):
+        """
+        probe(worker_name) -> {"ok": bool, "error"?: str, "version"?, "is_admin"?, "boot_id"?}
+        on_change(worker_name, new_state, reason)：熔断器状态变化回调（记日志用）
+        """
+        self.probe = probe
+        self.interval = float(interval)
+        self.breaker_factory = breaker_factory
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self.table: Dict[str, dict] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self._stop = threading.Event()
+
+    def _entry(self, worker_name: str) -> dict:
+        with self._lock:
+            if worker_name not in self.table:
+                self.table[worker_name] = {"latency_ms": None, "last_seen": None, "is_admin": None,
+                                           "version": None, "boot_id": None, "last_error": None}
+                self.breakers[worker_name] = self.breaker_factory()
+            return self.table[worker_name]
+
+    def breaker(self, worker_name: str) -> CircuitBreaker:
+        self._entry(worker_name)
+        return self.breakers[worker_name]
+
+    # ---- 供业务请求调用 ----
+
+    def allow(self, worker_name: str) -> bool:
+        return self.breaker(worker_name).allow()
+
+    def record_success(self, worker_name: str, reason: str = "request ok"):
+        self._entry(worker_name)["last_seen"] = time.time()
+        if self.breaker(worker_name).record_success() and self.on_change:
+            self.on_change(worker_name, CLOSED, reason)
+
+    def record_failure(self, worker_name: str, error: str):
+        self._entry(worker_name)["last_error"] = error
+        if self.breaker(worker_name).record_failure() and self.on_change:
+            self.on_change(worker_name, OPEN, error)
+
+    def snapshot(self, worker_name: str) -> dict:
+        e = dict(self._entry(worker_name))
+        b = self.breaker(worker_name)
+        e.update(circuit=b.state, failures=b.failures, retry_in=round(b.retry_in(), 1))
+        return e
+
+    # ---- 心跳 ----
+
+    def check(self, worker_name: str) -> bool:
+        t0 = time.perf_counter()
+        res = self.probe(worker_name) or {}
+        ms = (time.perf_counter() - t0) * 1000.0
+        e = self._entry(worker_name)
+        if res.get("ok") is False:
+            self.record_failure(worker_name, str(res.get("error") or "probe failed"))
+            return False
+        e.update(latency_ms=round(ms, 1), last_error=None,
+                 **{k: res[k] for k in ("version", "is_admin", "boot_id") if k in res})
+        self.record_success(worker_name, "probe ok")
+        return True
+
+    def start(self, worker_name: str):
+        self._entry(worker_name)
+
+        def loop():
+            while not self._stop.is_set():
+                if self.breaker(worker_name).probe_due():
+                    try:
+                        self.check(worker_name)
+                    except Exception as ex:
+                        self.record_failure(worker_name, str(ex))
+                self._stop.wait(self.interval)
+
+        threading.Thread(target=loop, daemon=True, name=f"health-{worker_name}").start()
+
+    def stop(self):
+        self._stop.set()
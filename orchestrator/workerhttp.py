@@ -0,0 +1,154 @@
+"""
+orchestrator → worker 的 HTTP 连接层。
+
+每个 worker 一个 requests.Session（HTTPAdapter 连接池，keep-alive）：
+日志订阅、job 长轮询、launch/join/bo 连发都复用已建立的 TCP 连接，不再每次握手。
+
+超时按端点类别给出 (connect, read) 默认值，调用方显式传 timeout 时覆盖 read：
+  - poll     ：/events /list /health 等轻量查询，快速失败
+  - control  ：/jobs /batch 的提交、取消
+  - longpoll ：/jobs/{id}/result?wait= 、/batch/{id}?wait= 、带 wait 的 /events，read 要大于 wait
+  - action   ：旧版同步端点（/launch /stop /join_game …），整个动作跑完才返回
+  - stream   ：/events/stream 长连接，read 超时即视为断线
+每个 worker 记录请求数、错误数、延迟（last/avg/max）以及连接复用情况
+（来自 urllib3 连接池：num_requests - num_connections = 复用次数）。
+延迟只统计 poll / control / action；longpoll 的耗时主要是服务端等待，按类别单独列出，stream 不计。
+"""
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CONNECT_TIMEOUTS = {"poll": 1.0, "control": 2.0, "longpoll": 2.0, "action": 3.0, "stream": 3.0}
+READ_TIMEOUTS = {"poll": 2.0, "control": 5.0, "longpoll": 15.0, "action": 90.0, "stream": 45.0}
+UNTIMED_CLASSES = ("longpoll", "stream")  # 不计入总体 last/avg/max
+
+_POLL_PATHS = ("/events", "/drain_logs", "/list", "/health", "/admin_status", "/state", "/uimap",
+               "/capture/stats", "/post_launch/timings", "/metrics")
+_CONTROL_PATHS = ("/jobs", "/batch")
+
+
+def endpoint_class(path: str, body: Optional[dict] = None) -> str:
+    p, _, query = path.partition("?")
+    if p.startswith("/events/stream"):
+        return "stream"
+    if "wait=" in query or (p.startswith("/events") and (body or {}).get("wait")):
+        return "longpoll"
+    if p.startswith(_CONTROL_PATHS):
+        return "control"
+    if p.startswith(_POLL_PATHS):
+        return "poll"
+    return "action"
+
+
+class _Stats:
+    __slots__ = ("requests", "errors", "last_ms", "total_ms", "max_ms", "timed", "by_class", "lat_by_class")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.last_ms = 0.0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.timed = 0
+        self.by_class: Dict[str, int] = {}
+        self.lat_by_class: Dict[str, list] = {}  # cls -> [timed, total_ms, max_ms]
+
+
+class WorkerHttp:
+    def __init__(self, pool_maxsize: int = 8, connect_timeouts: Optional[Dict[str, float]] = None,
+                 read_timeouts: Optional[Dict[str, float]] = None):
+        self.pool_maxsize = int(pool_maxsize)
+        self.connect_timeouts = dict(CONNECT_TIMEOUTS, **(connect_timeouts or {}))
+        self.read_timeouts = dict(READ_TIMEOUTS, **(read_timeouts or {}))
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, requests.Session] = {}
+        self._stats: Dict[str, _Stats] = {}
+
+    def session(self, worker_name: str) -> requests.Session:
+        with self._lock:
+            s = self._sessions.get(worker_name)
+            if s is None:
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=0)
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                self._sessions[worker_name] = s
+                self._stats[worker_name] = _Stats()
+            return s
+
+    def reset(self, worker_name: str):
+        """worker url 变化或需要丢弃连接时调用。"""
+        with self._lock:
+            s = self._sessions.pop(worker_name, None)
+            self._stats.pop(worker_name, None)
+        if s is not None:
+            s.close()
+
+    def request(self, worker_name: str, base_url: str, method: str, path: str, *,
+                json=None, params=None, timeout: Optional[float] = None, stream: bool = False,
+                headers: Optional[dict] = None) -> requests.Response:
+        """发请求并计数；timeout 为 read 超时，不给则按端点类别取默认。异常原样抛出（由调用方翻译成 {"ok": False, ...}）。"""
+        cls = endpoint_class(path, json)
+        if timeout is None:
+            timeout = self.read_timeouts[cls]
+        s = self.session(worker_name)
+        url = f"{base_url.rstrip('/')}{path}"
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            r = s.request(method, url, json=json, params=params, stream=stream, headers=headers,
+                          timeout=(self.connect_timeouts[cls], timeout))
+            ok = True
+            return r
+        finally:
+            ms = (time.perf_counter() - t0) * 1000.0
+            with self._lock:
+                st = self._stats.get(worker_name)
+                if st is not None:
+                    st.requests += 1
+                    st.by_class[cls] = st.by_class.get(cls, 0) + 1
+                    if not ok:
+                        st.errors += 1
+                    elif not stream:  # 流式请求的耗时只到响应头，不计入延迟
+                        lat = st.lat_by_class.setdefault(cls, [0, 0.0, 0.0])
+                        lat[0] += 1
+                        lat[1] += ms
+                        lat[2] = max(lat[2], ms)
+                        if cls not in UNTIMED_CLASSES:
+                            st.timed += 1
+                            st.last_ms = ms
+                            st.total_ms += ms
+                            st.max_ms = max(st.max_ms, ms)
+
+    def _pool_counts(self, s: requests.Session):
+        conns = reqs = 0
+        adapter = s.get_adapter("http://")
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            conns += getattr(pool, "num_connections", 0)
+            reqs += getattr(pool, "num_requests", 0)
+        return conns, reqs
+
+    def stats(self) -> Dict[str, dict]:
+        out = {}
+        with self._lock:
+            items = [(wn, self._sessions[wn], self._stats[wn]) for wn in self._sessions]
+        for wn, s, st in items:
+            conns, reqs = self._pool_counts(s)
+            out[wn] = {
+                "requests": st.requests,
+                "errors": st.errors,
+                "by_class": dict(st.by_class),
+                "latency_by_class": {c: {"avg_ms": round(t / max(n, 1), 1), "max_ms": round(m, 1)}
+                                     for c, (n, t, m) in st.lat_by_class.items()},
+                "last_ms": round(st.last_ms, 1),
+                "avg_ms": round(st.total_ms / max(st.timed, 1), 1),
+                "max_ms": round(st.max_ms, 1),
+                "connections": conns,
+                "reused": max(reqs - conns, 0),
+            }
+        return out
@@ -0,0 +1,392 @@
+"""
+窗口画面采集：只抓 client 区域里需要的 ROI，写入预分配的 NumPy 缓冲区。
+
+  - Region：以 client 比例 (x, y, w, h) 描述，与 UiMap 一样随窗口尺寸换算成像素
+  - CaptureBackend：可插拔
+      * Win32GdiBackend：GetDC + BitBlt（或 PrintWindow 抓被遮挡窗口）→ GetDIBits 直接写进
+        预分配的 BGRA 缓冲；不激活、不置前（与 ensure_restored_no_focus 同一原则）
+      * RecordedFrameBackend：回放录制好的帧（ndarray / .npy 目录），供 Linux 下跑流程和基准
+  - CaptureSession：每个 target 一个；每个 ROI 一块原始缓冲 + 一块降采样缓冲，尺寸不变就复用；
+    max_fps 限速：限速窗口内再次 grab 直接返回上一帧，不触发真实采集
+  - CaptureManager：target_id → CaptureSession
+
+基准：python worker/capture.py --targets 5 --frames 200
+"""
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class Region:
+    name: str
+    x: float
+    y: float
+    w: float
+    h: float
+
+    def to_pixels(self, cw: int, ch: int) -> Tuple[int, int, int, int]:
+        px = min(max(int(self.x * cw), 0), max(cw - 1, 0))
+        py = min(max(int(self.y * ch), 0), max(ch - 1, 0))
+        pw = max(1, min(int(round(self.w * cw)), cw - px))
+        ph = max(1, min(int(round(self.h * ch)), ch - py))
+        return px, py, pw, ph
+
+
+class CaptureBackend:
+    """grab 把 client 坐标 rect=(x, y, w, h) 的像素写入 out（h×w×3 uint8，BGR），成功返回 True。"""
+
+    def client_size(self, hwnd: int) -> Tuple[int, int]:
+        raise NotImplementedError
+
+    def begin(self, hwnd: int):
+        """一次 grab 多个 ROI 前调用（可在这里整窗抓一次）。"""
+
+    def grab(self, hwnd: int, rect: Tuple[int, int, int, int], out: np.ndarray) -> bool:
+        raise NotImplementedError
+
+    def end(self, hwnd: int):
+        pass
+
+    def release(self, hwnd: int):
+        """窗口不再采集（target 移除 / 窗口尺寸变化）：释放为它缓存的资源。"""
+
+    def close(self):
+        pass
+
+
+# ============== Win32 (GDI) backend ==============
+
+class Win32GdiBackend(CaptureBackend):
+    """
+    mode="bitblt"：直接从窗口 DC 按 ROI BitBlt，最省（窗口被遮挡时可能是黑/旧画面）
+    mode="printwindow"：每次 begin() 用 PrintWindow(PW_CLIENTONLY|PW_RENDERFULLCONTENT)
+                        整窗抓一次到缓存位图，各 ROI 再从中切片；被遮挡也能抓
+    GDI 对象（内存 DC / 位图）按 (hwnd, w, h) 缓存复用；窗口移除或 client 尺寸变化时由
+    CaptureSession / CaptureManager 调 release(hwnd) 释放。_gdi 由多个 target 线程共用：
+    begin / grab / release 持同一把锁（GDI 调用是毫秒级，串行化的代价可忽略），
+    避免一个线程释放另一个线程正在用的表面。
+    """
+    SRCCOPY = 0x00CC0020
+    PW_CLIENTONLY = 0x1
+    PW_RENDERFULLCONTENT = 0x2
+
+    def __init__(self, mode: str = "bitblt"):
+        import ctypes
+        from ctypes import wintypes
+        self._ct = ctypes
+        self.mode = mode
+        self.user32 = ctypes.windll.user32
+        self.gdi32 = ctypes.windll.gdi32
+
+        class BITMAPINFOHEADER(ctypes.Structure):
+            _fields_ = [("biSize", wintypes.DWORD), ("biWidth", wintypes.LONG), ("biHeight", wintypes.LONG),
+                        ("biPlanes", wintypes.WORD), ("biBitCount", wintypes.WORD),
+                        ("biCompression", wintypes.DWORD), ("biSizeImage", wintypes.DWORD),
+                        ("biXPelsPerMeter", wintypes.LONG), ("biYPelsPerMeter", wintypes.LONG),
+                        ("biClrUsed", wintypes.DWORD), ("biClrImportant", wintypes.DWORD)]
+        self._BIH = BITMAPINFOHEADER
+        self._gdi: Dict[tuple, tuple] = {}             # (hwnd, w, h) -> (memdc, hbmp, old, bgra)
+        self._full: Dict[int, Optional[np.ndarray]] = {}
+        self._lock = threading.RLock()
+
+    def client_size(self, hwnd: int) -> Tuple[int, int]:
+        import win32gui
+        l, t, r, b = win32gui.GetClientRect(hwnd)
+        return (r - l, b - t)
+
+    def _surface(self, hwnd: int, w: int, h: int, hdc) -> tuple:
+        key = (hwnd, w, h)
+        s = self._gdi.get(key)
+        if s is None:
+            memdc = self.gdi32.CreateCompatibleDC(hdc)
+            hbmp = self.gdi32.CreateCompatibleBitmap(hdc, w, h)
+            old = self.gdi32.SelectObject(memdc, hbmp)
+            s = self._gdi[key] = (memdc, hbmp, old, np.empty((h, w, 4), dtype=np.uint8))
+        return s
+
+    def _read_bits(self, memdc, hbmp, old, w: int, h: int, bgra: np.ndarray) -> bool:
+        bih = self._BIH(40, w, -h, 1, 32, 0, 0, 0, 0, 0, 0)  # top-down 32bpp
+        self.gdi32.SelectObject(memdc, old)
+        try:
+            n = self.gdi32.GetDIBits(memdc, hbmp, 0, h, bgra.ctypes.data, self._ct.byref(bih), 0)
+        finally:
+            self.gdi32.SelectObject(memdc, hbmp)
+        return n == h
+
+    def begin(self, hwnd: int):
+        if self.mode != "printwindow":
+            return
+        w, h = self.client_size(hwnd)
+        with self._lock:
+            hdc = self.user32.GetDC(hwnd)
+            try:
+                memdc, hbmp, old, bgra = self._surface(hwnd, w, h, hdc)
+                ok = self.user32.PrintWindow(hwnd, memdc, self.PW_CLIENTONLY | self.PW_RENDERFULLCONTENT)
+                self._full[hwnd] = bgra if ok and self._read_bits(memdc, hbmp, old, w, h, bgra) else None
+            finally:
+                self.user32.ReleaseDC(hwnd, hdc)
+
+    def grab(self, hwnd: int, rect: Tuple[int, int, int, int], out: np.ndarray) -> bool:
+        x, y, w, h = rect
+        with self._lock:
+            if self.mode == "printwindow":
+                full = self._full.get(hwnd)
+                if full is None:
+                    return False
+                np.copyto(out, full[y:y + h, x:x + w, :3])
+                return True
+            hdc = self.user32.GetDC(hwnd)
+            try:
+                memdc, hbmp, old, bgra = self._surface(hwnd, w, h, hdc)
+                if not self.gdi32.BitBlt(memdc, 0, 0, w, h, hdc, x, y, self.SRCCOPY):
+                    return False
+            finally:
+                self.user32.ReleaseDC(hwnd, hdc)
+            if not self._read_bits(memdc, hbmp, old, w, h, bgra):
+                return False
+            np.copyto(out, bgra[:, :, :3])
+            return True
+
+    def end(self, hwnd: int):
+        with self._lock:
+            self._full.pop(hwnd, None)
+
+    def release(self, hwnd: int):
+        with self._lock:
+            self._full.pop(hwnd, None)
+            for key in [k for k in self._gdi if k[0] == hwnd]:
+                memdc, hbmp, old, _ = self._gdi.pop(key)
+                self.gdi32.SelectObject(memdc, old)
+                self.gdi32.DeleteObject(hbmp)
+                self.gdi32.DeleteDC(memdc)
+
+    def close(self):
+        with self._lock:
+            for hwnd in {k[0] for k in self._gdi}:
+                self.release(hwnd)
+
+
+# ============== Recorded frames backend ==============
+
+class RecordedFrameBackend(CaptureBackend):
+    """
+    frames: hwnd → 帧列表（h×w×3 uint8 BGR）。每次 begin() 前进一帧（到尾后循环，loop=False 则停在最后一帧）。
+    也可用 from_dir() 从 <dir>/<hwnd>/*.npy 读入。
+    """
+
+    def __init__(self, frames: Dict[int, Sequence[np.ndarray]], loop: bool = True):
+        self.frames = {int(k): list(v) for k, v in frames.items()}
+        self.loop = loop
+        self._pos: Dict[int, int] = {}
+        self._cur: Dict[int, np.ndarray] = {}
+
+    @classmethod
+    def from_dir(cls, root: str, loop: bool = True) -> "RecordedFrameBackend":
+        frames: Dict[int, List[np.ndarray]] = {}
+        for sub in sorted(Path(root).iterdir()):
+            if sub.is_dir():
+                frames[int(sub.name, 0)] = [np.load(p) for p in sorted(sub.glob("*.npy"))]
+        return cls(frames, loop=loop)
+
+    def seek(self, hwnd: int, index: int):
+        self._pos[hwnd] = index
+
+    def client_size(self, hwnd: int) -> Tuple[int, int]:
+        seq = self.frames.get(hwnd)
+        if not seq:
+            return (0, 0)
+        h, w = seq[0].shape[:2]
+        return (w, h)
+
+    def begin(self, hwnd: int):
+        seq = self.frames.get(hwnd)
+        if not seq:
+            return
+        i = self._pos.get(hwnd, 0)
+        self._cur[hwnd] = seq[i % len(seq)] if self.loop else seq[min(i, len(seq) - 1)]
+        self._pos[hwnd] = i + 1
+
+    def grab(self, hwnd: int, rect: Tuple[int, int, int, int], out: np.ndarray) -> bool:
+        fr = self._cur.get(hwnd)
+        if fr is None:
+            return False
+        x, y, w, h = rect
+        np.copyto(out, fr[y:y + h, x:x + w, :3])
+        return True
+
+
+# ============== Session / Manager ==============
+
+def downscale_into(src: np.ndarray, dst: np.ndarray, factor: int, mode: str = "stride"):
+    """
+    整数倍降采样到预分配的 dst。stride：隔点取样（最快）；mean：块平均（抗噪）。
+    ROI 比 factor 还小的方向（dst 该方向为 1）块大小取 ROI 本身的尺寸。
+    """
+    if factor <= 1:
+        np.copyto(dst, src)
+        return
+    h, w = dst.shape[:2]
+    if mode == "mean":
+        fy = min(factor, src.shape[0] // h)
+        fx = min(factor, src.shape[1] // w)
+        blk = src[:h * fy, :w * fx].reshape(h, fy, w, fx, src.shape[2])
+        np.copyto(dst, blk.mean(axis=(1, 3)), casting="unsafe")
+    else:
+        np.copyto(dst, src[:h * factor:factor, :w * factor:factor])
+
+
+class CaptureSession:
+    def __init__(self, backend: CaptureBackend, hwnd: int, regions: Sequence[Region],
+                 downscale: int = 1, downscale_mode: str = "stride", max_fps: float = 2.0):
+        self.backend = backend
+        self.hwnd = int(hwnd)
+        self.regions = list(regions)
+        self.downscale = max(1, int(downscale))
+        self.downscale_mode = downscale_mode
+        self.min_interval = 1.0 / max_fps if max_fps and max_fps > 0 else 0.0
+        self._lock = threading.Lock()
+        self._size: Tuple[int, int] = (0, 0)
+        self._rects: Dict[str, Tuple[int, int, int, int]] = {}
+        self._raw: Dict[str, np.ndarray] = {}
+        self._small: Dict[str, np.ndarray] = {}
+        self._last = 0.0
+        self._last_ok = False
+        self.stats = {"captures": 0, "throttled": 0, "failures": 0, "last_ms": 0.0, "realloc": 0}
+
+    def _layout(self, cw: int, ch: int):
+        if self._size != (0, 0):
+            self.backend.release(self.hwnd)   # 尺寸变了：旧尺寸的缓存表面不会再用
+        self._size = (cw, ch)
+        f = self.downscale
+        for r in self.regions:
+            x, y, w, h = r.to_pixels(cw, ch)
+            self._rects[r.name] = (x, y, w, h)
+            self._raw[r.name] = np.empty((h, w, 3), dtype=np.uint8)
+            self._small[r.name] = np.empty((max(1, h // f), max(1, w // f), 3), dtype=np.uint8)
+        self.stats["realloc"] += 1
+
+    def grab(self, force: bool = False) -> Optional[Dict[str, np.ndarray]]:
+        """
+        返回 {region_name: 降采样后的 ndarray}（指向会被下一次采集覆盖的内部缓冲；需要保留请 copy）。
+        限速窗口内直接返回上一帧。采集失败返回 None。
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._last and (now - self._last) < self.min_interval:
+                self.stats["throttled"] += 1
+                return self._small if self._last_ok else None
+            t0 = time.perf_counter()
+            self._last = now
+            cw, ch = self.backend.client_size(self.hwnd)
+            if cw <= 0 or ch <= 0:
+                self._last_ok = False
+                self.stats["failures"] += 1
+                return None
+            if (cw, ch) != self._size:
+                self._layout(cw, ch)
+            ok = True
+            self.backend.begin(self.hwnd)
+            try:
+                for name, rect in self._rects.items():
+                    if not self.backend.grab(self.hwnd, rect, self._raw[name]):
+                        ok = False
+                        break
+                    downscale_into(self._raw[name], self._small[name], self.downscale, self.downscale_mode)
+            finally:
+                self.backend.end(self.hwnd)
+            self._last_ok = ok
+            self.stats["captures" if ok else "failures"] += 1
+            self.stats["last_ms"] = (time.perf_counter() - t0) * 1000.0
+            return self._small if ok else None
+
+
+class CaptureManager:
+    def __init__(self, backend: CaptureBackend, regions: Sequence[Region] = (),
+                 downscale: int = 4, downscale_mode: str = "stride", max_fps: float = 2.0):
+        self.backend = backend
+        self.regions = list(regions)
+        self.downscale = downscale
+        self.downscale_mode = downscale_mode
+        self.max_fps = max_fps
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, CaptureSession] = {}
+
+    def set_regions(self, regions: Sequence[Region]):
+        with self._lock:
+            self.regions = list(regions)
+            old = list(self._sessions.values())
+            self._sessions.clear()
+        for s in old:
+            self.backend.release(s.hwnd)
+
+    def session(self, target_id: str, hwnd: int) -> CaptureSession:
+        stale = None
+        with self._lock:
+            s = self._sessions.get(target_id)
+            if s is None or s.hwnd != int(hwnd):
+                stale = s
+                s = self._sessions[target_id] = CaptureSession(
+                    self.backend, hwnd, self.regions, self.downscale, self.downscale_mode, self.max_fps)
+        if stale is not None:
+            self.backend.release(stale.hwnd)   # target 换了窗口（重启）
+        return s
+
+    def grab(self, target_id: str, hwnd: int, force: bool = False) -> Optional[Dict[str, np.ndarray]]:
+        return self.session(target_id, hwnd).grab(force=force)
+
+    def drop(self, target_id: str):
+        with self._lock:
+            s = self._sessions.pop(target_id, None)
+        if s is not None:
+            self.backend.release(s.hwnd)
+
+    def prune(self, live_targets) -> int:
+        """drop 不在 live_targets 里的 target，返回 drop 的个数。"""
+        with self._lock:
+            gone = [tid for tid in self._sessions if tid not in live_targets]
+        for tid in gone:
+            self.drop(tid)
+        return len(gone)
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            return {tid: dict(s.stats, hwnd=s.hwnd) for tid, s in self._sessions.items()}
+
+
+# ============== Benchmark (recorded frames) ==============
+
+def _bench(n_targets: int, n_frames: int, width: int, height: int, downscale: int, max_fps: float):
+    rnd = np.random.default_rng(0)
+    frames = {0x1000 + i: [rnd.integers(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(4)]
+              for i in range(n_targets)}
+    regions = [Region("top_bar", 0.0, 0.0, 1.0, 0.08), Region("center", 0.35, 0.35, 0.3, 0.3),
+               Region("bottom", 0.2, 0.85, 0.6, 0.12)]
+    mgr = CaptureManager(RecordedFrameBackend(frames), regions, downscale=downscale, max_fps=0)
+    t0 = time.perf_counter()
+    for _ in range(n_frames):
+        for i in range(n_targets):
+            mgr.grab(str(i), 0x1000 + i)
+    dt = time.perf_counter() - t0
+    per = dt / (n_frames * n_targets) * 1000.0
+    print(f"targets={n_targets} frames={n_frames} client={width}x{height} downscale={downscale}")
+    print(f"  grab (3 ROI): {per:.3f} ms/target-frame")
+    if max_fps > 0:
+        print(f"  at max_fps={max_fps}: ~{per * max_fps * n_targets / 10.0:.2f}% of one core for {n_targets} targets")
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Capture pipeline benchmark on recorded frames")
+    ap.add_argument("--targets", type=int, default=5)
+    ap.add_argument("--frames", type=int, default=200)
+    ap.add_argument("--width", type=int, default=1280)
+    ap.add_argument("--height", type=int, default=800)
+    ap.add_argument("--downscale", type=int, default=4)
+    ap.add_argument("--max-fps", type=float, default=2.0)
+    a = ap.parse_args()
+    _bench(a.targets, a.frames, a.width, a.height, a.downscale, a.max_fps)
@@ -0,0 +1,172 @@
+"""
+前台窗口变化 → D2R 静音跟随。
+
+  - ForegroundSource：产生“前台窗口所属 pid”事件的来源（接口）
+      * WinEventForegroundSource：SetWinEventHook(EVENT_SYSTEM_FOREGROUND)，空闲时线程阻塞在
+        GetMessage 上，不占 CPU；前台一变化就回调
+      * PollingForegroundSource：旧版 200ms 轮询，hook 装不上时的兜底
+      * SyntheticForegroundSource：按列表回放事件，用于单测
+  - AudioFollower：纯状态机。只在“应发声的 D2R pid”真正变化时调用 apply(active_pid)；
+    在两个非 D2R 窗口间切换、或同一窗口重复通知，都不会触发音频会话枚举。
+"""
+import threading
+import time
+from typing import Callable, Iterable, List, Optional
+
+_UNSET = object()
+
+
+class AudioFollower:
+    def __init__(self, is_d2r: Callable[[int], bool], apply: Callable[[Optional[int]], None],
+                 enabled: Callable[[], bool] = lambda: True):
+        self.is_d2r = is_d2r
+        self.apply = apply
+        self.enabled = enabled
+        self._last_pid = _UNSET
+        self._active = _UNSET         # 上次 apply 的 active pid（None = 全部静音）
+        self.stats = {"events": 0, "applies": 0, "skipped": 0}
+
+    def on_foreground(self, pid: Optional[int]) -> bool:
+        """处理一次前台变化；返回是否调用了 apply。"""
+        self.stats["events"] += 1
+        if not self.enabled():
+            # 关闭期间不记状态：重新打开后第一条事件一定会生效
+            self._last_pid = self._active = _UNSET
+            return False
+        if pid == self._last_pid:
+            self.stats["skipped"] += 1
+            return False
+        self._last_pid = pid
+        active = pid if (pid and self.is_d2r(pid)) else None
+        if active == self._active:
+            self.stats["skipped"] += 1
+            return False
+        self._active = active
+        self.apply(active)
+        self.stats["applies"] += 1
+        return True
+
+    def reset(self):
+        self._last_pid = self._active = _UNSET
+
+
+class ForegroundSource:
+    """run(callback) 阻塞运行，每次前台变化调用 callback(pid or None)；stop() 让 run 返回。"""
+
+    name = "base"
+
+    def run(self, callback: Callable[[Optional[int]], None]):
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+
+class PollingForegroundSource(ForegroundSource):
+    name = "polling"
+
+    def __init__(self, get_pid: Callable[[], Optional[int]], interval: float = 0.2):
+        self.get_pid = get_pid
+        self.interval = float(interval)
+        self._stop = threading.Event()
+
+    def run(self, callback):
+        last = _UNSET
+        while not self._stop.is_set():
+            pid = self.get_pid()
+            if pid != last:
+                last = pid
+                callback(pid)
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
+
+
+class WinEventForegroundSource(ForegroundSource):
+    """必须在 run() 所在线程装 hook 并泵消息（WINEVENT_OUTOFCONTEXT 回调投递到该线程）。"""
+
+    name = "winevent"
+    EVENT_SYSTEM_FOREGROUND = 0x0003
+    EVENT_SYSTEM_MINIMIZEEND = 0x0017
+    WINEVENT_OUTOFCONTEXT = 0x0000
+    WM_QUIT = 0x0012
+
+    def __init__(self, pid_of_hwnd: Callable[[int], Optional[int]],
+                 get_pid: Optional[Callable[[], Optional[int]]] = None):
+        import ctypes
+        from ctypes import wintypes
+        self._ct = ctypes
+        self._wt = wintypes
+        self.user32 = ctypes.windll.user32
+        self.kernel32 = ctypes.windll.kernel32
+        self.pid_of_hwnd = pid_of_hwnd
+        self.get_pid = get_pid
+        self._thread_id = None
+        self._proc = None  # 保持回调对象存活
+
+    def run(self, callback):
+        ct, wt = self._ct, self._wt
+        WinEventProc = ct.WINFUNCTYPE(None, wt.HANDLE, wt.DWORD, wt.HWND, wt.LONG, wt.LONG, wt.DWORD, wt.DWORD)
+
+        def _on_event(_hook, _event, hwnd, id_object, _id_child, _thread, _time):
+            if id_object != 0:  # OBJID_WINDOW
+                return
+            try:
+                callback(self.pid_of_hwnd(hwnd) if hwnd else None)
+            except Exception:
+                pass
+
+        self._proc = WinEventProc(_on_event)
+        self.user32.SetWinEventHook.restype = wt.HANDLE
+        hooks = [self.user32.SetWinEventHook(ev, ev, 0, self._proc, 0, 0, self.WINEVENT_OUTOFCONTEXT)
+                 for ev in (self.EVENT_SYSTEM_FOREGROUND, self.EVENT_SYSTEM_MINIMIZEEND)]
+        if not hooks[0]:
+            raise OSError("SetWinEventHook(EVENT_SYSTEM_FOREGROUND) failed")
+        self._thread_id = self.kernel32.GetCurrentThreadId()
+        if self.get_pid:
+            callback(self.get_pid())  # 初始状态
+        msg = wt.MSG()
+        try:
+            while self.user32.GetMessageW(ct.byref(msg), 0, 0, 0) > 0:
+                self.user32.TranslateMessage(ct.byref(msg))
+                self.user32.DispatchMessageW(ct.byref(msg))
+        finally:
+            for h in hooks:
+                if h:
+                    self.user32.UnhookWinEvent(h)
+
+    def stop(self):
+        if self._thread_id:
+            self.user32.PostThreadMessageW(self._thread_id, self.WM_QUIT, 0, 0)
+
+
+class SyntheticForegroundSource(ForegroundSource):
+    """按顺序回放 pid 事件（可选每条间隔 delay 秒）。"""
+
+    name = "synthetic"
+
+    def __init__(self, events: Iterable[Optional[int]], delay: float = 0.0):
+        self.events: List[Optional[int]] = list(events)
+        self.delay = float(delay)
+
+    def run(self, callback):
+        for pid in self.events:
+            callback(pid)
+            if self.delay:
+                time.sleep(self.delay)
+
+
+def run_with_fallback(sources: List[Callable[[], ForegroundSource]],
+                      callback: Callable[[Optional[int]], None],
+                      on_switch: Optional[Callable[[str, Exception], None]] = None):
+    """依次尝试各来源；前一个启动失败/异常退出就换下一个（例如 winevent → polling）。"""
+    for make in sources:
+        src = None
+        try:
+            src = make()
+            src.run(callback)
+            return
+        except Exception as e:
+            if on_switch:
+                on_switch(getattr(src, "name", "?"), e)
@@ -0,0 +1,236 @@
+"""
+worker 指标：资源占用（后台采样）+ 延迟直方图。输出 Prometheus 文本或 JSON。
+
+  - ResourceCollector：单个后台线程每 interval 秒采一次
+      * 每个 target 的 D2R 进程：cpu%（psutil.Process 对象按 (pid, create_time) 缓存，
+        cpu_percent 才是两次采样间的增量）、RSS、磁盘读写字节、线程数
+      * 主机：CPU%、内存
+    请求线程只读最近一次快照，不调用 psutil
+  - Histogram / MetricsRegistry：固定桶的延迟直方图（FastAPI 路由、输入原语），
+    observe() 只是一次二分 + 计数，开销可忽略；timed(name) 装饰器用于输入原语
+"""
+import bisect
+import functools
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import psutil
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)   # 最后一格为 +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, sec: float):
+        i = bisect.bisect_left(self.buckets, sec)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += sec
+            self.count += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+    def to_dict(self) -> dict:
+        counts, total, n = self.snapshot()
+        cum, acc = {}, 0
+        for le, c in zip(list(self.buckets) + ["+Inf"], counts):
+            acc += c
+            cum[str(le)] = acc
+        return {"count": n, "sum_s": round(total, 6), "avg_ms": round(total / n * 1000.0, 3) if n else None,
+                "buckets": cum}
+
+
+class MetricsRegistry:
+    """histograms[(metric, label_name, label_value)]。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[Tuple[str, str, str], Histogram] = {}
+
+    def histogram(self, metric: str, label: str, value: str) -> Histogram:
+        key = (metric, label, value)
+        h = self.histograms.get(key)
+        if h is None:
+            with self._lock:
+                h = self.histograms.setdefault(key, Histogram())
+        return h
+
+    def observe(self, metric: str, label: str, value: str, sec: float):
+        self.histogram(metric, label, value).observe(sec)
+
+    def timed(self, primitive: str, metric: str = "worker_input_duration_seconds"):
+        h = self.histogram(metric, "primitive", primitive)
+
+        def deco(fn: Callable):
+            @functools.wraps(fn)
+            def wrapper(*a, **kw):
+                t0 = time.perf_counter()
+                try:
+                    return fn(*a, **kw)
+                finally:
+                    h.observe(time.perf_counter() - t0)
+            return wrapper
+        return deco
+
+
+class ResourceCollector:
+    def __init__(self, targets: Callable[[], Dict[str, int]], interval: float = 2.0):
+        """targets() -> {target_id: pid}"""
+        self.targets = targets
+        self.interval = float(interval)
+        self._procs: Dict[int, Tuple[float, psutil.Process]] = {}
+        self._snapshot: dict = {"ts": 0.0, "host": {}, "targets": {}}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.stats = {"samples": 0, "last_sample_ms": 0.0}
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        psutil.cpu_percent(None)  # 建立主机 CPU 基线
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="metrics-collector")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def snapshot(self) -> dict:
+        return self._snapshot
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.sample()
+            except Exception:
+                pass
+            self._stop.wait(self.interval)
+
+    def _proc(self, pid: int) -> Optional[psutil.Process]:
+        cached = self._procs.get(pid)
+        try:
+            if cached is None:
+                p = psutil.Process(pid)
+                p.cpu_percent(None)  # 首次调用只建立基线
+                self._procs[pid] = (p.create_time(), p)
+                return p
+            ct, p = cached
+            if p.create_time() != ct:  # pid 被复用
+                self._procs.pop(pid, None)
+                return self._proc(pid)
+            return p
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            self._procs.pop(pid, None)
+            return None
+
+    def sample(self) -> dict:
+        t0 = time.perf_counter()
+        ncpu = psutil.cpu_count() or 1
+        targets: Dict[str, dict] = {}
+        live = set()
+        for tid, pid in dict(self.targets() or {}).items():
+            if not pid:
+                continue
+            p = self._proc(int(pid))
+            if p is None:
+                continue
+            live.add(int(pid))
+            try:
+                with p.oneshot():
+                    mem = p.memory_info()
+                    try:
+                        io = p.io_counters()
+                        rb, wb = io.read_bytes, io.write_bytes
+                    except (psutil.AccessDenied, AttributeError):
+                        rb = wb = None
+                    targets[str(tid)] = {
+                        "pid": int(pid),
+                        "cpu_percent": round(p.cpu_percent(None) / ncpu, 2),  # 归一化到整机 0..100
+                        "rss_bytes": mem.rss,
+                        "io_read_bytes": rb,
+                        "io_write_bytes": wb,
+                        "threads": p.num_threads(),
+                    }
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                self._procs.pop(int(pid), None)
+        for pid in [k for k in self._procs if k not in live]:
+            self._procs.pop(pid, None)
+        vm = psutil.virtual_memory()
+        host = {"cpu_percent": psutil.cpu_percent(None), "cpu_count": ncpu,
+                "mem_total_bytes": vm.total, "mem_used_bytes": vm.total - vm.available, "mem_percent": vm.percent}
+        self._snapshot = {"ts": time.time(), "host": host, "targets": targets}
+        self.stats["samples"] += 1
+        self.stats["last_sample_ms"] = round((time.perf_counter() - t0) * 1000.0, 3)
+        return self._snapshot
+
+
+# ============== Rendering ==============
+
+_TARGET_GAUGES = [
+    ("cpu_percent", "worker_target_cpu_percent", "D2R process CPU percent (normalized to all cores)"),
+    ("rss_bytes", "worker_target_rss_bytes", "D2R process resident set size"),
+    ("io_read_bytes", "worker_target_io_read_bytes_total", "D2R process bytes read"),
+    ("io_write_bytes", "worker_target_io_write_bytes_total", "D2R process bytes written"),
+    ("threads", "worker_target_threads", "D2R process thread count"),
+]
+_HOST_GAUGES = [
+    ("cpu_percent", "worker_host_cpu_percent", "Host CPU percent"),
+    ("mem_used_bytes", "worker_host_memory_used_bytes", "Host memory in use"),
+    ("mem_total_bytes", "worker_host_memory_total_bytes", "Host memory total"),
+]
+
+
+def _esc(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus(snapshot: dict, registry: MetricsRegistry, worker: str) -> str:
+    out: List[str] = []
+    w = f'worker="{_esc(worker)}"'
+    for key, name, help_ in _HOST_GAUGES:
+        v = (snapshot.get("host") or {}).get(key)
+        if v is not None:
+            out += [f"# HELP {name} {help_}", f"# TYPE {name} gauge", f"{name}{{{w}}} {v}"]
+    tgts = snapshot.get("targets") or {}
+    for key, name, help_ in _TARGET_GAUGES:
+        kind = "counter" if name.endswith("_total") else "gauge"
+        out += [f"# HELP {name} {help_}", f"# TYPE {name} {kind}"]
+        for tid, row in sorted(tgts.items()):
+            v = row.get(key)
+            if v is not None:
+                out.append(f'{name}{{{w},target="{_esc(tid)}",pid="{row["pid"]}"}} {v}')
+
+    by_metric: Dict[str, List[Tuple[str, str, Histogram]]] = {}
+    for (metric, label, value), h in sorted(registry.histograms.items()):
+        by_metric.setdefault(metric, []).append((label, value, h))
+    for metric, rows in by_metric.items():
+        out += [f"# HELP {metric} Latency histogram", f"# TYPE {metric} histogram"]
+        for label, value, h in rows:
+            counts, total, n = h.snapshot()
+            lbl = f'{w},{label}="{_esc(value)}"'
+            acc = 0
+            for le, c in zip(list(h.buckets) + ["+Inf"], counts):
+                acc += c
+                out.append(f'{metric}_bucket{{{lbl},le="{le}"}} {acc}')
+            out.append(f"{metric}_sum{{{lbl}}} {total:.6f}")
+            out.append(f"{metric}_count{{{lbl}}} {n}")
+    return "\n".join(out) + "\n"
+
+
+def render_json(snapshot: dict, registry: MetricsRegistry, worker: str) -> dict:
+    hist: Dict[str, Dict[str, dict]] = {}
+    for (metric, label, value), h in sorted(registry.histograms.items()):
+        hist.setdefault(metric, {})[value] = h.to_dict()
+    return {"worker": worker, "sampled_at": snapshot.get("ts"), "host": snapshot.get("host") or {},
+            "targets": snapshot.get("targets") or {}, "latency": hist}
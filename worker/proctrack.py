@@ -0,0 +1,176 @@
+"""
+D2R.exe 进程表（增量维护，替代每次 psutil.process_iter 全量扫描）。
+
+每个 tick 只取 psutil.pids()（一次系统调用）与上次的 pid 集合做差：
+  - 新出现的 pid：查一次 name/create_time，是 D2R 就入表，不是就记入“已知非 D2R”；
+    查询失败（AccessDenied，进程还在启动等）不记入，之后的 tick 重试，最多 max_retries 次
+    （受保护的系统进程会一直失败，不能每个 tick 都查）
+  - 消失的 pid：从两张表里删掉
+  - 表内 D2R 每个 tick 复查 create_time（只有几项）：不同说明 pid 被复用，按删除 + 新增处理。
+    非 D2R 的 pid 若在一个 interval 内退出并被新 D2R 复用，则检测不到（要全量复查才能发现）
+查询（pids / contains / candidates_since）只读内存表，O(1)/O(n_d2r)。
+
+订阅者 subscribe(cb) 会在每次有增删时收到 cb(added, removed)，
+added/removed 为 [(pid, create_time), ...]。
+"""
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import psutil
+
+ProcKey = Tuple[int, float]
+
+
+class D2RProcessTracker:
+    def __init__(self, exe_name: str = "d2r.exe", interval: float = 1.0,
+                 pid_source: Callable[[], Iterable[int]] = psutil.pids,
+                 proc_info: Optional[Callable[[int], Optional[Tuple[str, float]]]] = None,
+                 max_retries: int = 10):
+        self.exe_name = exe_name.lower()
+        self.interval = float(interval)
+        self._pid_source = pid_source
+        self._proc_info = proc_info or self._psutil_info
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()        # 同一时刻只有一个 refresh
+        self._seen: Set[int] = set()                 # 上一轮的全部 pid
+        self._d2r: Dict[int, float] = {}             # pid -> create_time
+        self._retries: Dict[int, int] = {}           # 查询失败的 pid -> 已失败次数
+        self.max_retries = int(max_retries)
+        self._subs: List[Callable[[List[ProcKey], List[ProcKey]], None]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.stats = {"ticks": 0, "probes": 0, "last_tick_ms": 0.0}
+
+    @staticmethod
+    def _psutil_info(pid: int) -> Optional[Tuple[str, float]]:
+        try:
+            p = psutil.Process(pid)
+            return (p.name() or "", p.create_time())
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            return None
+
+    # ---- 生命周期 ----
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self.refresh()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="d2r-proctrack")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def subscribe(self, cb: Callable[[List[ProcKey], List[ProcKey]], None]):
+        self._subs.append(cb)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception:
+                pass
+
+    # ---- 增量刷新 ----
+
+    def refresh(self) -> Tuple[List[ProcKey], List[ProcKey]]:
+        """
+        做一次 pid 集合差分；可在请求线程里同步调用（如刚 spawn 完进程）。
+        _refresh_lock 让快照 → 差分 → 写回整体串行（旧快照不会覆盖新快照）；
+        psutil 查询在 _lock 之外做，查询方不会被挡住。
+        """
+        with self._refresh_lock:
+            return self._refresh_locked()
+
+    def _refresh_locked(self) -> Tuple[List[ProcKey], List[ProcKey]]:
+        t0 = time.perf_counter()
+        now = set(self._pid_source())
+        with self._lock:
+            seen = set(self._seen)
+            tracked = dict(self._d2r)
+            retries = dict(self._retries)
+
+        # 1) 查询（不持 _lock）：表内 D2R 复查 create_time，新 pid 查 name/create_time
+        probes = 0
+        fresh = now - seen
+        reused: Dict[int, float] = {}
+        for pid, ct in tracked.items():
+            if pid not in now:
+                continue
+            probes += 1
+            info = self._proc_info(pid)
+            if info is None or info[1] != ct:   # 已退出或 pid 被复用
+                reused[pid] = ct
+                fresh.add(pid)
+        infos = {}
+        for pid in fresh:
+            probes += 1
+            infos[pid] = self._proc_info(pid)
+
+        # 2) 写回
+        added: List[ProcKey] = []
+        removed: List[ProcKey] = []
+        with self._lock:
+            for pid in seen - now:
+                ct = self._d2r.pop(pid, None)
+                if ct is not None:
+                    removed.append((pid, ct))
+            for pid, ct in reused.items():
+                self._d2r.pop(pid, None)
+                removed.append((pid, ct))
+            failed: Set[int] = set()
+            for pid, info in infos.items():
+                if info is None:
+                    n = retries.get(pid, 0) + 1
+                    if n < self.max_retries:
+                        self._retries[pid] = n
+                        failed.add(pid)
+                    else:
+                        self._retries.pop(pid, None)   # 放弃：当作非 D2R
+                    continue
+                self._retries.pop(pid, None)
+                name, ct = info
+                if name.lower() == self.exe_name:
+                    self._d2r[pid] = ct
+                    added.append((pid, ct))
+            for pid in [p for p in self._retries if p not in now]:
+                del self._retries[pid]
+            self._seen = now - failed
+            self.stats["probes"] += probes
+            self.stats["ticks"] += 1
+            self.stats["last_tick_ms"] = (time.perf_counter() - t0) * 1000.0
+        if added or removed:
+            for cb in list(self._subs):
+                try:
+                    cb(added, removed)
+                except Exception:
+                    pass
+        return added, removed
+
+    # ---- 查询 ----
+
+    def pids(self) -> List[int]:
+        """全部 D2R pid，按 create_time 升序（与旧 discover_d2r_pids 一致）。"""
+        with self._lock:
+            items = sorted(self._d2r.items(), key=lambda kv: kv[1])
+        return [pid for pid, _ in items]
+
+    def contains(self, pid: Optional[int]) -> bool:
+        return bool(pid) and pid in self._d2r
+
+    def knows(self, pid: Optional[int]) -> bool:
+        """pid 是否在上一轮快照里（任意进程）。"""
+        return bool(pid) and pid in self._seen
+
+    def create_time(self, pid: int) -> Optional[float]:
+        return self._d2r.get(pid)
+
+    def candidates_since(self, start_time: float, exclude: Iterable[int] = ()) -> List[ProcKey]:
+        """create_time >= start_time 且不在 exclude 中的 D2R，按 create_time 升序。"""
+        ex = set(exclude)
+        with self._lock:
+            cand = [(ct, pid) for pid, ct in self._d2r.items() if ct >= start_time and pid not in ex]
+        cand.sort()
+        return [(pid, ct) for ct, pid in cand]
@@ -0,0 +1,174 @@
+"""
+post-launch 就绪判定：用“条件满足”代替固定 sleep。
+
+每一步 = 若干条件 + 上限超时（即 config 里原来的 wait_for_* 秒数）+ 最短停留：
+  - responsive：窗口能在超时内处理消息（SendMessageTimeout / IsHungAppWindow）
+  - cpu_settled：进程 CPU% 最近 N 个采样的极差 < spread，且都 < ceiling
+  - region:<name>：client 区域与存储的签名匹配（需要画面来源；不支持时该条件视为跳过）
+全部满足即进入下一步；到上限仍未满足也照旧继续（与旧版 sleep 行为一致），
+每一步实际耗时与结果记录在 StepTiming 里。
+列了 region 条件的步骤，只有至少一个 region 签名可用时才会提前结束：否则 responsive + cpu_settled
+在载入间隙就可能满足，导致标题画面出来前就按键。此时退回到按上限等待。
+
+探针通过 ReadinessProbe 接口注入；ScriptedProbe + FakeClock 可在 Linux 下按脚本回放。
+"""
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+class ReadinessProbe:
+    """返回 None 表示“该探针不可用”，对应条件会被跳过而不是卡住。"""
+
+    def window_responsive(self, hwnd: int) -> Optional[bool]:
+        return None
+
+    def cpu_percent(self, pid: int) -> Optional[float]:
+        return None
+
+    def region_matches(self, hwnd: int, name: str) -> Optional[bool]:
+        return None
+
+
+class Clock:
+    def now(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, sec: float):
+        time.sleep(sec)
+
+
+@dataclass
+class StepSpec:
+    name: str
+    timeout: float                      # 上限（config 的 wait_for_*）
+    min_sec: float = 0.0                # 最短停留，防止加载开始前就误判“已就绪”
+    conditions: Sequence[str] = ()      # "responsive" | "cpu_settled" | "region:<name>"
+
+
+@dataclass
+class StepTiming:
+    name: str
+    elapsed: float
+    ready: bool                         # False = 到上限超时
+    timeout: float
+    met: Dict[str, Optional[bool]] = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "elapsed_s": round(self.elapsed, 3), "ready": self.ready,
+                "timeout_s": self.timeout, "met": self.met}
+
+
+class CpuSettle:
+    """最近 window 个 CPU 采样：max-min < spread 且 max < ceiling 视为稳定。"""
+
+    FIELDS = ("window", "spread", "ceiling")
+
+    def __init__(self, window: int = 4, spread: float = 10.0, ceiling: float = 60.0):
+        self.window = max(2, int(window))
+        self.spread = float(spread)
+        self.ceiling = float(ceiling)
+        self.samples: List[float] = []
+
+    @classmethod
+    def from_config(cls, cfg: Optional[dict]) -> Tuple["CpuSettle", List[str]]:
+        """按 config dict 构造；不认识的键忽略，和实例一起返回（由调用方记日志）。"""
+        cfg = cfg if isinstance(cfg, dict) else {}
+        return cls(**{k: v for k, v in cfg.items() if k in cls.FIELDS}), sorted(k for k in cfg if k not in cls.FIELDS)
+
+    def reset(self):
+        self.samples.clear()
+
+    def feed(self, v: Optional[float]) -> Optional[bool]:
+        if v is None:
+            return None
+        self.samples.append(float(v))
+        if len(self.samples) > self.window:
+            del self.samples[0]
+        if len(self.samples) < self.window:
+            return False
+        return (max(self.samples) - min(self.samples)) < self.spread and max(self.samples) < self.ceiling
+
+
+class ReadinessWaiter:
+    def __init__(self, probe: ReadinessProbe, clock: Optional[Clock] = None, poll: float = 0.5,
+                 cpu: Optional[CpuSettle] = None,
+                 sleep_fn: Optional[Callable[[float], None]] = None):
+        self.probe = probe
+        self.clock = clock or Clock()
+        self.poll = float(poll)
+        self.cpu = cpu or CpuSettle()
+        # sleep_fn 允许 worker 传入可取消的 sleep（job 取消时抛异常）
+        self._sleep = sleep_fn or self.clock.sleep
+
+    def _check(self, cond: str, hwnd: int, pid: int) -> Optional[bool]:
+        if cond == "responsive":
+            return self.probe.window_responsive(hwnd) if hwnd else False
+        if cond == "cpu_settled":
+            return self.cpu.feed(self.probe.cpu_percent(pid)) if pid else None
+        if cond.startswith("region:"):
+            return self.probe.region_matches(hwnd, cond.split(":", 1)[1]) if hwnd else None
+        raise ValueError(f"unknown readiness condition: {cond}")
+
+    def wait(self, step: StepSpec, hwnd: int, pid: int) -> StepTiming:
+        t0 = self.clock.now()
+        self.cpu.reset()
+        met: Dict[str, Optional[bool]] = {c: False for c in step.conditions}
+        regions = [c for c in step.conditions if c.startswith("region:")]
+        while True:
+            for c in step.conditions:
+                met[c] = self._check(c, hwnd, pid)
+            elapsed = self.clock.now() - t0
+            # None（探针不可用）不阻塞；全部为 None 时等同旧版：只靠 min_sec / 超时
+            usable = [v for v in met.values() if v is not None]
+            region_known = not regions or any(met[c] is not None for c in regions)
+            ready = region_known and bool(usable) and all(usable) and elapsed >= step.min_sec
+            if ready or elapsed >= step.timeout:
+                return StepTiming(step.name, elapsed, ready, step.timeout, dict(met))
+            if (not usable or not region_known) and elapsed >= step.min_sec:
+                # 没有可用探针，或画面签名不可用：退化为固定等待到上限
+                self._sleep(max(0.0, step.timeout - elapsed))
+                continue
+            self._sleep(min(self.poll, max(0.0, step.timeout - elapsed)))
+
+
+# ============== Scripted fakes (Linux tests / replay) ==============
+
+class FakeClock(Clock):
+    def __init__(self, t0: float = 0.0):
+        self.t = float(t0)
+
+    def now(self) -> float:
+        return self.t
+
+    def sleep(self, sec: float):
+        self.t += max(0.0, float(sec))
+
+
+class ScriptedProbe(ReadinessProbe):
+    """
+    按时间线回放：timeline 为 [(t, {"responsive": bool, "cpu": float, "region:title": bool}), ...]，
+    查询时取 t <= clock.now() 的最后一帧。
+    """
+
+    def __init__(self, clock: Clock, timeline: Sequence[Tuple[float, dict]]):
+        self.clock = clock
+        self.timeline = sorted(timeline, key=lambda x: x[0])
+
+    def _frame(self) -> dict:
+        cur: dict = {}
+        now = self.clock.now()
+        for t, fr in self.timeline:
+            if t > now:
+                break
+            cur = fr
+        return cur
+
+    def window_responsive(self, hwnd: int) -> Optional[bool]:
+        return self._frame().get("responsive")
+
+    def cpu_percent(self, pid: int) -> Optional[float]:
+        return self._frame().get("cpu")
+
+    def region_matches(self, hwnd: int, name: str) -> Optional[bool]:
+        return self._frame().get(f"region:{name}")
@@ -0,0 +1,297 @@
+"""
+在一台机器（Linux 即可）上拉起 N 个模拟 worker（D2R_WORKER_SIM，见 simwin32.py），并可直接压测。
+
+  python worker/simcluster.py --workers 20 --targets 100 --out sim-cluster
+      生成 sim-cluster/config.json：Sim-01..Sim-N 监听 127.0.0.1:<base-port + i>，target 轮流分配，
+      post_launch 的等待按模拟延迟缩短；再按 orchestrator 拼路径的方式（d2r_root + "\\" + lnk）
+      建好占位 .lnk。然后启动全部 worker，等 /health 全部就绪。Ctrl+C 结束时关闭所有 worker。
+      orchestrator UI 可以用 D2R_ORCH_CONFIG=sim-cluster/config.json 指向这套集群。
+
+  加上 --drive launch,join_game 表示不开 UI、直接压测（两种驱动）：
+      默认：以 D2R_ORCH_HEADLESS 启动 orchestrator/orchestrator_ui.py，
+          走真实的 orchestrate()：gap 学习、全局令牌桶、熔断、trace 导出都在压测范围内；
+          trace 写到 <out>/traces，加 --report 时另存每个 op 的摘要 JSON。
+      --direct：只压 worker 的 HTTP 契约：每个 worker 一个 /batch（serial，间隔取 join_delay_sec），
+          不经过 orchestrator；输出每个 op 的 makespan、单项 p50 / p95 / max 和失败数。
+
+除生成 UI 签名（numpy）外只依赖标准库，worker 进程用当前解释器启动（需要 fastapi / uvicorn / numpy；经 orchestrator 的 --drive 另需 requests / tkinter）。
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, Optional
+
+HERE = Path(__file__).resolve().parent
+
+
+def build_ui_signatures(path: Path) -> Path:
+    """
+    按 simwin32 每个状态的纯色画面生成 UI 状态签名：模拟 worker 的 ui_state、readiness 的 region 条件、
+    join 的进房确认因此都有真实信号（orchestrator 的 gap 学习依赖这些确认）。
+    """
+    sys.path.insert(0, str(HERE))
+    import numpy as np
+    from simwin32 import _STATE_COLORS
+    from uistate import UiStateClassifier
+
+    clf = UiStateClassifier()
+    for state, color in _STATE_COLORS.items():
+        crops = {r.name: np.full((16, 16, 3), color, dtype=np.uint8) for r in clf.regions}
+        clf.add_sample(state, clf.featurize(crops))
+    clf.build_index()
+    clf.save(str(path))
+    return path
+
+
+def build_config(out: Path, workers: int, targets: int, base_port: int, join_delay: float,
+                 rate_interval: float = 3.0) -> dict:
+    lnk_root = out / "lnk"
+    lnk_root.mkdir(parents=True, exist_ok=True)
+    names = [f"Sim-{i + 1:02d}" for i in range(workers)]
+    sig_path = build_ui_signatures(out / "states.npz")
+    cfg = {"workers": {}, "targets": {}, "assignment": {},
+           "prefs": {"trace": {"enabled": True, "dir": str(out / "traces")},
+                     "archive": {"dir": str(out / "logs")},
+                     "join_rate": {"interval_sec": rate_interval},
+                     "target_order": [str(n) for n in range(1, targets + 1)]}}
+    for i, wn in enumerate(names):
+        cfg["workers"][wn] = {
+            "url": f"http://127.0.0.1:{base_port + i}",
+            "enabled": True,
+            "d2r_root": str(lnk_root),
+            "join_delay_sec": join_delay,
+            "uimap_path": str(HERE / "uimaps" / "default.json"),
+            "post_launch": {
+                "sequence": "default",
+                # states.npz 让 readiness 按画面提前放行，这里只是每步上限
+                "wait_for_start_up": 10,
+                "wait_for_title_load_up": 30,
+                "wait_for_connect_to_server": 15,
+                "readiness": {"min_sec": {"start_up": 0.5, "title_load_up": 1.0, "connect_to_server": 0.5}},
+            },
+            "after_join": {"wait_ready_seconds": 3},
+            "ui_state": {"signatures": str(sig_path)},
+            "metrics": {"interval_sec": 2},
+        }
+    for n in range(1, targets + 1):
+        tid = str(n)
+        lnk = f"{n}-sim{n:03d}"
+        cfg["targets"][tid] = {"name": f"sim-{n:03d}", "lnk": lnk}
+        cfg["assignment"][tid] = names[(n - 1) % workers]
+        # 与 orchestrator 的拼法一致：d2r_root + "\\" + lnk + ".lnk"（非 Windows 上反斜杠就是文件名的一部分）
+        Path(str(lnk_root) + "\\" + lnk + ".lnk").touch()
+    return cfg
+
+
+class Cluster:
+    def __init__(self, cfg_path: Path, cfg: dict, sim_spec: str, log_dir: Path):
+        self.cfg_path = cfg_path
+        self.cfg = cfg
+        self.sim_spec = sim_spec
+        self.log_dir = log_dir
+        self.procs: Dict[str, subprocess.Popen] = {}
+
+    def start(self):
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        env = dict(os.environ, D2R_WORKER_SIM=self.sim_spec, PYTHONUNBUFFERED="1")
+        for wn, w in self.cfg["workers"].items():
+            port = w["url"].rsplit(":", 1)[1]
+            log = open(self.log_dir / f"{wn}.log", "w", encoding="utf-8")
+            self.procs[wn] = subprocess.Popen(
+                [sys.executable, str(HERE / "worker.py"), "--config", str(self.cfg_path), "--name", wn, "--port", port],
+                cwd=str(HERE), env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    def wait_healthy(self, timeout: float = 60.0) -> List[str]:
+        """返回超时后仍未就绪的 worker。"""
+        pending = set(self.procs)
+        deadline = time.monotonic() + timeout
+        while pending and time.monotonic() < deadline:
+            for wn in list(pending):
+                if self.procs[wn].poll() is not None:
+                    continue
+                if (_get(self.cfg["workers"][wn]["url"] + "/health", 1.0) or {}).get("ok"):
+                    pending.discard(wn)
+            time.sleep(0.2)
+        return sorted(pending)
+
+    def stop(self):
+        for p in self.procs.values():
+            if p.poll() is None:
+                p.send_signal(signal.SIGINT)
+        for p in self.procs.values():
+            try:
+                p.wait(5)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+
+def _get(url: str, timeout: float) -> Optional[dict]:
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as r:
+            return json.loads(r.read().decode("utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _post(url: str, body: dict, timeout: float) -> Optional[dict]:
+    req = urllib.request.Request(url, data=json.dumps(body).encode("utf-8"),
+                                 headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as r:
+            return json.loads(r.read().decode("utf-8"))
+    except urllib.error.HTTPError as e:
+        return {"ok": False, "error": f"HTTP {e.code}"}
+    except (OSError, ValueError) as e:
+        return {"ok": False, "error": str(e)}
+
+
+def _item_args(op: str, cfg: dict, wn: str, tid: str, game: str) -> dict:
+    if op == "launch":
+        w = cfg["workers"][wn]
+        return {"shortcut_path": w["d2r_root"].rstrip("\\/") + "\\" + cfg["targets"][tid]["lnk"] + ".lnk"}
+    if op == "join_game":
+        return {"game_name": game, "password": ""}
+    return {}
+
+
+def orchestrate_headless(cfg_path: Path, ops: List[str], game: str, timeout: float,
+                         report: str = "") -> int:
+    """以 D2R_ORCH_HEADLESS 跑一遍 orchestrator（同一进程内按顺序跑完全部 op），返回其退出码。"""
+    env = dict(os.environ, D2R_ORCH_CONFIG=str(cfg_path), D2R_ORCH_HEADLESS=",".join(ops),
+               D2R_ORCH_GAME=game, PYTHONUNBUFFERED="1")
+    if report:
+        env["D2R_ORCH_REPORT"] = str(Path(report).resolve())
+    orch = HERE.parent / "orchestrator" / "orchestrator_ui.py"
+    try:
+        return subprocess.run([sys.executable, str(orch)], cwd=str(orch.parent), env=env,
+                              timeout=timeout * len(ops)).returncode
+    except subprocess.TimeoutExpired:
+        print(f"[simcluster] orchestrator did not finish in {timeout * len(ops):.0f}s", file=sys.stderr)
+        return 1
+
+
+def _pct(xs: List[float], q: float) -> Optional[float]:
+    if not xs:
+        return None
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(q * (len(xs) - 1))))]
+
+
+def drive(cfg: dict, op: str, game: str, timeout: float) -> dict:
+    """每个 worker 一个 serial /batch，全部并发；等全部结束，汇总耗时和失败。"""
+    by_worker: Dict[str, List[str]] = {}
+    for tid, wn in cfg["assignment"].items():
+        by_worker.setdefault(wn, []).append(tid)
+    results: Dict[str, dict] = {}
+    t0 = time.monotonic()
+
+    def run(wn: str, tids: List[str]):
+        w = cfg["workers"][wn]
+        items = [{"target_id": t, "action": op, "args": _item_args(op, cfg, wn, t, game)} for t in tids]
+        delay = float(w.get("join_delay_sec") or 0.0)
+        sub = _post(w["url"] + "/batch", {"items": items, "mode": "serial", "delay_sec": delay}, 10.0) or {}
+        if not sub.get("ok"):
+            results[wn] = {"error": sub.get("error", "submit failed"), "results": [], "end": time.monotonic()}
+            return
+        done, st = -1, {}
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            st = _get(f"{w['url']}/batch/{sub['batch_id']}?wait=10&done_gt={done}", 15.0) or st
+            done = st.get("done", done)
+            if st.get("status") not in (None, "running"):
+                break
+        results[wn] = {"results": [r for r in st.get("results") or [] if r], "end": time.monotonic()}
+
+    threads = [threading.Thread(target=run, args=(wn, tids), daemon=True) for wn, tids in by_worker.items()]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    lat = [r.get("elapsed_ms", 0) / 1000.0 for w in results.values() for r in w["results"]]
+    errors: Dict[str, int] = {}
+    for w in results.values():
+        if w.get("error"):
+            errors[w["error"]] = errors.get(w["error"], 0) + 1
+        for r in w["results"]:
+            if not r.get("ok"):
+                e = str(r.get("error") or "failed")[:80]
+                errors[e] = errors.get(e, 0) + 1
+    return {"op": op, "workers": len(by_worker), "targets": sum(len(v) for v in by_worker.values()),
+            "completed": len(lat), "failed": sum(errors.values()),
+            "makespan_s": round(max((w["end"] for w in results.values()), default=t0) - t0, 2),
+            "item_p50_s": _pct(lat, 0.5), "item_p95_s": _pct(lat, 0.95), "item_max_s": max(lat, default=None),
+            "errors": errors}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Run simulated D2R workers (and optionally load-test them)")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--targets", type=int, default=8)
+    ap.add_argument("--base-port", type=int, default=5101)
+    ap.add_argument("--out", default="sim-cluster", help="生成 config.json / 日志 / trace 的目录")
+    ap.add_argument("--sim", default="1", help="sim 配置 JSON（延迟、故障概率、seed）；1 = 默认")
+    ap.add_argument("--join-delay", type=float, default=1.0, help="每个 worker 的 join_delay_sec")
+    ap.add_argument("--drive", default="", help="逗号分隔的 op（launch,join_game,…）；不给则只拉起集群")
+    ap.add_argument("--direct", action="store_true",
+                    help="不经过 orchestrator，直接向 worker 发 /batch（只压 worker 的 HTTP 契约）")
+    ap.add_argument("--rate-interval", type=float, default=3.0,
+                    help="orchestrator 全局令牌桶间隔（prefs.join_rate.interval_sec），0 = 不限速")
+    ap.add_argument("--game", default="sim-game-1")
+    ap.add_argument("--timeout", type=float, default=1800.0, help="每个 op 的总超时（秒）")
+    ap.add_argument("--report", default="", help="压测结果另存为 JSON")
+    args = ap.parse_args()
+
+    out = Path(args.out).resolve()
+    out.mkdir(parents=True, exist_ok=True)
+    sim_spec = args.sim if args.sim in ("1", "true") else str(Path(args.sim).resolve())
+    cfg = build_config(out, args.workers, args.targets, args.base_port, args.join_delay, args.rate_interval)
+    cfg_path = out / "config.json"
+    cfg_path.write_text(json.dumps(cfg, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    cluster = Cluster(cfg_path, cfg, sim_spec, out / "logs")
+    cluster.start()
+    try:
+        bad = cluster.wait_healthy()
+        if bad:
+            print(f"[simcluster] not healthy: {', '.join(bad)} (see {out / 'logs'})", file=sys.stderr)
+            sys.exit(1)
+        print(f"[simcluster] {len(cluster.procs)} workers up, config={cfg_path}")
+        ops = [o.strip() for o in args.drive.split(",") if o.strip()]
+        if not ops:
+            print("[simcluster] Ctrl+C to stop")
+            while True:
+                time.sleep(1.0)
+        if not args.direct:
+            rc = orchestrate_headless(cfg_path, ops, args.game, args.timeout, args.report)
+            print(f"[simcluster] orchestrator exited with {rc} (traces in {out / 'traces'})")
+            if rc:
+                sys.exit(rc)
+            return
+        report = []
+        for op in ops:
+            rep = drive(cfg, op, args.game, args.timeout)
+            report.append(rep)
+            print(f"[simcluster] {op}: {rep['completed']}/{rep['targets']} items on {rep['workers']} workers, "
+                  f"makespan {rep['makespan_s']}s, p50 {rep['item_p50_s']}s, p95 {rep['item_p95_s']}s, "
+                  f"failed {rep['failed']}")
+            for e, n in sorted(rep["errors"].items(), key=lambda kv: -kv[1]):
+                print(f"    {n:4d} × {e}")
+        if args.report:
+            Path(args.report).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cluster.stop()
+
+
+if __name__ == "__main__":
+    main()
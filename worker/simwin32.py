@@ -0,0 +1,894 @@
+"""
+模拟模式：用确定性的假实现顶替 Win32 / 进程 / 音频层，让 worker.py 的 HTTP 契约和
+orchestrate() 不需要 Windows、不需要 D2R 就能在 Linux 上跑通（功能验证 + 压测）。
+
+启用：设环境变量 D2R_WORKER_SIM=<sim 配置 JSON 路径>（或 1，表示用默认配置）再启动 worker.py。
+install() 必须在 worker.py 导入 win32gui / psutil / pycaw 之前调用。它把下列模块换进 sys.modules：
+  win32gui / win32api / win32con / win32process / win32clipboard / win32event / pywintypes /
+  pythoncom / win32com.client / pycaw.pycaw / psutil
+并给 ctypes 装上假的 windll。它返回 SimWorld，worker.py 用 SimWorld.subprocess 顶替 subprocess
+（launch 与 handle64 都走虚拟进程）。
+
+SimWorld：虚拟桌面 + 虚拟进程表。没有后台线程，所有状态在每次 API 调用时按 monotonic 时钟惰性推进。
+  - Popen(D2R.exe …) 生成虚拟进程：launch_latency 后出现窗口，再过 load_latency 载入完成。
+    载入期间 CPU 高，载入后回落；readiness 的 responsive / cpu_settled 条件据此判定
+  - 窗口：client 默认 1280×720，按创建顺序层叠，最新的在最上层并成为前台窗口。
+    SendMessage 送来的鼠标 / 键盘消息驱动一个简化的 UI 状态机：
+      loading → title_screen →（SPACE / 点击）main_menu →（输入房名 + ENTER）in_game
+      →（ESC）game_menu →（点击 Save & Exit）lobby
+  - 故障注入按概率触发：launch 失败、进程起来但没有窗口、窗口无响应、载入后崩溃、点击丢失、进房失败
+随机数按 seed + 命令行 + 该命令行的第几次启动来播种。因此同一 seed 下，每个 target 的延迟和故障
+与启动顺序、并发无关，可以完全复现。
+
+sim 配置（全部可选）：
+  {"seed": 1, "launch_latency_sec": [1.0, 3.0], "load_latency_sec": [3.0, 8.0],
+   "join_latency_sec": [0.5, 2.0], "close_latency_sec": 0.5, "handle_latency_sec": 0.2,
+   "is_admin": true, "screen": [2560, 1440], "client": [1280, 720],
+   "fail": {"launch": 0, "no_window": 0, "hang": 0, "crash": 0, "click_drop": 0, "join": 0}}
+"""
+import copy
+import ctypes
+import json
+import math
+import random
+import subprocess as _subprocess
+import sys
+import threading
+import time
+import types
+from contextlib import contextmanager
+from pathlib import Path, PureWindowsPath
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from capture import CaptureBackend
+
+DEFAULTS = {
+    "seed": 1,
+    "launch_latency_sec": [1.0, 3.0],
+    "load_latency_sec": [3.0, 8.0],
+    "join_latency_sec": [0.5, 2.0],
+    "close_latency_sec": 0.5,
+    "handle_latency_sec": 0.2,
+    "crash_window_sec": [5.0, 60.0],       # crash 注入：载入后多久崩溃
+    "is_admin": True,
+    "screen": [2560, 1440],
+    "client": [1280, 720],
+    "exe_dir": r"C:\Program Files (x86)\Diablo II Resurrected",
+    "fail": {"launch": 0.0, "no_window": 0.0, "hang": 0.0, "crash": 0.0, "click_drop": 0.0, "join": 0.0},
+}
+
+# 用到的 Win32 常量（与真实值一致）
+WIN32CON = {
+    "WM_NULL": 0x0000, "WM_CLOSE": 0x0010, "WM_KEYDOWN": 0x0100, "WM_KEYUP": 0x0101, "WM_CHAR": 0x0102,
+    "WM_MOUSEMOVE": 0x0200, "WM_LBUTTONDOWN": 0x0201, "WM_LBUTTONUP": 0x0202, "MK_LBUTTON": 0x0001,
+    "VK_BACK": 0x08, "VK_TAB": 0x09, "VK_RETURN": 0x0D, "VK_SHIFT": 0x10, "VK_CONTROL": 0x11,
+    "VK_MENU": 0x12, "VK_ESCAPE": 0x1B, "VK_SPACE": 0x20, "VK_DELETE": 0x2E,
+    "SW_HIDE": 0, "SW_SHOWNORMAL": 1, "SW_SHOWMINIMIZED": 2, "SW_SHOWNOACTIVATE": 4, "SW_SHOW": 5,
+    "SW_MINIMIZE": 6, "SW_SHOWMINNOACTIVE": 7, "SW_RESTORE": 9,
+    "ENUM_CURRENT_SETTINGS": -1, "CF_TEXT": 1, "CF_UNICODETEXT": 13, "SMTO_ABORTIFHUNG": 0x0002,
+}
+
+BORDER_X, CAPTION_Y = 8, 31          # 窗口边框 / 标题栏（window rect 与 client 的差）
+D2R_TITLE = "Diablo II: Resurrected"
+D2R_CLASS = "OsWindow"
+
+
+def load_config(spec: Optional[str]) -> dict:
+    """spec：JSON 文件路径；空 / "1" / "true" 表示默认配置。"""
+    cfg = copy.deepcopy(DEFAULTS)
+    if spec and spec.strip().lower() not in ("1", "true", "yes", "on"):
+        user = json.loads(Path(spec).read_text(encoding="utf-8"))
+        merge_config(cfg, user)
+    return cfg
+
+
+def merge_config(cfg: dict, update: dict):
+    for k, v in (update or {}).items():
+        if k == "fail" and isinstance(v, dict):
+            cfg["fail"].update({fk: float(fv) for fk, fv in v.items()})
+        else:
+            cfg[k] = v
+
+
+class SimError(Exception):
+    """pywintypes.error 的替身：(winerror, funcname, strerror)。"""
+
+    def __init__(self, winerror: int = 1400, funcname: str = "", strerror: str = "Invalid window handle."):
+        super().__init__(winerror, funcname, strerror)
+        self.winerror = winerror
+        self.funcname = funcname
+        self.strerror = strerror
+
+
+def _uniform(rng: random.Random, spec) -> float:
+    if isinstance(spec, (list, tuple)):
+        lo, hi = float(spec[0]), float(spec[-1])
+        return rng.uniform(lo, hi) if hi > lo else lo
+    return float(spec)
+
+
+class VProcess:
+    def __init__(self, pid: int, cmd: List[str], cwd: Optional[str], rng: random.Random, cfg: dict, now: float):
+        self.pid = pid
+        self.cmd = list(cmd)
+        self.cwd = cwd
+        self.name = PureWindowsPath(cmd[0]).name if cmd else "?"
+        self.create_time = time.time()
+        self.rng = rng
+        f = cfg["fail"]
+        self.window_at = now + _uniform(rng, cfg["launch_latency_sec"])
+        self.loaded_at = self.window_at + _uniform(rng, cfg["load_latency_sec"])
+        self.no_window = rng.random() < f.get("no_window", 0.0)
+        self.hang = rng.random() < f.get("hang", 0.0)
+        self.crash_at = (self.loaded_at + _uniform(rng, cfg["crash_window_sec"])
+                         if rng.random() < f.get("crash", 0.0) else None)
+        self.exit_at: Optional[float] = None
+        self.returncode: Optional[int] = None
+        self.hwnd: Optional[int] = None
+        self.cpu_calls = 0
+
+    @property
+    def alive(self) -> bool:
+        return self.returncode is None
+
+    def cpu(self, now: float) -> float:
+        """确定性的 CPU%：启动阶段中等，载入阶段高（带起伏），载入完成后低且平稳。"""
+        if now < self.window_at:
+            return 30.0
+        if now < self.loaded_at:
+            return 85.0 + 10.0 * math.sin(now * 3.0 + self.pid)
+        return 3.0 + float((int(now * 2) + self.pid) % 3)
+
+    def rss(self, now: float) -> int:
+        if now < self.window_at:
+            return 150 * 1024 * 1024
+        span = max(1e-3, self.loaded_at - self.window_at)
+        frac = min(1.0, (now - self.window_at) / span)
+        return int((300 + 2200 * frac) * 1024 * 1024)
+
+
+class VWindow:
+    def __init__(self, hwnd: int, proc: VProcess, rect: Tuple[int, int, int, int], rng: random.Random):
+        self.hwnd = hwnd
+        self.pid = proc.pid
+        self.tid = proc.pid + 1
+        self.proc = proc
+        self.rect = rect
+        self.iconic = False
+        self.state = "loading"
+        self.pending: Optional[Tuple[str, float]] = None
+        self.text = ""
+        self.rng = rng
+        self.stats = {"messages": 0, "clicks": 0, "dropped_clicks": 0, "chars": 0, "keys": 0}
+
+    @property
+    def client(self) -> Tuple[int, int]:
+        l, t, r, b = self.rect
+        return max(0, r - l - 2 * BORDER_X), max(0, b - t - CAPTION_Y - BORDER_X)
+
+    def contains(self, x: int, y: int) -> bool:
+        l, t, r, b = self.rect
+        return l <= x < r and t <= y < b
+
+
+class SimWorld:
+    def __init__(self, cfg: dict):
+        self.cfg = cfg
+        self._lock = threading.RLock()
+        self.procs: Dict[int, VProcess] = {}
+        self.windows: Dict[int, VWindow] = {}
+        self.z: List[int] = []                  # 顶层窗口 Z 序，[0] 为最上层
+        self.foreground = 0
+        self.cursor = (0, 0)
+        self.clipboard = ""
+        self.muted: Dict[int, bool] = {}
+        self._next_pid = 10000
+        self._next_hwnd = 0x10010
+        self._launches: Dict[str, int] = {}
+        self.stats = {"spawned": 0, "launch_failed": 0, "crashed": 0, "closed": 0, "messages": 0}
+        self.subprocess = self._make_subprocess()
+
+    # ---- 时钟推进 ----
+
+    def _rng(self, cmd: List[str], n: int, salt: str = "") -> random.Random:
+        return random.Random(f"{self.cfg.get('seed', 1)}|{' '.join(cmd).lower()}|{n}|{salt}")
+
+    def tick(self):
+        now = time.monotonic()
+        with self._lock:
+            for p in list(self.procs.values()):
+                if not p.alive:
+                    continue
+                if p.exit_at is not None and now >= p.exit_at:
+                    self._exit(p, 0)
+                    self.stats["closed"] += 1
+                    continue
+                if p.crash_at is not None and now >= p.crash_at:
+                    self._exit(p, 0xC0000005)
+                    self.stats["crashed"] += 1
+                    continue
+                if p.hwnd is None and not p.no_window and now >= p.window_at:
+                    self._create_window(p)
+            for w in self.windows.values():
+                if w.state == "loading" and now >= w.proc.loaded_at:
+                    w.state = "title_screen"
+                if w.pending and now >= w.pending[1]:
+                    w.state, w.pending = w.pending[0], None
+        return now
+
+    def _create_window(self, p: VProcess):
+        n = len(self.windows)
+        cw, ch = self.cfg["client"]
+        l, t = 20 + (n % 8) * 40, 20 + (n % 8) * 30
+        rect = (l, t, l + cw + 2 * BORDER_X, t + ch + CAPTION_Y + BORDER_X)
+        hwnd = self._next_hwnd
+        self._next_hwnd += 4
+        w = VWindow(hwnd, p, rect, self._rng(p.cmd, self._launches.get(self._cmd_key(p.cmd), 0), "win"))
+        self.windows[hwnd] = w
+        self.z.insert(0, hwnd)
+        self.foreground = hwnd           # D2R 窗口出现时抢前台
+        p.hwnd = hwnd
+
+    def _exit(self, p: VProcess, code: int):
+        p.returncode = code
+        if p.hwnd is not None:
+            self.windows.pop(p.hwnd, None)
+            if p.hwnd in self.z:
+                self.z.remove(p.hwnd)
+            if self.foreground == p.hwnd:
+                self.foreground = self.z[0] if self.z else 0
+        self.muted.pop(p.pid, None)
+
+    @staticmethod
+    def _cmd_key(cmd: List[str]) -> str:
+        return " ".join(cmd).lower()
+
+    # ---- 进程 ----
+
+    def spawn(self, cmd: List[str], cwd: Optional[str] = None) -> VProcess:
+        now = self.tick()
+        with self._lock:
+            key = self._cmd_key(cmd)
+            n = self._launches.get(key, 0) + 1
+            self._launches[key] = n
+            rng = self._rng(cmd, n)
+            if rng.random() < self.cfg["fail"].get("launch", 0.0):
+                self.stats["launch_failed"] += 1
+                raise OSError(2, "simulated launch failure", cmd[0] if cmd else "")
+            pid = self._next_pid
+            self._next_pid += 4
+            p = self.procs[pid] = VProcess(pid, cmd, cwd, rng, self.cfg, now)
+            self.stats["spawned"] += 1
+            return p
+
+    def process(self, pid: int) -> Optional[VProcess]:
+        self.tick()
+        p = self.procs.get(int(pid or 0))
+        return p if p is not None and p.alive else None
+
+    def kill(self, pid: int, code: int = 1):
+        with self._lock:
+            p = self.procs.get(int(pid))
+            if p is not None and p.alive:
+                self._exit(p, code)
+
+    # ---- 窗口 ----
+
+    def window(self, hwnd: int, func: str = "") -> VWindow:
+        self.tick()
+        w = self.windows.get(int(hwnd or 0))
+        if w is None:
+            raise SimError(1400, func, "Invalid window handle.")
+        return w
+
+    def message(self, hwnd: int, msg: int, wp: int = 0, lp: int = 0, post: bool = False) -> int:
+        now = self.tick()
+        with self._lock:
+            w = self.windows.get(int(hwnd or 0))
+            if w is None:
+                return 0
+            self.stats["messages"] += 1
+            w.stats["messages"] += 1
+            if msg == WIN32CON["WM_CLOSE"]:
+                if w.proc.exit_at is None:
+                    w.proc.exit_at = now + float(self.cfg["close_latency_sec"])
+                return 0
+            if w.proc.hang:
+                return 0
+            if msg == WIN32CON["WM_LBUTTONDOWN"]:
+                if w.rng.random() < self.cfg["fail"].get("click_drop", 0.0):
+                    w.stats["dropped_clicks"] += 1
+                    return 0
+                w.stats["clicks"] += 1
+                if w.state == "title_screen":
+                    w.state = "main_menu"
+                elif w.state == "game_menu":
+                    w.pending = ("lobby", now + 1.0)
+            elif msg == WIN32CON["WM_CHAR"]:
+                ch = chr(int(wp) & 0xFFFF)
+                if ch.isprintable():
+                    w.text += ch
+                    w.stats["chars"] += 1
+            elif msg == WIN32CON["WM_KEYDOWN"]:
+                w.stats["keys"] += 1
+                vk = int(wp)
+                if vk in (WIN32CON["VK_BACK"], WIN32CON["VK_DELETE"]):
+                    w.text = w.text[:-1]
+                elif vk == WIN32CON["VK_TAB"]:
+                    w.text = ""
+                elif vk == WIN32CON["VK_SPACE"] and w.state == "title_screen":
+                    w.state = "main_menu"
+                elif vk == WIN32CON["VK_ESCAPE"] and w.state == "in_game":
+                    w.state = "game_menu"
+                elif vk == WIN32CON["VK_RETURN"] and w.state in ("main_menu", "lobby") and w.pending is None:
+                    if w.rng.random() >= self.cfg["fail"].get("join", 0.0):
+                        w.pending = ("in_game", now + _uniform(w.rng, self.cfg["join_latency_sec"]))
+                    w.text = ""
+            return 0
+
+    def is_hung(self, hwnd: int) -> bool:
+        w = self.windows.get(int(hwnd or 0))
+        return bool(w and w.proc.hang)
+
+    def window_from_point(self, x: int, y: int) -> int:
+        self.tick()
+        with self._lock:
+            for h in self.z:
+                w = self.windows[h]
+                if not w.iconic and w.contains(x, y):
+                    return h
+        return 0
+
+    # ---- 观测 ----
+
+    def snapshot(self) -> dict:
+        now = self.tick()
+        with self._lock:
+            procs = [{"pid": p.pid, "name": p.name, "cmd": p.cmd, "alive": p.alive, "returncode": p.returncode,
+                      "hwnd": p.hwnd, "hang": p.hang, "no_window": p.no_window,
+                      "loaded": now >= p.loaded_at, "cpu": round(p.cpu(now), 1)}
+                     for p in self.procs.values()]
+            wins = [{"hwnd": w.hwnd, "pid": w.pid, "state": w.state, "text": w.text, "rect": list(w.rect),
+                     "iconic": w.iconic, "muted": self.muted.get(w.pid), **w.stats}
+                    for w in self.windows.values()]
+            return {"config": self.cfg, "stats": dict(self.stats), "foreground": self.foreground,
+                    "processes": procs, "windows": wins}
+
+    # ---- subprocess 替身 ----
+
+    def _make_subprocess(self) -> types.SimpleNamespace:
+        world = self
+
+        class Popen:
+            def __init__(self, args, cwd=None, **_kw):
+                self.args = list(args) if isinstance(args, (list, tuple)) else [str(args)]
+                self._p = world.spawn(self.args, cwd)
+                self.pid = self._p.pid
+
+            @property
+            def returncode(self):
+                world.tick()
+                return self._p.returncode
+
+            def poll(self):
+                return self.returncode
+
+            def wait(self, timeout=None):
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while self.poll() is None:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        raise _subprocess.TimeoutExpired(self.args, timeout)
+                    time.sleep(0.05)
+                return self._p.returncode
+
+            def terminate(self):
+                world.kill(self.pid, 1)
+
+            kill = terminate
+
+        def _handle64(args) -> Optional[str]:
+            if not args or "handle" not in PureWindowsPath(str(args[0])).name.lower():
+                return None
+            time.sleep(float(world.cfg["handle_latency_sec"]))
+            pid = int(args[args.index("-p") + 1]) if "-p" in args else 0
+            if world.process(pid) is None:
+                return "No matching handles found.\n"
+            return (f"Process,PID,Type,Handle,Name\nD2R.exe,{pid},Event,0x1A4,"
+                    f"\\Sessions\\1\\BaseNamedObjects\\DiabloII Check For Other Instances\n")
+
+        def check_output(args, text=False, **_kw):
+            out = _handle64(list(args))
+            if out is None:
+                raise _subprocess.CalledProcessError(1, args, output="simulated: unknown tool")
+            return out if text else out.encode()
+
+        def run(args, check=False, **_kw):
+            out = _handle64(list(args))
+            rc = 0 if out is not None else 1
+            if check and rc:
+                raise _subprocess.CalledProcessError(rc, args)
+            return _subprocess.CompletedProcess(args, rc, stdout=out)
+
+        return types.SimpleNamespace(
+            Popen=Popen, check_output=check_output, run=run,
+            CalledProcessError=_subprocess.CalledProcessError, TimeoutExpired=_subprocess.TimeoutExpired,
+            CompletedProcess=_subprocess.CompletedProcess,
+            PIPE=_subprocess.PIPE, STDOUT=_subprocess.STDOUT, DEVNULL=_subprocess.DEVNULL,
+        )
+
+    def capture_backend(self) -> "SimCaptureBackend":
+        return SimCaptureBackend(self)
+
+
+# ============== capture ==============
+
+_STATE_COLORS = {"loading": (0, 0, 0), "title_screen": (40, 40, 120), "main_menu": (30, 60, 30),
+                 "lobby": (60, 60, 20), "in_game": (20, 50, 90), "game_menu": (70, 30, 30)}
+
+
+class SimCaptureBackend(CaptureBackend):
+    """每个 UI 状态一种纯色画面（确定性）；窗口不存在时 grab 失败。"""
+
+    def __init__(self, world: SimWorld):
+        self.world = world
+
+    def client_size(self, hwnd: int) -> Tuple[int, int]:
+        try:
+            return self.world.window(hwnd).client
+        except SimError:
+            return (0, 0)
+
+    def grab(self, hwnd: int, rect: Tuple[int, int, int, int], out: np.ndarray) -> bool:
+        try:
+            w = self.world.window(hwnd)
+        except SimError:
+            return False
+        out[...] = _STATE_COLORS.get(w.state, (128, 128, 128))
+        return True
+
+
+# ============== 假模块 ==============
+
+def _module(name: str, **attrs) -> types.ModuleType:
+    m = types.ModuleType(name, f"simulated {name} (simwin32)")
+    m.__dict__.update(attrs)
+    return m
+
+
+def _win32gui(world: SimWorld) -> types.ModuleType:
+    def IsWindow(hwnd):
+        world.tick()
+        return 1 if int(hwnd or 0) in world.windows else 0
+
+    def IsWindowVisible(hwnd):
+        return IsWindow(hwnd)
+
+    def IsIconic(hwnd):
+        w = world.windows.get(int(hwnd or 0))
+        return 1 if w and w.iconic else 0
+
+    def EnumWindows(callback, extra):
+        world.tick()
+        with world._lock:
+            hwnds = list(world.z)
+        for h in hwnds:
+            if callback(h, extra) is False:
+                break
+
+    def GetWindowText(hwnd):
+        return D2R_TITLE if int(hwnd or 0) in world.windows else ""
+
+    def GetClassName(hwnd):
+        world.window(hwnd, "GetClassName")
+        return D2R_CLASS
+
+    def GetWindowRect(hwnd):
+        return world.window(hwnd, "GetWindowRect").rect
+
+    def GetClientRect(hwnd):
+        cw, ch = world.window(hwnd, "GetClientRect").client
+        return (0, 0, cw, ch)
+
+    def ClientToScreen(hwnd, pt):
+        l, t, _, _ = world.window(hwnd, "ClientToScreen").rect
+        return (l + BORDER_X + int(pt[0]), t + CAPTION_Y + int(pt[1]))
+
+    def ScreenToClient(hwnd, pt):
+        l, t, _, _ = world.window(hwnd, "ScreenToClient").rect
+        return (int(pt[0]) - l - BORDER_X, int(pt[1]) - t - CAPTION_Y)
+
+    def MoveWindow(hwnd, x, y, w, h, repaint=True):
+        world.window(hwnd, "MoveWindow").rect = (int(x), int(y), int(x) + int(w), int(y) + int(h))
+
+    def ShowWindow(hwnd, cmd):
+        w = world.windows.get(int(hwnd or 0))
+        if w is None:
+            return 0
+        was = not w.iconic
+        w.iconic = cmd in (WIN32CON["SW_MINIMIZE"], WIN32CON["SW_SHOWMINIMIZED"], WIN32CON["SW_SHOWMINNOACTIVE"])
+        return 1 if was else 0
+
+    def SendMessageTimeout(hwnd, msg, wp, lp, flags, timeout_ms):
+        w = world.window(hwnd, "SendMessageTimeout")
+        if w.proc.hang:
+            raise SimError(1460, "SendMessageTimeout", "This operation returned because the timeout period expired.")
+        return 1, world.message(hwnd, msg, wp, lp)
+
+    return _module(
+        "win32gui",
+        IsWindow=IsWindow, IsWindowVisible=IsWindowVisible, IsIconic=IsIconic, EnumWindows=EnumWindows,
+        GetWindowText=GetWindowText, GetClassName=GetClassName, GetWindowRect=GetWindowRect,
+        GetClientRect=GetClientRect, ClientToScreen=ClientToScreen, ScreenToClient=ScreenToClient,
+        MoveWindow=MoveWindow, ShowWindow=ShowWindow, SendMessageTimeout=SendMessageTimeout,
+        SendMessage=lambda hwnd, msg, wp=0, lp=0: world.message(hwnd, msg, wp, lp),
+        PostMessage=lambda hwnd, msg, wp=0, lp=0: world.message(hwnd, msg, wp, lp, post=True),
+        WindowFromPoint=lambda pt: world.window_from_point(int(pt[0]), int(pt[1])),
+        GetAncestor=lambda hwnd, flags: int(hwnd) if int(hwnd or 0) in world.windows else 0,
+        GetParent=lambda hwnd: 0,
+        GetForegroundWindow=lambda: (world.tick(), world.foreground)[1],
+        GetCursorPos=lambda: world.cursor,
+    )
+
+
+def _win32api(world: SimWorld) -> types.ModuleType:
+    def SetCursorPos(pt):
+        world.cursor = (int(pt[0]), int(pt[1]))
+
+    def GetSystemMetrics(index):
+        sw, sh = world.cfg["screen"]
+        return {0: sw, 1: sh}.get(int(index), 0)
+
+    def EnumDisplaySettings(device=None, mode=-1):
+        sw, sh = world.cfg["screen"]
+        return types.SimpleNamespace(PelsWidth=sw, PelsHeight=sh, BitsPerPel=32, DisplayFrequency=60)
+
+    return _module(
+        "win32api",
+        SetCursorPos=SetCursorPos, GetCursorPos=lambda: world.cursor, GetSystemMetrics=GetSystemMetrics,
+        EnumDisplaySettings=EnumDisplaySettings,
+        SendMessage=lambda hwnd, msg, wp=0, lp=0: world.message(hwnd, msg, wp, lp),
+        PostMessage=lambda hwnd, msg, wp=0, lp=0: world.message(hwnd, msg, wp, lp, post=True),
+    )
+
+
+def _win32process(world: SimWorld) -> types.ModuleType:
+    def GetWindowThreadProcessId(hwnd):
+        w = world.window(hwnd, "GetWindowThreadProcessId")
+        return w.tid, w.pid
+
+    return _module("win32process", GetWindowThreadProcessId=GetWindowThreadProcessId)
+
+
+def _win32event() -> types.ModuleType:
+    """自动复位事件用 threading.Event 模拟；没有消息队列，MsgWaitForMultipleObjects 只等事件。"""
+    WAIT_OBJECT_0, WAIT_TIMEOUT, INFINITE = 0, 258, 0xFFFFFFFF
+
+    def MsgWaitForMultipleObjects(handles, wait_all, timeout_ms, wake_mask):
+        timeout = None if timeout_ms == INFINITE else timeout_ms / 1000.0
+        evt = handles[0]
+        if not evt.wait(timeout):
+            return WAIT_TIMEOUT
+        evt.clear()
+        return WAIT_OBJECT_0
+
+    return _module(
+        "win32event",
+        CreateEvent=lambda sa, manual_reset, initial, name: threading.Event(),
+        SetEvent=lambda evt: evt.set(),
+        MsgWaitForMultipleObjects=MsgWaitForMultipleObjects,
+        WAIT_OBJECT_0=WAIT_OBJECT_0, WAIT_TIMEOUT=WAIT_TIMEOUT, INFINITE=INFINITE, QS_ALLINPUT=0x04FF,
+    )
+
+
+def _win32clipboard(world: SimWorld) -> types.ModuleType:
+    def SetClipboardData(fmt, data):
+        world.clipboard = str(data)
+
+    return _module(
+        "win32clipboard",
+        OpenClipboard=lambda hwnd=None: None, CloseClipboard=lambda: None,
+        EmptyClipboard=lambda: setattr(world, "clipboard", ""), SetClipboardData=SetClipboardData,
+        GetClipboardData=lambda fmt=WIN32CON["CF_UNICODETEXT"]: world.clipboard,
+    )
+
+
+class _SimShortcut:
+    def __init__(self, world: SimWorld, path: str):
+        stem = PureWindowsPath(str(path)).stem or Path(str(path)).stem
+        exe_dir = world.cfg["exe_dir"]
+        self.Targetpath = self.TargetPath = str(PureWindowsPath(exe_dir) / "D2R.exe")
+        self.Arguments = f"-username {stem}"
+        self.WorkingDirectory = exe_dir
+
+
+def _win32com(world: SimWorld) -> Tuple[types.ModuleType, types.ModuleType]:
+    class Shell:
+        def CreateShortcut(self, path):
+            return _SimShortcut(world, path)
+
+        CreateShortCut = CreateShortcut
+
+    def Dispatch(progid):
+        if str(progid).lower() != "wscript.shell":
+            raise SimError(-2147221005, "Dispatch", f"Invalid class string: {progid}")
+        return Shell()
+
+    client = _module("win32com.client", Dispatch=Dispatch)
+    return _module("win32com", client=client), client
+
+
+def _pycaw(world: SimWorld, psutil_mod: types.ModuleType) -> Tuple[types.ModuleType, types.ModuleType]:
+    class ISimpleAudioVolume:
+        pass
+
+    class _Volume:
+        def __init__(self, pid: int):
+            self.pid = pid
+
+        def SetMute(self, mute, ctx=None):
+            if world.process(self.pid) is None:
+                raise SimError(-2004287484, "SetMute", "AUDCLNT_E_DEVICE_INVALIDATED")
+            world.muted[self.pid] = bool(mute)
+
+        def GetMute(self):
+            return int(world.muted.get(self.pid, False))
+
+    class _Ctl:
+        def __init__(self, pid: int):
+            self.pid = pid
+
+        def QueryInterface(self, iface):
+            return _Volume(self.pid)
+
+    class _Session:
+        def __init__(self, p: VProcess):
+            self.ProcessId = p.pid
+            self.Process = psutil_mod.Process(p.pid)
+            self._ctl = _Ctl(p.pid)
+
+    class AudioUtilities:
+        @staticmethod
+        def GetAllSessions():
+            now = world.tick()
+            with world._lock:
+                live = [p for p in world.procs.values() if p.alive and p.hwnd and now >= p.loaded_at]
+            return [_Session(p) for p in live]
+
+    pycaw_mod = _module("pycaw.pycaw", AudioUtilities=AudioUtilities, ISimpleAudioVolume=ISimpleAudioVolume)
+    return _module("pycaw", pycaw=pycaw_mod), pycaw_mod
+
+
+def _psutil(world: SimWorld) -> types.ModuleType:
+    class Error(Exception):
+        pass
+
+    class NoSuchProcess(Error):
+        def __init__(self, pid=None, name=None, msg=None):
+            super().__init__(msg or f"process no longer exists (pid={pid})")
+            self.pid = pid
+
+    class AccessDenied(Error):
+        pass
+
+    class ZombieProcess(NoSuchProcess):
+        pass
+
+    class TimeoutExpired(Error):
+        pass
+
+    class Process:
+        def __init__(self, pid: int):
+            p = world.process(pid)
+            if p is None:
+                raise NoSuchProcess(pid)
+            self.pid = int(pid)
+            self._p = p
+            self.info: dict = {}
+
+        def _alive(self) -> VProcess:
+            world.tick()
+            if not self._p.alive:
+                raise NoSuchProcess(self.pid)
+            return self._p
+
+        def is_running(self) -> bool:
+            world.tick()
+            return self._p.alive
+
+        def name(self) -> str:
+            return self._alive().name
+
+        def exe(self) -> str:
+            return self._alive().cmd[0]
+
+        def cmdline(self) -> List[str]:
+            return list(self._alive().cmd)
+
+        def create_time(self) -> float:
+            return self._p.create_time
+
+        def status(self) -> str:
+            return "running" if self.is_running() else "dead"
+
+        def ppid(self) -> int:
+            return 0
+
+        def parent(self):
+            return None
+
+        def children(self, recursive: bool = False) -> list:
+            self._alive()
+            return []
+
+        def cpu_percent(self, interval=None) -> float:
+            p = self._alive()
+            p.cpu_calls += 1
+            return 0.0 if p.cpu_calls == 1 else round(p.cpu(time.monotonic()), 1)
+
+        def memory_info(self):
+            rss = self._alive().rss(time.monotonic())
+            return types.SimpleNamespace(rss=rss, vms=rss * 2)
+
+        def io_counters(self):
+            p = self._alive()
+            el = max(0.0, min(time.monotonic(), p.loaded_at) - (p.window_at - 1.0))
+            rb = int(el * 80 * 1024 * 1024)
+            return types.SimpleNamespace(read_bytes=rb, write_bytes=rb // 50, read_count=0, write_count=0)
+
+        def num_threads(self) -> int:
+            return 64 if self._alive().hwnd else 8
+
+        @contextmanager
+        def oneshot(self):
+            yield
+
+        def terminate(self):
+            world.kill(self.pid, 1)
+
+        def kill(self):
+            world.kill(self.pid, 1)
+
+        def wait(self, timeout=None):
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while self.is_running():
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise TimeoutExpired(f"timeout after {timeout}s (pid={self.pid})")
+                time.sleep(0.05)
+            return self._p.returncode
+
+    def pids() -> List[int]:
+        world.tick()
+        with world._lock:
+            return [p.pid for p in world.procs.values() if p.alive]
+
+    def process_iter(attrs=None):
+        for pid in pids():
+            try:
+                proc = Process(pid)
+            except NoSuchProcess:
+                continue
+            if attrs:
+                info = {}
+                for a in attrs:
+                    if a == "pid":
+                        info[a] = pid
+                    else:
+                        try:
+                            info[a] = getattr(proc, a)()
+                        except NoSuchProcess:
+                            info[a] = None
+                proc.info = info
+            yield proc
+
+    def cpu_count(logical: bool = True) -> int:
+        return int(world.cfg.get("cpu_count", 16))
+
+    def cpu_percent(interval=None) -> float:
+        now = time.monotonic()
+        with world._lock:
+            total = sum(p.cpu(now) for p in world.procs.values() if p.alive)
+        return round(min(100.0, 2.0 + total / cpu_count()), 1)
+
+    def virtual_memory():
+        now = time.monotonic()
+        total = int(world.cfg.get("mem_gb", 64)) * 1024 ** 3
+        with world._lock:
+            used = 4 * 1024 ** 3 + sum(p.rss(now) for p in world.procs.values() if p.alive)
+        used = min(used, total)
+        return types.SimpleNamespace(total=total, available=total - used, used=used,
+                                     percent=round(used * 100.0 / total, 1))
+
+    return _module(
+        "psutil",
+        Error=Error, NoSuchProcess=NoSuchProcess, AccessDenied=AccessDenied, ZombieProcess=ZombieProcess,
+        TimeoutExpired=TimeoutExpired, Process=Process, pids=pids, process_iter=process_iter,
+        pid_exists=lambda pid: world.process(pid) is not None,
+        cpu_count=cpu_count, cpu_percent=cpu_percent, virtual_memory=virtual_memory,
+    )
+
+
+class _SimFunc:
+    """ctypes 函数指针的替身：可设 argtypes / restype，调用转给实现（没有实现的返回 0）。"""
+
+    def __init__(self, name: str, impl=None):
+        self.__name__ = name
+        self.impl = impl
+        self.argtypes = None
+        self.restype = None
+
+    def __call__(self, *args):
+        return self.impl(*args) if self.impl else 0
+
+
+class _SimDll:
+    def __init__(self, name: str, impls: Dict[str, object]):
+        self._name = name
+        self._impls = impls
+        self._funcs: Dict[str, _SimFunc] = {}
+
+    def __getattr__(self, name: str) -> _SimFunc:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        f = self._funcs.get(name)
+        if f is None:
+            f = self._funcs[name] = _SimFunc(name, self._impls.get(name))
+        return f
+
+
+def _windll(world: SimWorld) -> types.SimpleNamespace:
+    user32 = {
+        "SetProcessDpiAwarenessContext": lambda ctx: 1,
+        "GetThreadDpiAwarenessContext": lambda: 1,
+        "GetAwarenessFromDpiAwarenessContext": lambda ctx: 3,   # Per-Monitor
+        "SetProcessDPIAware": lambda: 1,
+        "GetDpiForWindow": lambda hwnd: 96 if int(hwnd or 0) in world.windows else 0,
+        "IsHungAppWindow": lambda hwnd: 1 if world.is_hung(hwnd) else 0,
+        "ClipCursor": lambda rect: 1,
+        "AdjustWindowRectEx": lambda *a: 1,
+        "GetDC": lambda hwnd: 1,
+        "ReleaseDC": lambda hwnd, hdc: 1,
+        # SetWinEventHook 返回 0：WinEvent 前台来源启动失败 → worker 自动退回轮询
+    }
+    kernel32 = {"GetCurrentThreadId": lambda: threading.get_ident() & 0xFFFFFFFF}
+    shell32 = {"IsUserAnAdmin": lambda: 1 if world.cfg.get("is_admin", True) else 0}
+    shcore = {"SetProcessDpiAwareness": lambda v: 0}
+    return types.SimpleNamespace(user32=_SimDll("user32", user32), kernel32=_SimDll("kernel32", kernel32),
+                                 shell32=_SimDll("shell32", shell32), shcore=_SimDll("shcore", shcore),
+                                 gdi32=_SimDll("gdi32", {}))
+
+
+# ============== 安装 ==============
+
+WORLD: Optional[SimWorld] = None
+
+
+def install(spec: Optional[str] = None) -> SimWorld:
+    """把假模块装进 sys.modules（幂等）；返回 SimWorld。"""
+    global WORLD
+    if WORLD is not None:
+        return WORLD
+    world = SimWorld(load_config(spec))
+    psutil_mod = _psutil(world)
+    win32com_mod, client_mod = _win32com(world)
+    pycaw_pkg, pycaw_mod = _pycaw(world, psutil_mod)
+    sys.modules.update({
+        "win32gui": _win32gui(world),
+        "win32api": _win32api(world),
+        "win32con": _module("win32con", **WIN32CON),
+        "win32process": _win32process(world),
+        "win32clipboard": _win32clipboard(world),
+        "win32event": _win32event(),
+        "pywintypes": _module("pywintypes", error=SimError),
+        "pythoncom": _module("pythoncom", CoInitialize=lambda: None, CoInitializeEx=lambda flags=0: None,
+                             CoUninitialize=lambda: None, PumpWaitingMessages=lambda: 0),
+        "win32com": win32com_mod,
+        "win32com.client": client_mod,
+        "pycaw": pycaw_pkg,
+        "pycaw.pycaw": pycaw_mod,
+        "psutil": psutil_mod,
+    })
+    ctypes.windll = _windll(world)
+    WORLD = world
+    return world
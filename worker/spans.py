@@ -0,0 +1,112 @@
+"""
+步骤级耗时 span：{"seq", "name", "target", "start", "dur_ms", "attrs", "error"?}。
+
+  - SPANS.span(name, target_id, **attrs)：with 语句包住一个步骤（resolve / spawn / window_wait /
+    每次点击 / 每个输入框 …）。start 为墙钟 time.time()（便于与 orchestrator 的时间对齐），
+    时长用 perf_counter；步骤抛异常时记 error 并照常抛出
+  - SpanStore：有界环（deque(maxlen)），满了丢最旧的；GET /spans 按 target / seq 查询
+  - traced(action)：动作入口装饰器。动作期间本线程产生的 span 额外收集一份，
+    动作返回 dict 时附在 res["spans"]（嵌套动作的 span 同时进入外层）
+  - 开销：一次 span ≈ 两次计时 + 一个 dict + 一次 deque.append（微秒级），
+    对毫秒到秒级的步骤可忽略；wrap() 用于高频输入原语
+"""
+import functools
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Optional
+
+
+class _Span:
+    __slots__ = ("store", "name", "target", "attrs", "start", "_t0")
+
+    def __init__(self, store: "SpanStore", name: str, target, attrs: dict):
+        self.store = store
+        self.name = name
+        self.target = None if target is None else str(target)
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        """步骤进行中补充属性（如 pid、hwnd、结果）。"""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, et, ev, tb):
+        dur = time.perf_counter() - self._t0
+        rec = {"seq": 0, "name": self.name, "target": self.target, "start": self.start,
+               "dur_ms": round(dur * 1000.0, 3), "attrs": self.attrs}
+        if et is not None:
+            rec["error"] = et.__name__
+        self.store._add(rec)
+        return False
+
+
+class SpanStore:
+    def __init__(self, maxlen: int = 20000):
+        self._ring: deque = deque(maxlen=max(1, int(maxlen)))
+        self._seq = itertools.count(1)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def span(self, name: str, target=None, **attrs) -> _Span:
+        return _Span(self, name, target, attrs)
+
+    def _add(self, rec: dict):
+        with self._lock:
+            rec["seq"] = next(self._seq)
+            self._ring.append(rec)
+        for sink in getattr(self._local, "sinks", ()):
+            sink.append(rec)
+
+    # ---- 动作级收集 ----
+
+    def traced(self, action: str):
+        """fn(target_id, ...) 的装饰器：整个动作一个 span，返回 dict 时附上本次的全部 span。"""
+        def deco(fn: Callable):
+            @functools.wraps(fn)
+            def wrapper(*a, **kw):
+                target = kw.get("target_id", a[0] if a else None)
+                sinks = getattr(self._local, "sinks", None)
+                if sinks is None:
+                    sinks = self._local.sinks = []
+                got: List[dict] = []
+                sinks.append(got)
+                try:
+                    with self.span(action, target):
+                        res = fn(*a, **kw)
+                finally:
+                    sinks.remove(got)
+                if isinstance(res, dict):
+                    res["spans"] = got
+                return res
+            return wrapper
+        return deco
+
+    def wrap(self, name: str, attrs: Optional[Callable[..., dict]] = None):
+        """输入原语的装饰器：target 取关键字参数 target_id；attrs(*a, **kw) -> 额外属性。"""
+        def deco(fn: Callable):
+            @functools.wraps(fn)
+            def wrapper(*a, **kw):
+                with self.span(name, kw.get("target_id"), **(attrs(*a, **kw) if attrs else {})):
+                    return fn(*a, **kw)
+            return wrapper
+        return deco
+
+    # ---- 查询 ----
+
+    def recent(self, target: Optional[str] = None, after: int = 0, limit: int = 500) -> List[dict]:
+        with self._lock:
+            recs = list(self._ring)
+        out = [r for r in recs if r["seq"] > after and (target is None or r["target"] == str(target))]
+        return out[-max(0, int(limit)):] if limit else out
+
+    def stats(self) -> dict:
+        with self._lock:
+            n = len(self._ring)
+            last = self._ring[-1]["seq"] if n else 0
+        return {"stored": n, "capacity": self._ring.maxlen, "last_seq": last}
@@ -0,0 +1,233 @@
+"""
+UI 状态识别（title_screen / main_menu / lobby / in_game / loading / disconnected …）。
+
+做法：
+  1) 每个 Region 的截图（capture.py 产出的降采样 ROI）用预计算的最近邻索引
+     缩到固定网格（默认 8×8×3），拼成一个 float32 特征向量
+  2) 签名索引：所有样本特征堆成矩阵 S（n×d），预存 ||s||²
+  3) 分类：D = ||x||² - 2·X·Sᵀ + ||s||²，一次矩阵乘得到 (targets × 样本) 距离，
+     按状态取最小值；最近状态的均方误差超过 threshold → "unknown"
+状态集合完全由签名文件决定（录制语料的子目录名）。
+
+签名文件为 .npz（features / labels / regions / grid / threshold）。
+语料目录：<corpus>/<state>/*.npy，每个文件是一帧完整 client 画面（h×w×3 uint8 BGR）。
+
+  python worker/uistate.py build --corpus DIR --out worker/uimaps/states.npz
+  python worker/uistate.py bench --corpus DIR --signatures worker/uimaps/states.npz
+  python worker/uistate.py bench --synthetic            # 无录制语料时用合成帧跑基准
+"""
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from capture import CaptureManager, RecordedFrameBackend, Region
+
+UNKNOWN = "unknown"
+
+DEFAULT_REGIONS: List[Region] = [
+    Region("top", 0.0, 0.0, 1.0, 0.10),
+    Region("center", 0.30, 0.35, 0.40, 0.30),
+    Region("right", 0.55, 0.10, 0.45, 0.75),
+    Region("bottom", 0.0, 0.85, 1.0, 0.15),
+]
+
+
+class UiStateClassifier:
+    def __init__(self, regions: Sequence[Region] = DEFAULT_REGIONS, grid: Tuple[int, int] = (8, 8),
+                 threshold: float = 0.02):
+        self.regions = list(regions)
+        self.grid = (int(grid[0]), int(grid[1]))
+        self.threshold = float(threshold)
+        self.dim = len(self.regions) * self.grid[0] * self.grid[1] * 3
+        self._idx_cache: Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray]] = {}
+        self._feats: List[np.ndarray] = []
+        self._labels: List[str] = []
+        self.S = np.zeros((0, self.dim), dtype=np.float32)
+        self.s2 = np.zeros((0,), dtype=np.float32)
+        self.states: List[str] = []
+        self._col_state = np.zeros((0,), dtype=np.int32)
+        self._state_starts = np.zeros((0,), dtype=np.int64)
+
+    # ---- 特征 ----
+
+    def _grid_index(self, h: int, w: int) -> Tuple[np.ndarray, np.ndarray]:
+        key = (h, w)
+        idx = self._idx_cache.get(key)
+        if idx is None:
+            gh, gw = self.grid
+            ys = np.minimum(((np.arange(gh) + 0.5) * h / gh).astype(np.intp), h - 1)
+            xs = np.minimum(((np.arange(gw) + 0.5) * w / gw).astype(np.intp), w - 1)
+            idx = self._idx_cache[key] = np.ix_(ys, xs)
+        return idx
+
+    def featurize(self, crops: Dict[str, np.ndarray], out: Optional[np.ndarray] = None) -> np.ndarray:
+        if out is None:
+            out = np.empty((self.dim,), dtype=np.float32)
+        step = self.grid[0] * self.grid[1] * 3
+        for i, r in enumerate(self.regions):
+            img = crops[r.name]
+            ys, xs = self._grid_index(img.shape[0], img.shape[1])
+            np.multiply(img[ys, xs].reshape(-1), 1.0 / 255.0, out=out[i * step:(i + 1) * step], casting="unsafe")
+        return out
+
+    # ---- 签名索引 ----
+
+    def add_sample(self, state: str, feat: np.ndarray):
+        self._feats.append(np.asarray(feat, dtype=np.float32).reshape(-1))
+        self._labels.append(str(state))
+
+    def build_index(self):
+        order = sorted(range(len(self._labels)), key=lambda i: self._labels[i])
+        labels = [self._labels[i] for i in order]
+        self.S = np.stack([self._feats[i] for i in order]).astype(np.float32) if order \
+            else np.zeros((0, self.dim), dtype=np.float32)
+        self.s2 = np.einsum("ij,ij->i", self.S, self.S)
+        self.states = sorted(set(labels))
+        pos = {s: k for k, s in enumerate(self.states)}
+        self._col_state = np.array([pos[l] for l in labels], dtype=np.int32)
+        # 列已按状态排序：reduceat 的分段起点
+        self._state_starts = np.searchsorted(self._col_state, np.arange(len(self.states))).astype(np.int64)
+
+    @property
+    def ready(self) -> bool:
+        return self.S.shape[0] > 0
+
+    # ---- 分类 ----
+
+    def classify_batch(self, X: np.ndarray) -> List[Tuple[str, float, float]]:
+        """X: (n, d) → [(state, mse, margin)]；margin = 次优状态 mse - 最优 mse。"""
+        if not self.ready or X.shape[0] == 0:
+            return [(UNKNOWN, float("inf"), 0.0)] * X.shape[0]
+        x2 = np.einsum("ij,ij->i", X, X)
+        D = x2[:, None] - 2.0 * (X @ self.S.T) + self.s2[None, :]
+        per_state = np.minimum.reduceat(D, self._state_starts, axis=1) / float(self.dim)
+        best = np.argmin(per_state, axis=1)
+        out = []
+        for i, k in enumerate(best):
+            d = float(max(per_state[i, k], 0.0))
+            if per_state.shape[1] > 1:
+                second = float(np.partition(per_state[i], 1)[1])
+                margin = max(second - d, 0.0)
+            else:
+                margin = 0.0
+            out.append((self.states[k] if d <= self.threshold else UNKNOWN, d, margin))
+        return out
+
+    def classify(self, crops: Dict[str, np.ndarray]) -> Tuple[str, float, float]:
+        return self.classify_batch(self.featurize(crops)[None, :])[0]
+
+    # ---- 持久化 ----
+
+    def save(self, path: str):
+        np.savez_compressed(
+            path, features=self.S, labels=np.array([self.states[k] for k in self._col_state]),
+            regions=json.dumps([[r.name, r.x, r.y, r.w, r.h] for r in self.regions]),
+            grid=np.array(self.grid), threshold=np.array(self.threshold))
+
+    @classmethod
+    def load(cls, path: str) -> "UiStateClassifier":
+        z = np.load(path, allow_pickle=False)
+        regions = [Region(n, x, y, w, h) for n, x, y, w, h in json.loads(str(z["regions"]))]
+        clf = cls(regions, tuple(int(v) for v in z["grid"]), float(z["threshold"]))
+        for f, l in zip(z["features"], z["labels"]):
+            clf.add_sample(str(l), f)
+        clf.build_index()
+        return clf
+
+
+# ============== Corpus / CLI ==============
+
+def _iter_corpus(root: str):
+    for sd in sorted(Path(root).iterdir()):
+        if sd.is_dir():
+            for p in sorted(sd.glob("*.npy")):
+                yield sd.name, np.load(p)
+
+
+def _synthetic_corpus(n_per_state: int = 20, w: int = 1280, h: int = 800, seed: int = 0):
+    # 每个状态的“画面”固定（seed 0），seed 只影响叠加的噪声
+    base_rnd, rnd = np.random.default_rng(0), np.random.default_rng(seed)
+    states = ["title_screen", "main_menu", "lobby", "in_game", "loading", "disconnected"]
+    bases = {s: base_rnd.integers(0, 255, (h // 40, w // 40, 3), dtype=np.uint8) for s in states}
+    for s in states:
+        big = np.repeat(np.repeat(bases[s], 40, axis=0), 40, axis=1)
+        for _ in range(n_per_state):
+            noise = rnd.integers(-12, 13, big.shape)
+            yield s, np.clip(big.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def _crops_for(mgr: CaptureManager, backend: RecordedFrameBackend, frame: np.ndarray, key: int = 1):
+    backend.frames[key] = [frame]
+    backend.seek(key, 0)
+    return mgr.grab(str(key), key, force=True)
+
+
+def build_from_corpus(samples, regions=DEFAULT_REGIONS, downscale: int = 4,
+                      threshold: float = 0.02) -> UiStateClassifier:
+    clf = UiStateClassifier(regions, threshold=threshold)
+    backend = RecordedFrameBackend({})
+    mgr = CaptureManager(backend, clf.regions, downscale=downscale, max_fps=0)
+    for state, frame in samples:
+        clf.add_sample(state, clf.featurize(_crops_for(mgr, backend, frame)).copy())
+    clf.build_index()
+    return clf
+
+
+def _bench(clf: UiStateClassifier, samples, targets: int, downscale: int):
+    backend = RecordedFrameBackend({})
+    mgr = CaptureManager(backend, clf.regions, downscale=downscale, max_fps=0)
+    samples = list(samples)
+    X = np.empty((targets, clf.dim), dtype=np.float32)
+    correct = total = 0
+    t_cap = t_cls = 0.0
+    for i in range(0, len(samples), targets):
+        batch = samples[i:i + targets]
+        t0 = time.perf_counter()
+        for j, (_, frame) in enumerate(batch):
+            clf.featurize(_crops_for(mgr, backend, frame, key=j + 1), out=X[j])
+        t1 = time.perf_counter()
+        res = clf.classify_batch(X[:len(batch)])
+        t2 = time.perf_counter()
+        t_cap += t1 - t0
+        t_cls += t2 - t1
+        correct += sum(1 for (s, _), (p, _, _) in zip(batch, res) if s == p)
+        total += len(batch)
+    print(f"frames={total} states={len(clf.states)} signatures={clf.S.shape[0]} dim={clf.dim}")
+    print(f"  accuracy      : {correct / max(total, 1):.3f}")
+    print(f"  crop+feature  : {t_cap / max(total, 1) * 1e3:.3f} ms/target")
+    print(f"  classify      : {t_cls / max(total, 1) * 1e3:.3f} ms/target (batched x{targets})")
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="UI state signatures: build / benchmark")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build")
+    b.add_argument("--corpus", required=True)
+    b.add_argument("--out", default=str(Path(__file__).parent / "uimaps" / "states.npz"))
+    b.add_argument("--downscale", type=int, default=4)
+    b.add_argument("--threshold", type=float, default=0.02)
+    m = sub.add_parser("bench")
+    m.add_argument("--corpus")
+    m.add_argument("--signatures")
+    m.add_argument("--synthetic", action="store_true")
+    m.add_argument("--targets", type=int, default=5)
+    m.add_argument("--downscale", type=int, default=4)
+    a = ap.parse_args()
+
+    if a.cmd == "build":
+        clf = build_from_corpus(_iter_corpus(a.corpus), downscale=a.downscale, threshold=a.threshold)
+        clf.save(a.out)
+        print(f"saved {a.out}: states={clf.states} signatures={clf.S.shape[0]}")
+    else:
+        if a.synthetic:
+            train = list(_synthetic_corpus(5, seed=1))
+            clf = build_from_corpus(train, downscale=a.downscale)
+            _bench(clf, _synthetic_corpus(20, seed=2), a.targets, a.downscale)
+        else:
+            clf = UiStateClassifier.load(a.signatures) if a.signatures \
+                else build_from_corpus(_iter_corpus(a.corpus), downscale=a.downscale)
+            _bench(clf, _iter_corpus(a.corpus), a.targets, a.downscale)
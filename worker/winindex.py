@@ -0,0 +1,185 @@
+"""
+pid → 顶层窗口索引（单次 EnumWindows 建表 + 短 TTL + 显式失效）。
+
+窗口枚举通过 WindowEnumerator 接口注入：
+  - Win32WindowEnumerator：真实 win32gui 实现（仅 Windows）
+  - FakeWindowEnumerator：内存窗口表，用于 Linux 下单测 / 基准
+
+选窗规则与旧版 find_top_window_for_pid 一致：只看可见窗口，按枚举顺序，
+优先第一个有标题的，否则第一个。
+
+基准：python worker/winindex.py --targets 8 --windows 400
+"""
+import threading
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+
+class WindowInfo(NamedTuple):
+    hwnd: int
+    pid: int
+    visible: bool
+    title: str
+
+
+class WindowEnumerator:
+    """窗口枚举接口：enum_windows() 按 Z 序返回所有顶层窗口；is_window() 校验句柄。"""
+
+    def enum_windows(self) -> Iterable[WindowInfo]:
+        raise NotImplementedError
+
+    def is_window(self, hwnd: int) -> bool:
+        raise NotImplementedError
+
+
+class Win32WindowEnumerator(WindowEnumerator):
+    def __init__(self):
+        import win32gui
+        import win32process
+        self._gui = win32gui
+        self._proc = win32process
+
+    def enum_windows(self) -> List[WindowInfo]:
+        gui, proc = self._gui, self._proc
+        out: List[WindowInfo] = []
+
+        def cb(hwnd, _):
+            try:
+                if not gui.IsWindowVisible(hwnd):
+                    return
+                _, pid = proc.GetWindowThreadProcessId(hwnd)
+                out.append(WindowInfo(hwnd, pid, True, gui.GetWindowText(hwnd) or ""))
+            except Exception:
+                pass
+
+        gui.EnumWindows(cb, None)
+        return out
+
+    def is_window(self, hwnd: int) -> bool:
+        try:
+            return bool(hwnd) and bool(self._gui.IsWindow(hwnd))
+        except Exception:
+            return False
+
+
+class FakeWindowEnumerator(WindowEnumerator):
+    """内存窗口表：windows 为 WindowInfo 列表（按 Z 序）；enum_calls 记录枚举次数。"""
+
+    def __init__(self, windows: Optional[Iterable[WindowInfo]] = None):
+        self.windows: List[WindowInfo] = list(windows or [])
+        self.enum_calls = 0
+
+    def enum_windows(self) -> List[WindowInfo]:
+        self.enum_calls += 1
+        return list(self.windows)
+
+    def is_window(self, hwnd: int) -> bool:
+        return any(w.hwnd == hwnd for w in self.windows)
+
+
+def pick_top_window(wins: List[WindowInfo]) -> Optional[int]:
+    if not wins:
+        return None
+    for w in wins:
+        if w.title:
+            return w.hwnd
+    return wins[0].hwnd
+
+
+class WindowIndex:
+    """
+    一次枚举建立 pid → hwnd 表，ttl 秒内复用。
+      - top_window_for_pid(pid, max_age=None)：单个查询（max_age 可临时收紧新鲜度）
+      - snapshot(max_age=None)：整张 pid → hwnd 表
+      - invalidate()：进程启动/退出、句柄失效时调用，下次查询强制重扫
+    """
+
+    def __init__(self, enumerator: WindowEnumerator, ttl: float = 0.5):
+        self.enumerator = enumerator
+        self.ttl = float(ttl)
+        self._lock = threading.Lock()
+        self._table: Dict[int, int] = {}
+        self._built_at = 0.0
+        self._dirty = True
+        self.stats = {"rebuilds": 0, "hits": 0, "invalidations": 0, "last_rebuild_ms": 0.0}
+
+    def invalidate(self):
+        with self._lock:
+            self._dirty = True
+            self.stats["invalidations"] += 1
+
+    def _rebuild_locked(self):
+        t0 = time.perf_counter()
+        by_pid: Dict[int, List[WindowInfo]] = {}
+        for w in self.enumerator.enum_windows():
+            if w.visible:
+                by_pid.setdefault(w.pid, []).append(w)
+        self._table = {pid: pick_top_window(wins) for pid, wins in by_pid.items()}
+        self._built_at = time.monotonic()
+        self._dirty = False
+        self.stats["rebuilds"] += 1
+        self.stats["last_rebuild_ms"] = (time.perf_counter() - t0) * 1000.0
+
+    def snapshot(self, max_age: Optional[float] = None) -> Dict[int, int]:
+        age = self.ttl if max_age is None else min(self.ttl, float(max_age))
+        with self._lock:
+            if self._dirty or (time.monotonic() - self._built_at) > age:
+                self._rebuild_locked()
+            else:
+                self.stats["hits"] += 1
+            return self._table
+
+    def top_window_for_pid(self, pid: Optional[int], max_age: Optional[float] = None) -> Optional[int]:
+        if not pid:
+            return None
+        return self.snapshot(max_age).get(int(pid))
+
+    def is_window(self, hwnd: Optional[int]) -> bool:
+        return bool(hwnd) and self.enumerator.is_window(hwnd)
+
+
+# ============== Benchmark (fake table) ==============
+
+def _bench(n_targets: int, n_windows: int, rounds: int):
+    import random
+    rnd = random.Random(0)
+    pids = list(range(1000, 1000 + n_targets))
+    wins = [WindowInfo(0x10000 + i, rnd.randint(2000, 9000), rnd.random() < 0.6, f"w{i}" if i % 3 else "")
+            for i in range(n_windows)]
+    for k, pid in enumerate(pids):
+        wins.insert(rnd.randrange(len(wins) + 1), WindowInfo(0x90000 + k, pid, True, "Diablo II: Resurrected"))
+
+    def per_pid_scan(pid):
+        return pick_top_window([w for w in fake.enum_windows() if w.visible and w.pid == pid])
+
+    fake = FakeWindowEnumerator(wins)
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        old = {pid: per_pid_scan(pid) for pid in pids}
+    t_old = (time.perf_counter() - t0) / rounds
+    calls_old = fake.enum_calls / rounds
+
+    fake = FakeWindowEnumerator(wins)
+    idx = WindowIndex(fake, ttl=0.0)
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        idx.invalidate()
+        snap = idx.snapshot()
+        new = {pid: snap.get(pid) for pid in pids}
+    t_new = (time.perf_counter() - t0) / rounds
+    calls_new = fake.enum_calls / rounds
+
+    assert old == new, "index disagrees with per-pid scan"
+    print(f"targets={n_targets} windows={len(wins)} rounds={rounds}")
+    print(f"  per-pid EnumWindows : {t_old * 1e3:8.3f} ms/refresh  enum_calls={calls_old:.0f}")
+    print(f"  single-pass index   : {t_new * 1e3:8.3f} ms/refresh  enum_calls={calls_new:.0f}")
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="WindowIndex benchmark on a fake window table")
+    ap.add_argument("--targets", type=int, default=8)
+    ap.add_argument("--windows", type=int, default=400)
+    ap.add_argument("--rounds", type=int, default=200)
+    a = ap.parse_args()
+    _bench(a.targets, a.windows, a.rounds)
@@ -1,18 +1,29 @@
 import argparse
+import asyncio
 import json
+import os
+import queue
 import time
 import subprocess
 import threading
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Set
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Set
 
+# 模拟模式（Linux 压测 / 无 D2R 联调，见 simwin32.py）：必须在导入 psutil / win32 / pycaw 之前装好假模块
+SIM = None
+if os.environ.get("D2R_WORKER_SIM"):
+    import simwin32
+    SIM = simwin32.install(os.environ["D2R_WORKER_SIM"])
+    subprocess = SIM.subprocess
+
+import numpy as np
 import psutil
 from fastapi import FastAPI
 from fastapi import Body
 from pydantic import BaseModel
 import uvicorn
 
-from collections import deque
+from collections import OrderedDict, deque
 from threading import Lock
 
 # Win32
@@ -20,16 +31,27 @@ import win32gui
 import win32con
 import win32api
 import win32process
+import win32event
 import win32com.client  # resolve .lnk
 import ctypes
 from ctypes import wintypes
 import pythoncom
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.requests import Request
 
 from pycaw.pycaw import AudioUtilities, ISimpleAudioVolume
+from winindex import WindowIndex, Win32WindowEnumerator
+from proctrack import D2RProcessTracker
+from foreground import (AudioFollower, PollingForegroundSource, WinEventForegroundSource,
+                        run_with_fallback)
+from readiness import ReadinessProbe, ReadinessWaiter, StepSpec, CpuSettle
+from capture import CaptureManager, Win32GdiBackend
+from uistate import UiStateClassifier, UNKNOWN
+from metrics import MetricsRegistry, ResourceCollector, render_json, render_prometheus
+from spans import SpanStore
 from threading import Thread
-from contextlib import asynccontextmanager
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
 
 CLICK_LOCK = threading.RLock()  # 可重入，防止同一线程嵌套调用死锁
 AUDIO_LOCK = Lock()
@@ -59,6 +81,95 @@ def clip_cursor_box(absx: int, absy: int, half: int = 1):
 def reset_clip_cursor():
     user32.ClipCursor(None)
 
+# ============== COM service thread ==============
+# COM 工作在长驻的 STA 线程里做：只 CoInitialize 一次，Shell 对象 / 音频接口都属于该 apartment，
+# 其它线程通过队列投递。STA 必须泵消息（否则 COM 回调与跨 apartment 调用会卡住）：
+# 线程阻塞在 MsgWaitForMultipleObjects(事件, QS_ALLINPUT) 上——投递时 SetEvent 唤醒并取空队列，
+# 有窗口消息时唤醒并 PumpWaitingMessages；空闲时不轮询、不占 CPU。
+
+class ComService:
+    def __init__(self, name: str = "com-service"):
+        self.name = name
+        self._q: "queue.Queue[tuple]" = queue.Queue()
+        self._evt = win32event.CreateEvent(None, False, False, None)  # 自动复位
+        self._thread: Optional[Thread] = None
+        self._start_lock = Lock()
+        self._shell = None
+        self.stats = {"calls": 0, "errors": 0, "wakeups": 0, "pumps": 0}
+
+    def start(self):
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = Thread(target=self._run, daemon=True, name=self.name)
+            self._thread.start()
+
+    @property
+    def shell(self):
+        # 只能在服务线程里访问
+        if self._shell is None:
+            self._shell = win32com.client.Dispatch("WScript.Shell")
+        return self._shell
+
+    def _run(self):
+        pythoncom.CoInitialize()
+        try:
+            while True:
+                rc = win32event.MsgWaitForMultipleObjects(
+                    [self._evt], False, win32event.INFINITE, win32event.QS_ALLINPUT)
+                self.stats["wakeups"] += 1
+                if rc == win32event.WAIT_OBJECT_0 + 1:   # 有消息
+                    self.stats["pumps"] += 1
+                    pythoncom.PumpWaitingMessages()
+                    continue
+                self._drain()
+        finally:
+            self._shell = None
+            try:
+                pythoncom.CoUninitialize()
+            except Exception:
+                pass
+
+    def _drain(self):
+        while True:
+            try:
+                fn, args, fut = self._q.get_nowait()
+            except queue.Empty:
+                return
+            if fut is not None and not fut.set_running_or_notify_cancel():
+                continue
+            try:
+                res = fn(*args)
+                self.stats["calls"] += 1
+                if fut is not None:
+                    fut.set_result(res)
+            except BaseException as e:
+                self.stats["errors"] += 1
+                if fut is not None:
+                    fut.set_exception(e)
+            pythoncom.PumpWaitingMessages()  # 调用之间处理调用期间积下的回调
+
+    def _put(self, item: tuple):
+        self.start()
+        self._q.put(item)
+        win32event.SetEvent(self._evt)
+
+    def submit(self, fn: Callable, *args) -> Future:
+        fut: Future = Future()
+        self._put((fn, args, fut))
+        return fut
+
+    def post(self, fn: Callable, *args):
+        """不关心结果的投递（例如静音切换），保持先后顺序。"""
+        self._put((fn, args, None))
+
+    def call(self, fn: Callable, *args, timeout: float = 10.0):
+        if threading.current_thread() is self._thread:
+            return fn(*args)
+        return self.submit(fn, *args).result(timeout=timeout)
+
+COM = ComService()                     # 音频会话（AudioSessionCache）+ .lnk 解析（WScript.Shell）
+
 def _is_d2r_session(session) -> bool:
     try:
         p = session.Process
@@ -67,50 +178,84 @@ def _is_d2r_session(session) -> bool:
     except Exception:
         return False
 
-def _set_mute_for_pid(pid: int, mute: bool):
-    try:
-        pythoncom.CoInitialize()
-        sessions = AudioUtilities.GetAllSessions()
-        for s in sessions:
+class AudioSessionCache:
+    """
+    D2R 音频会话缓存：pid → [ISimpleAudioVolume]，并记住每个 pid 上次设置的静音状态。
+      - apply(active_pid) 只对“期望状态与上次不同”的 pid 调 SetMute
+      - 会话全量枚举只在缓存失效时做：首次、有 D2R pid 还没有会话（限频）、SetMute 失败
+      - 进程退出：drop_pid() 只登记，下次 apply 时在音频线程里清理
+    COM 接口属于创建它的 apartment，所以 apply/refresh 只在 COM 服务线程里调用。
+    """
+    MISSING_REFRESH_SEC = 2.0
+
+    def __init__(self, known_d2r_pids: Callable[[], List[int]] = lambda: []):
+        self.known_d2r_pids = known_d2r_pids
+        self._vols: Dict[int, list] = {}
+        self._muted: Dict[int, bool] = {}
+        self._stale = True
+        self._last_refresh = 0.0
+        self._lock = Lock()
+        self._dropped: Set[int] = set()
+        self.stats = {"refreshes": 0, "set_mute": 0, "skipped": 0, "errors": 0}
+
+    def invalidate(self):
+        self._stale = True
+
+    def drop_pid(self, pid: int):
+        # 任意线程可调
+        with self._lock:
+            self._dropped.add(pid)
+
+    def _refresh(self):
+        vols: Dict[int, list] = {}
+        for sess in AudioUtilities.GetAllSessions():
             try:
-                if not _is_d2r_session(s): 
-                    continue
-                if not s.Process or s.Process.pid != pid:
+                pid = getattr(sess, "ProcessId", None) or (sess.Process.pid if sess.Process else None)
+                if not pid or not (D2R_TRACKER.contains(pid) or _is_d2r_session(sess)):
                     continue
-                vol = s._ctl.QueryInterface(ISimpleAudioVolume)
-                vol.SetMute(1 if mute else 0, None)
+                vols.setdefault(pid, []).append(sess._ctl.QueryInterface(ISimpleAudioVolume))
             except Exception:
                 continue
-    finally:
-        try:
-            pythoncom.CoUninitialize()
-        except Exception:
-            pass
-
-def _mute_all_d2r_except(active_pid: int | None):
-    """active_pid 为 None 时 → 全部 D2R 静音"""
-    # 先收集所有 D2R 的 PID
-    d2r_pids = set()
-    try:
-        pythoncom.CoInitialize()
-        sessions = AudioUtilities.GetAllSessions()
-        for s in sessions:
+        # 新出现的会话不知道当前静音状态 → 清掉记录，下次一定会设置
+        self._muted = {pid: m for pid, m in self._muted.items() if pid in vols and len(vols[pid]) == len(self._vols.get(pid, []))}
+        self._vols = vols
+        self._stale = False
+        self._last_refresh = time.monotonic()
+        self.stats["refreshes"] += 1
+
+    def apply(self, active_pid: Optional[int]):
+        """active_pid 为 None 时 → 全部 D2R 静音"""
+        with self._lock:
+            dropped, self._dropped = self._dropped, set()
+        for pid in dropped:
+            self._vols.pop(pid, None)
+            self._muted.pop(pid, None)
+        if not self._stale and (time.monotonic() - self._last_refresh) > self.MISSING_REFRESH_SEC:
+            # 有 D2R 进程还没有会话（刚启动、刚开始出声）→ 重新枚举一次
+            if any(pid not in self._vols for pid in self.known_d2r_pids()):
+                self._stale = True
+        if self._stale:
+            self._refresh()
+        for pid, vols in list(self._vols.items()):
+            mute = active_pid is None or pid != active_pid
+            if self._muted.get(pid) == mute:
+                self.stats["skipped"] += 1
+                continue
             try:
-                if _is_d2r_session(s) and s.Process:
-                    d2r_pids.add(s.Process.pid)
+                for v in vols:
+                    v.SetMute(1 if mute else 0, None)
+                    self.stats["set_mute"] += 1
+                self._muted[pid] = mute
             except Exception:
-                continue
-    finally:
-        try:
-            pythoncom.CoUninitialize()
-        except Exception:
-            pass
+                self.stats["errors"] += 1
+                self._muted.pop(pid, None)
+                self._stale = True  # 会话已失效，下次重建
 
-    # 执行静音/解静音
-    for pid in list(d2r_pids):
-        _set_mute_for_pid(pid, mute=(active_pid is None or pid != active_pid))
-    if active_pid is not None:
-        _set_mute_for_pid(active_pid, mute=False)
+AUDIO_SESSIONS = AudioSessionCache(known_d2r_pids=lambda: D2R_TRACKER.pids())
+
+def _mute_all_d2r_except(active_pid: int | None):
+    """active_pid 为 None 时 → 全部 D2R 静音（只对状态变化的会话调用 SetMute）；在 COM 线程执行"""
+    COM.post(AUDIO_SESSIONS.apply, active_pid)
 
 def _get_foreground_pid() -> int | None:
     try:
@@ -131,31 +276,34 @@ def _is_pid_d2r(pid: int | None) -> bool:
     except Exception:
         return False
 
-def _audio_follow_foreground_loop():
-    """后台守护线程：根据系统前台窗口自动管理 D2R 静音"""
-    pythoncom.CoInitialize()
-    last_active_pid = object()  # 任意不同初值
+def _pid_of_hwnd(hwnd: int) -> Optional[int]:
     try:
-        while True:
-            if not AUDIO_AUTO_FOLLOW_FOREGROUND:
-                time.sleep(0.5)
-                continue
-            pid = _get_foreground_pid()
-            # 只有前台变化时才动作，避免无谓调用
-            if pid != last_active_pid:
-                last_active_pid = pid
-                if _is_pid_d2r(pid):
-                    # 只让这个 D2R 发声，其它 D2R 全静音
-                    _mute_all_d2r_except(pid)
-                else:
-                    # 前台不是 D2R → 所有 D2R 全静音
-                    _mute_all_d2r_except(None)
-            time.sleep(0.2)  # 200ms 轮询，足够灵敏
-    finally:
-        try:
-            pythoncom.CoUninitialize()
-        except Exception:
-            pass
+        _, pid = win32process.GetWindowThreadProcessId(hwnd)
+        return pid
+    except Exception:
+        return None
+
+def _is_pid_d2r_fast(pid: Optional[int]) -> bool:
+    # 进程表里有就不用再 psutil 查名字
+    return D2R_TRACKER.contains(pid) or _is_pid_d2r(pid)
+
+AUDIO_FOLLOWER = AudioFollower(
+    is_d2r=_is_pid_d2r_fast,
+    apply=_mute_all_d2r_except,
+    enabled=lambda: AUDIO_AUTO_FOLLOW_FOREGROUND,
+)
+
+def _audio_follow_foreground_loop():
+    """后台守护线程：前台窗口变化事件驱动 D2R 静音；hook 装不上时退回 200ms 轮询。
+    本线程只泵消息，真正的音频 COM 调用投递给 COM 服务线程。"""
+    run_with_fallback(
+        [
+            lambda: WinEventForegroundSource(_pid_of_hwnd, get_pid=_get_foreground_pid),
+            lambda: PollingForegroundSource(_get_foreground_pid, interval=0.2),
+        ],
+        AUDIO_FOLLOWER.on_foreground,
+        on_switch=lambda name, e: log_event("system", f"audio-follow: source {name} failed ({e}), falling back"),
+    )
 
 
 
@@ -168,18 +316,104 @@ def _is_admin() -> bool:
     except Exception:
         return False
 
-# ============== Global event queue for UI polling ==============
-LOGQ = deque(maxlen=3000)
+# ============== Global event log (seq ring buffer, multi-consumer) ==============
+# 每条事件带单调递增的 seq；读者各自持有游标（after=N），读操作不会消费数据，
+# 因此多个 orchestrator / curl 同时读取互不影响。溢出的事件以 dropped 计数返回。
+
+class EventRing:
+    def __init__(self, capacity: int = 3000):
+        self.capacity = max(1, int(capacity))
+        self._buf: List[Optional[dict]] = [None] * self.capacity
+        self._last_seq = 0          # 最新一条的 seq（0 表示还没有事件）
+        self.boot_id = f"{int(time.time() * 1000):x}"  # worker 重启后游标需重置
+
+    @property
+    def last_seq(self) -> int:
+        return self._last_seq
+
+    @property
+    def first_seq(self) -> int:
+        return max(1, self._last_seq - self.capacity + 1)
+
+    def append(self, ev: dict) -> int:
+        # 调用方持有 LOGQ_LOCK
+        self._last_seq += 1
+        ev["seq"] = self._last_seq
+        self._buf[self._last_seq % self.capacity] = ev
+        return self._last_seq
+
+    def read_after(self, after: int, max_items: int) -> dict:
+        """返回 seq > after 的最多 max_items 条；调用方持有 LOGQ_LOCK（只做一次切片拷贝）。"""
+        last = self._last_seq
+        after = int(after or 0)
+        if after > last:
+            after = 0  # 游标来自上一个进程（或非法值）→ 从头读
+        first = self.first_seq
+        start = max(after + 1, first)
+        dropped = max(0, start - (after + 1)) if last else 0
+        end = min(last, start + max(0, int(max_items)) - 1)
+        if end < start:
+            return {"events": [], "next": max(after, end), "dropped": dropped, "last_seq": last}
+        i0, i1 = start % self.capacity, end % self.capacity
+        if i0 <= i1:
+            out = self._buf[i0:i1 + 1]
+        else:
+            out = self._buf[i0:] + self._buf[:i1 + 1]
+        return {"events": out, "next": end, "dropped": dropped, "last_seq": last}
+
+
+LOGQ = EventRing(capacity=3000)
 LOGQ_LOCK = Lock()
+_LEGACY_DRAIN_CURSOR = 0  # 仅供旧版 /drain_logs 使用的服务端游标
+
+# 步骤级 span（resolve / spawn / window_wait / 点击 / 输入 …），随动作响应返回，GET /spans 查询
+SPANS = SpanStore(maxlen=20000)
+
+# SSE 订阅者：(event loop, asyncio.Event)；log_event 从任意线程唤醒它们
+_EVENT_WAITERS: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+
+def _notify_event_waiters():
+    for loop, ev in list(_EVENT_WAITERS):
+        try:
+            loop.call_soon_threadsafe(ev.set)
+        except RuntimeError:
+            # loop 已关闭
+            _EVENT_WAITERS.discard((loop, ev))
 
 def log_event(target_id: str | None, msg: str):
+    ev = {"ts": time.time(), "target_id": str(target_id), "msg": msg}
     with LOGQ_LOCK:
-        LOGQ.append({"target_id": str(target_id), "msg": msg})
+        LOGQ.append(ev)
+    if _EVENT_WAITERS:
+        _notify_event_waiters()
+
+def read_events(after: int = 0, max_items: int = 200) -> dict:
+    with LOGQ_LOCK:
+        res = LOGQ.read_after(after, max_items)
+    res["boot_id"] = LOGQ.boot_id
+    return res
 
 def sleep_log(target_id: Optional[str], seconds: float):
+    seconds = float(seconds)
     if seconds > 1.0 and target_id is not None:
         log_event(target_id, f"sleep {seconds:.1f}s")
-    time.sleep(seconds)
+    job = getattr(_JOB_CTX, "job", None)
+    with SPANS.span("sleep", target_id, sec=seconds):
+        if job is None:
+            time.sleep(seconds)
+        elif job.cancel_evt.wait(seconds):
+            # 在 job 线程内：sleep 可被 /jobs/{id}/cancel 打断
+            raise JobCancelled(job.id)
+
+@contextmanager
+def span_lock(lock, name: str, target_id: Optional[str]):
+    """with lock，但把等锁的时间记成一个 span（JOIN_LOCK 排队常常是耗时大头）。"""
+    with SPANS.span(name, target_id):
+        lock.acquire()
+    try:
+        yield
+    finally:
+        lock.release()
 
 # ---- Unified return helper (always logs) ----
 
@@ -190,6 +424,167 @@ def log_and_return(target_id: Optional[str], payload: dict):
         pass
     return payload
 
+# ============== Jobs: async queue for long actions ==============
+# 长动作（launch / join / bo / leave / post_launch …）以 job 形式提交：
+# 提交立刻返回 job_id；同一 target 的 job 在它自己的队列里串行执行（有上限），
+# 不同 target 并行。sleep_log 在 job 线程内可被取消。
+# 注册时可指定 lane：该 action 走 target 的另一条队列（如 post_launch 动辄数分钟，
+# 不应挡住随后提交的 join / leave）。
+
+class JobCancelled(Exception):
+    pass
+
+_JOB_CTX = threading.local()  # 当前线程正在执行的 job（或 batch）
+_BATCH_CTX = threading.local()  # batch 内共享的快照（uimap 等）
+
+JOB_STATES_FINAL = ("done", "failed", "cancelled")
+
+class Job:
+    def __init__(self, job_id: str, action: str, target_id: str, args: dict, ctx: Optional[dict] = None):
+        self.id = job_id
+        self.action = action
+        self.target_id = target_id
+        self.queue = target_id      # 所在队列：target_id 或 "target_id@lane"
+        self.args = args or {}
+        self.status = "queued"      # queued | running | done | failed | cancelled
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.cancel_evt = threading.Event()
+        self.done_evt = threading.Event()   # 进入终态时置位（batch 按它等待）
+        self.ctx = ctx or {}                # 执行时带入线程的上下文，如 batch 固定的 uimap
+
+    @property
+    def is_final(self) -> bool:
+        return self.status in JOB_STATES_FINAL
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id, "action": self.action, "target_id": self.target_id,
+            "status": self.status, "result": self.result, "error": self.error,
+            "created": self.created, "started": self.started, "finished": self.finished,
+        }
+
+class JobManager:
+    def __init__(self, max_queue_per_target: int = 8, keep_finished: int = 500):
+        self.max_queue_per_target = max_queue_per_target
+        self.keep_finished = keep_finished
+        self._lock = Lock()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queues: Dict[str, deque] = {}
+        self._running: Dict[str, Job] = {}
+        self._handlers: Dict[str, Callable[[str, dict], dict]] = {}
+        self._lanes: Dict[str, str] = {}
+        self._seq = 0
+
+    def register(self, action: str, fn: Callable[[str, dict], dict], lane: str = ""):
+        self._handlers[action] = fn
+        if lane:
+            self._lanes[action] = lane
+
+    def handler(self, action: str) -> Optional[Callable[[str, dict], dict]]:
+        return self._handlers.get(action)
+
+    @property
+    def actions(self) -> List[str]:
+        return sorted(self._handlers.keys())
+
+    def submit(self, action: str, target_id: str, args: Optional[dict] = None, ctx: Optional[dict] = None) -> Job:
+        """队列满抛 OverflowError，未知 action 抛 KeyError。"""
+        if action not in self._handlers:
+            raise KeyError(action)
+        target_id = str(target_id)
+        lane = self._lanes.get(action)
+        key = f"{target_id}@{lane}" if lane else target_id
+        with self._lock:
+            q = self._queues.setdefault(key, deque())
+            if len(q) >= self.max_queue_per_target:
+                raise OverflowError(f"job queue full for target {key} ({len(q)})")
+            self._seq += 1
+            job = Job(f"{target_id}-{self._seq}", action, target_id, args or {}, ctx)
+            job.queue = key
+            self._jobs[job.id] = job
+            q.append(job)
+            start_runner = key not in self._running
+            if start_runner:
+                self._running[key] = None  # 占位：runner 线程已在路上
+            self._trim_locked()
+        log_event(target_id, f"job {job.id}: queued {action}" + (f" (lane {lane})" if lane else ""))
+        if start_runner:
+            Thread(target=self._run_target, args=(key,), daemon=True,
+                   name=f"jobs-{key}").start()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self, target_id: Optional[str] = None) -> List[dict]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [j.to_dict() for j in jobs if target_id is None or j.target_id == str(target_id)]
+
+    def queue_depth(self, target_id: str) -> int:
+        with self._lock:
+            return len(self._queues.get(str(target_id)) or ())
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.is_final:
+                return job
+            job.cancel_evt.set()
+            q = self._queues.get(job.queue)
+            if job.status == "queued" and q is not None and job in q:
+                q.remove(job)
+                job.status = "cancelled"
+                job.finished = time.time()
+                job.done_evt.set()
+        log_event(job.target_id, f"job {job.id}: cancel requested ({job.status})")
+        return job
+
+    def _trim_locked(self):
+        extra = len(self._jobs) - self.keep_finished
+        if extra <= 0:
+            return
+        for jid in [jid for jid, j in self._jobs.items() if j.is_final][:extra]:
+            self._jobs.pop(jid, None)
+
+    def _run_target(self, key: str):
+        while True:
+            with self._lock:
+                q = self._queues.get(key)
+                if not q:
+                    self._running.pop(key, None)
+                    return
+                job = q.popleft()
+                self._running[key] = job
+                job.status = "running"
+                job.started = time.time()
+            target_id = job.target_id
+            _JOB_CTX.job = job
+            _BATCH_CTX.uimap = job.ctx.get("uimap")
+            try:
+                res = self._handlers[job.action](target_id, job.args)
+                job.result = res
+                job.status = "done" if (res or {}).get("ok", True) else "failed"
+            except JobCancelled:
+                job.status = "cancelled"
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                job.status = "failed"
+            finally:
+                _JOB_CTX.job = None
+                _BATCH_CTX.uimap = None
+                job.finished = time.time()
+                job.done_evt.set()
+            log_event(target_id, f"job {job.id}: {job.action} {job.status} "
+                                 f"in {int((job.finished - job.started) * 1000)} ms")
+
+JOBS = JobManager()
+
 # ============== Helpers: Windows / Input ==============
 
 # === Smooth mouse move settings (可按需微调) ===
@@ -352,6 +747,9 @@ def _hwnd_chain_contains(parent: int, child: int) -> bool:
 def uimap_point_client(hwnd: int, spec) -> Tuple[int,int]:
     """支持 [rx, ry] 百分比或 (x, y) 像素（client-physical），返回 client-physical。"""
     w, h = get_client_size(hwnd)
+    return uimap_point_for_size(w, h, spec)
+
+def uimap_point_for_size(w: int, h: int, spec) -> Tuple[int,int]:
     try:
         x, y = spec
     except Exception:
@@ -371,13 +769,19 @@ def ensure_hwnd(target_id: str, cur_hwnd: int | None = None) -> int:
             return cur_hwnd
     except Exception:
         pass
-    # 用你的目标注册表刷新
+    # 用你的目标注册表刷新（句柄已失效 → 索引也作废）
+    WINDOWS.invalidate()
     refresh_targets()
     hwnd = TARGET_MAP.get(target_id)
     if not hwnd or not win32gui.IsWindow(hwnd):
         raise RuntimeError(f"target {target_id} not found or invalid hwnd")
     return hwnd
 
+# 延迟直方图（路由 + 输入原语）；资源采样见 METRICS_COLLECTOR
+METRICS = MetricsRegistry()
+
+@METRICS.timed("bg_mouse_click_client")
+@SPANS.wrap("click", lambda hwnd, cx, cy, **kw: {"x": cx, "y": cy})
 def bg_mouse_click_client(hwnd: int, cx: int, cy: int, target_id: str | None = None):
     # 0) 点击前校验/恢复 hwnd
     if target_id:
@@ -421,6 +825,8 @@ def bg_mouse_click_client(hwnd: int, cx: int, cy: int, target_id: str | None = N
     if target_id:
         log_event(target_id, f"winmsg+cursor: sent to {th:08X} at client@{tx},{ty}; abs@{absx},{absy}")
 
+@METRICS.timed("bg_type_text")
+@SPANS.wrap("type", lambda hwnd, s, *a, **kw: {"chars": len(s or "")})
 def bg_type_text(hwnd: int, s: str, delay: float = 0.0, target_id: str | None = None):
     if not s:
         return
@@ -434,6 +840,8 @@ def bg_type_text(hwnd: int, s: str, delay: float = 0.0, target_id: str | None =
         log_event(target_id, f"type text '{s}' via KEYDOWN+CHAR")
 
 
+@METRICS.timed("bg_send_hotkey")
+@SPANS.wrap("hotkey", lambda hwnd, vks, *a, **kw: {"vks": list(vks)})
 def bg_send_hotkey(hwnd: int, vks: List[int], hold_ms: int = 30, target_id: Optional[str] = None):
     """
     发送组合键，例如 Ctrl+A:
@@ -471,18 +879,16 @@ def ui_press_esc(hwnd: int, target_id: Optional[str] = None):
 
 # ============== UiMap loader ==============
 
-def load_uimap(path: str):
+def _read_uimap_file(path: str):
     p = Path(path)
     if not p.exists():
-        with LOGQ_LOCK:
-            LOGQ.append({"target_id": "system", "msg": f"uimap: file not found: {path}"})
+        log_event("system", f"uimap: file not found: {path}")
         return {}
     try:
         with p.open("r", encoding="utf-8") as f:
             data = json.load(f)
     except Exception as e:
-        with LOGQ_LOCK:
-            LOGQ.append({"target_id": "system", "msg": f"uimap: parse error: {e}"})
+        log_event("system", f"uimap: parse error: {e}")
         return {}
     out = {}
     for k, v in data.items():
@@ -490,6 +896,75 @@ def load_uimap(path: str):
             out[k] = (float(v[0]), float(v[1]))
     return out
 
+class UiMapCache:
+    """
+    UiMap 缓存：文件 (mtime, size) 不变就不重新解析；文件不存在也缓存（sig 为 None），
+    直到文件出现 / mtime 变化才重新读，避免每次调用都报 file not found 并清空点表；
+    每个 (hwnd, client_w, client_h) 预先算好所有 key 的 client 像素坐标，
+    点击序列只剩查表。文件变化时两级缓存一起作废。
+    """
+    MAX_POINT_TABLES = 64
+
+    def __init__(self):
+        self._lock = Lock()
+        self._files: Dict[str, Tuple[Tuple[int, int], dict]] = {}   # path -> ((mtime_ns, size), data)
+        self._points: "OrderedDict[tuple, Dict[str, Tuple[int, int]]]" = OrderedDict()
+        self.stats = {"map_hits": 0, "map_reloads": 0, "point_hits": 0, "point_builds": 0}
+
+    def _sig(self, path: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = Path(path).stat()
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def get(self, path: str) -> dict:
+        pinned = getattr(_BATCH_CTX, "uimap", None)
+        if pinned is not None and pinned[0] == path:
+            # batch 内：整批共用一次加载结果，不再 stat
+            self.stats["map_hits"] += 1
+            return pinned[1]
+        sig = self._sig(path)
+        with self._lock:
+            cached = self._files.get(path)
+            if cached and cached[0] == sig:
+                self.stats["map_hits"] += 1
+                return cached[1]
+        data = _read_uimap_file(path)
+        with self._lock:
+            self._files[path] = (sig, data)
+            self._points = OrderedDict((k, v) for k, v in self._points.items() if k[0] != path)
+            self.stats["map_reloads"] += 1
+        if sig is not None:
+            log_event("system", f"uimap: loaded {path} keys={len(data)}")
+        return data
+
+    def points(self, path: str, hwnd: int, w: int, h: int) -> Dict[str, Tuple[int, int]]:
+        ui = self.get(path)
+        key = (path, int(hwnd), int(w), int(h))
+        with self._lock:
+            tbl = self._points.get(key)
+            if tbl is not None and len(tbl) == len(ui):
+                self.stats["point_hits"] += 1
+                return tbl
+        tbl = {k: uimap_point_for_size(w, h, v) for k, v in ui.items()}
+        with self._lock:
+            self._points[key] = tbl
+            while len(self._points) > self.MAX_POINT_TABLES:
+                self._points.popitem(last=False)
+            self.stats["point_builds"] += 1
+        return tbl
+
+UIMAP_CACHE = UiMapCache()
+
+def load_uimap(path: str):
+    return UIMAP_CACHE.get(path)
+
+def uimap_points(hwnd: int, path: Optional[str] = None) -> Dict[str, Tuple[int, int]]:
+    """一次 GetClientRect，返回该窗口当前尺寸下所有 UiMap key 的 client 像素坐标。"""
+    w, h = get_client_size(hwnd)
+    return UIMAP_CACHE.points(path or UIMAP_PATH, hwnd, w, h)
+
 import win32con, win32gui, win32api
 
 GA_PARENT = 1
@@ -607,23 +1082,16 @@ def _do_goto_lobby(target_id: str, hwnd: int) -> dict:
 
     w, h = get_client_size(hwnd)
     log_client_geom(hwnd, target_id)
+    pts = UIMAP_CACHE.points(UIMAP_PATH, hwnd, w, h)
 
-    rx, ry = ui["OnlineTab"]
-    cx = int(rx * max(w - 1, 1)) if 0 <= rx <= 1 and 0 <= ry <= 1 else int(rx)
-    cy = int(ry * max(h - 1, 1)) if 0 <= rx <= 1 and 0 <= ry <= 1 else int(ry)
-    log_event(target_id, f"goto_lobby: OnlineTab client@{cx},{cy} from ratio@{rx},{ry}")
-
-    cx, cy = uimap_point_client(hwnd, tuple(ui["OnlineTab"]))
+    cx, cy = pts["OnlineTab"]
+    log_event(target_id, f"goto_lobby: OnlineTab client@{cx},{cy} from ratio@{ui['OnlineTab']}")
     bg_mouse_click_client(hwnd, cx, cy, target_id=target_id)
 
     sleep_log(target_id, 1.0)
 
-    rx, ry = ui["GoToLobbyButton"]
-    cx = int(rx * max(w - 1, 1)) if 0 <= rx <= 1 and 0 <= ry <= 1 else int(rx)
-    cy = int(ry * max(h - 1, 1)) if 0 <= rx <= 1 and 0 <= ry <= 1 else int(ry)
-    log_event(target_id, f"goto_lobby: GoToLobbyButton client@{cx},{cy} from ratio@{rx},{ry}")
-
-    cx, cy = uimap_point_client(hwnd, tuple(ui["GoToLobbyButton"]))
+    cx, cy = pts["GoToLobbyButton"]
+    log_event(target_id, f"goto_lobby: GoToLobbyButton client@{cx},{cy} from ratio@{ui['GoToLobbyButton']}")
     bg_mouse_click_client(hwnd, cx, cy, target_id=target_id)
 
     log_event(target_id, "goto_lobby: done")
@@ -631,23 +1099,40 @@ def _do_goto_lobby(target_id: str, hwnd: int) -> dict:
 
 # ============== Shortcut / Launch helpers ==============
 
+# .lnk 解析结果缓存：(path, mtime_ns, size) → (target, args, cwd)
+LNK_CACHE: Dict[Tuple[str, int, int], Tuple[str, str, str]] = {}
+LNK_CACHE_STATS = {"hits": 0, "misses": 0}
+
+def _resolve_lnk_com(path: str) -> Tuple[str, str, str]:
+    # 在 COM 服务线程里执行，复用同一个 WScript.Shell
+    sc = COM.shell.CreateShortcut(path)
+    return sc.Targetpath or "", sc.Arguments or "", sc.WorkingDirectory or ""
+
 def _resolve_lnk_maybe(path_str: str):
     p = Path(path_str)
     cand = [p]
     if p.suffix.lower() != ".lnk":
         cand.append(p.with_suffix(p.suffix + ".lnk" if p.suffix else ".lnk"))
     for c in cand:
-        if c.exists() and c.is_file() and c.suffix.lower() == ".lnk":
-            pythoncom.CoInitialize()
-            try:
-                shell = win32com.client.Dispatch("WScript.Shell")
-                sc = shell.CreateShortcut(str(c))
-                return sc.Targetpath or "", sc.Arguments or "", sc.WorkingDirectory or ""
-            finally:
-                try:
-                    pythoncom.CoUninitialize()
-                except Exception:
-                    pass
+        if c.suffix.lower() != ".lnk":
+            continue
+        try:
+            st = c.stat()
+        except OSError:
+            continue
+        if not c.is_file():
+            continue
+        key = (str(c), st.st_mtime_ns, st.st_size)
+        hit = LNK_CACHE.get(key)
+        if hit is not None:
+            LNK_CACHE_STATS["hits"] += 1
+            return hit
+        LNK_CACHE_STATS["misses"] += 1
+        info = COM.call(_resolve_lnk_com, str(c))
+        for k in [k for k in LNK_CACHE if k[0] == key[0]]:
+            LNK_CACHE.pop(k, None)  # 同一路径的旧版本
+        LNK_CACHE[key] = info
+        return info
     return None
 
 
@@ -696,16 +1181,12 @@ def enumerate_windows_by_title(substr: str) -> List[int]:
     win32gui.EnumWindows(cb, None)
     return result
 
-def find_top_window_for_pid(pid: int) -> Optional[int]:
-    hwnds = []
-    def cb(hwnd, _):
-        if win32gui.IsWindowVisible(hwnd):
-            _, wpid = win32process.GetWindowThreadProcessId(hwnd)
-            if wpid == pid:
-                hwnds.append(hwnd)
-    win32gui.EnumWindows(cb, None)
-    titled = [h for h in hwnds if win32gui.GetWindowText(h)]
-    return titled[0] if titled else (hwnds[0] if hwnds else None)
+# pid → hwnd 索引：一次 EnumWindows 覆盖所有 target，TTL 内复用
+WINDOW_INDEX_TTL_SEC: float = 0.5
+WINDOWS = WindowIndex(Win32WindowEnumerator(), ttl=WINDOW_INDEX_TTL_SEC)
+
+def find_top_window_for_pid(pid: int, max_age: Optional[float] = None) -> Optional[int]:
+    return WINDOWS.top_window_for_pid(pid, max_age=max_age)
 
 import time
 import win32con
@@ -735,6 +1216,17 @@ def set_clipboard_text(text: str, retries: int = 5, delay_ms: int = 50):
 def _existing_assigned_pids() -> Set[int]:
     return {pid for pid in TARGET_PID.values() if pid}
 
+# D2R 进程表：后台每秒做一次 pid 集合差分；有增删时让窗口索引失效
+D2R_TRACKER = D2RProcessTracker(exe_name="d2r.exe", interval=1.0)
+D2R_TRACKER.subscribe(lambda added, removed: WINDOWS.invalidate())
+D2R_TRACKER.subscribe(lambda added, removed: [AUDIO_SESSIONS.drop_pid(pid) for pid, _ in removed])
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    # 不用 tracker 的快照（最多 1 个 interval 旧）：刚退出的进程会被误判为存活
+    return psutil.pid_exists(pid)
+
 def _iter_descendants(proc: psutil.Process):
     try:
         for child in proc.children(recursive=True):
@@ -754,16 +1246,23 @@ def refresh_targets():
 
     for tid, pid in list(TARGET_PID.items()):
         try:
-            if not pid or not psutil.pid_exists(pid):
+            if not _pid_alive(pid):
                 TARGET_PID.pop(tid, None)
                 TARGET_MAP.pop(tid, None)
         except Exception:
             TARGET_PID.pop(tid, None)
             TARGET_MAP.pop(tid, None)
+    CAPTURE.prune(TARGET_MAP)   # 已移除 target 的采集会话与 GDI 表面
 
+    if not TARGET_PID:
+        return
+    try:
+        snap = WINDOWS.snapshot()  # 单次枚举，O(targets + windows)
+    except Exception:
+        return
     for tid, pid in list(TARGET_PID.items()):
+        hwnd = snap.get(pid)
         try:
-            hwnd = find_top_window_for_pid(pid)
             if hwnd and win32gui.IsWindow(hwnd):
                 TARGET_MAP[tid] = hwnd
         except Exception:
@@ -771,16 +1270,7 @@ def refresh_targets():
 
 
 def discover_d2r_pids():
-    pids = []
-    for p in psutil.process_iter(["pid", "name", "create_time"]):
-        try:
-            name = (p.info.get("name") or "").lower()
-            if name == "d2r.exe":
-                pids.append((p.info.get("create_time", 0.0), p.info["pid"]))
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            continue
-    pids.sort(key=lambda x: x[0])
-    return [pid for _, pid in pids]
+    return D2R_TRACKER.pids()
 
 def _find_final_pid(proc: Optional[subprocess.Popen], exe_basename: Optional[str], start_time: float) -> Optional[int]:
     if proc and getattr(proc, "pid", None):
@@ -794,6 +1284,7 @@ def _find_final_pid(proc: Optional[subprocess.Popen], exe_basename: Optional[str
     if proc and getattr(proc, "pid", None):
         try:
             parent = psutil.Process(proc.pid)
+            assigned = _existing_assigned_pids()
             cand = []
             for ch in _iter_descendants(parent):
                 try:
@@ -805,12 +1296,19 @@ def _find_final_pid(proc: Optional[subprocess.Popen], exe_basename: Optional[str
                     continue
             cand.sort()
             for _, pid in reversed(cand):
-                if pid not in _existing_assigned_pids():
+                if pid not in assigned:
                     return pid
         except (psutil.NoSuchProcess, psutil.AccessDenied):
             pass
 
-    if exe_basename:
+    if exe_basename and exe_basename.lower() == D2R_TRACKER.exe_name:
+        # 刚 spawn 完：同步做一次增量刷新，再直接查 D2R 表
+        D2R_TRACKER.refresh()
+        cand = D2R_TRACKER.candidates_since(start_time - 1, exclude=_existing_assigned_pids())
+        if cand:
+            return cand[-1][0]
+    elif exe_basename:
+        assigned = _existing_assigned_pids()
         cand = []
         for p in psutil.process_iter(["pid", "name", "create_time"]):
             try:
@@ -818,7 +1316,7 @@ def _find_final_pid(proc: Optional[subprocess.Popen], exe_basename: Optional[str
                     continue
                 if p.info["create_time"] < start_time - 1:
                     continue
-                if p.info["pid"] in _existing_assigned_pids():
+                if p.info["pid"] in assigned:
                     continue
                 cand.append((p.info["create_time"], p.info["pid"]))
             except (psutil.NoSuchProcess, psutil.AccessDenied):
@@ -875,12 +1373,21 @@ def close_other_instance_handle(pid: int) -> (bool, str):
 TARGET_MAP: Dict[str, int] = {}
 TARGET_PID: Dict[str, int] = {}
 WORKER_NAME: str = "Worker-A"
+WORKER_VERSION = "2026.10"          # /health 上报；orchestrator 健康表展示
+WORKER_STARTED = time.time()
 WINDOW_TITLE_MATCH: str = "Diablo II"
 UIMAP_PATH: str = str(Path(__file__).parent/"uimaps"/"default.json")
 LAUNCHERS: Dict[str, dict] = {}
 POST_LAUNCH: dict = {"sequence": "default"}
 JOIN_LOCK = threading.Lock()
 
+# 资源采样：每 interval 秒一次（后台线程），/metrics 只读快照
+METRICS_COLLECTOR = ResourceCollector(lambda: dict(TARGET_PID), interval=2.0)
+
+# 画面采集（ROI + 降采样 + 每 target 限速）；regions 由状态识别等使用方注册
+CAPTURE = CaptureManager(SIM.capture_backend() if SIM else Win32GdiBackend(mode="bitblt"),
+                         regions=[], downscale=4, max_fps=2.0)
+
 # Aspect lock defaults (可被 config.json 覆盖)
 LOCK_ASPECT: bool = False
 ASPECT_W: int = 8
@@ -888,8 +1395,99 @@ ASPECT_H: int = 5
 ASPECT_ANCHOR: str = "topleft"   # "topleft" | "center"
 ASPECT_MODE: str = "auto"        # "auto" | "width" | "height"
 
+# ============== UI state (classifier) ==============
+# 签名文件存在时启用：CAPTURE 抓 ROI → UiStateClassifier 批量比距离。
+# 没有签名文件时所有检查返回 None（不阻塞、不改变旧流程）。
+UI_STATE_SIGNATURES: str = str(Path(__file__).parent / "uimaps" / "states.npz")
+UI_STATE_ENFORCE: bool = False   # True：动作前状态明确不符时直接失败
+UI_STATE: Optional[UiStateClassifier] = None
+
+def load_ui_state_classifier(path: str):
+    global UI_STATE
+    if not path or not Path(path).exists():
+        UI_STATE = None
+        log_event("system", f"ui_state: no signatures at {path} (state checks disabled)")
+        return
+    try:
+        UI_STATE = UiStateClassifier.load(path)
+        CAPTURE.set_regions(UI_STATE.regions)
+        log_event("system", f"ui_state: loaded {path} states={UI_STATE.states} n={UI_STATE.S.shape[0]}")
+    except Exception as e:
+        UI_STATE = None
+        log_event("system", f"ui_state: load failed {path}: {e}")
+
+def _target_for_hwnd(hwnd: int) -> str:
+    for tid, h in TARGET_MAP.items():
+        if h == hwnd:
+            return tid
+    return f"hwnd:{hwnd:08X}"
+
+def classify_targets(items: List[Tuple[str, int]], force: bool = False) -> Dict[str, dict]:
+    """[(target_id, hwnd)] → {target_id: {state, mse, margin, ms}}；一次矩阵运算分类全部 target。"""
+    if UI_STATE is None or not items:
+        return {}
+    t0 = time.perf_counter()
+    X = np.empty((len(items), UI_STATE.dim), dtype=np.float32)
+    ok_rows: List[Tuple[int, str]] = []
+    out: Dict[str, dict] = {}
+    for tid, hwnd in items:
+        crops = CAPTURE.grab(tid, hwnd, force=force) if hwnd else None
+        if crops is None:
+            out[tid] = {"state": UNKNOWN, "error": "capture failed"}
+            continue
+        UI_STATE.featurize(crops, out=X[len(ok_rows)])
+        ok_rows.append((len(ok_rows), tid))
+    for (i, tid), (st, mse, margin) in zip(ok_rows, UI_STATE.classify_batch(X[:len(ok_rows)])):
+        out[tid] = {"state": st, "mse": round(mse, 5), "margin": round(margin, 5)}
+    ms = (time.perf_counter() - t0) * 1000.0
+    for v in out.values():
+        v["ms"] = round(ms / len(items), 3)
+    return out
+
+def classify_target(target_id: str, hwnd: int, force: bool = False) -> Optional[dict]:
+    return classify_targets([(target_id, hwnd)], force=force).get(target_id)
+
+def ui_state_gate(target_id: str, hwnd: int, expect: Sequence[str], phase: str) -> Optional[str]:
+    """
+    动作前/后检查当前状态并记日志。UI_STATE_ENFORCE 且状态明确（非 unknown）不在 expect 中时，
+    返回错误字符串；否则返回 None。
+    """
+    with SPANS.span("ui_state", target_id, phase=phase) as sp:
+        res = classify_target(target_id, hwnd, force=True)
+        sp.set(state=(res or {}).get("state"))
+    if res is None:
+        return None
+    st = res.get("state")
+    log_event(target_id, f"ui_state {phase}: {st} (mse={res.get('mse')}, {res.get('ms')} ms)")
+    if UI_STATE_ENFORCE and expect and st != UNKNOWN and st not in expect:
+        return f"ui_state {phase}: expected {list(expect)}, got {st}"
+    return None
+
+def wait_for_ui_state(target_id: str, hwnd: int, expect: Sequence[str], timeout: float,
+                      poll: float = 0.5) -> Tuple[bool, float, Optional[str]]:
+    """等到状态 ∈ expect 或超时；没有分类器时退化为 sleep(timeout)。返回 (命中, 耗时, 最后状态)。"""
+    t0 = time.monotonic()
+    if UI_STATE is None:
+        sleep_log(target_id, timeout)
+        return False, time.monotonic() - t0, None
+    st = None
+    while True:
+        res = classify_target(target_id, hwnd) or {}
+        st = res.get("state")
+        el = time.monotonic() - t0
+        if st in expect:
+            return True, el, st
+        if el >= timeout:
+            return False, el, st
+        sleep_log(target_id, min(poll, timeout - el))
+
 # ============== API Models ==============
 
+def _model_dict(m: BaseModel) -> dict:
+    """pydantic v2 用 model_dump()（.dict() 已弃用并告警），v1 回退到 .dict()。"""
+    dump = getattr(m, "model_dump", None)
+    return dump() if dump is not None else m.dict()
+
 class FocusReq(BaseModel):
     target_id: str
 
@@ -933,6 +1531,9 @@ class CheckShortcutReq(BaseModel):
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 启动时拉起后台线程
+    COM.start()
+    D2R_TRACKER.start()
+    METRICS_COLLECTOR.start()
     t = Thread(target=_audio_follow_foreground_loop, daemon=True)
     t.start()
     yield
@@ -941,6 +1542,18 @@ async def lifespan(app: FastAPI):
 
 app = FastAPI(lifespan=lifespan)
 
+@app.middleware("http")
+async def _route_latency(request: Request, call_next):
+    t0 = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        # 用路由模板（/jobs/{job_id}）而不是实际路径做标签，避免基数爆炸
+        route = request.scope.get("route")
+        path = getattr(route, "path", None) or "<unmatched>"
+        METRICS.observe("worker_http_request_duration_seconds", "route",
+                        f"{request.method} {path}", time.perf_counter() - t0)
+
 @app.post("/check_shortcut")
 def check_shortcut(req: CheckShortcutReq):
     info = _resolve_lnk_maybe(req.shortcut_path)
@@ -958,6 +1571,76 @@ def name():
 def admin_status():
     return {"is_admin": _is_admin()}
 
+@app.get("/metrics")
+def metrics(format: str = "prometheus"):
+    """只读后台采样器的最近快照；format=json 返回 JSON。"""
+    snap = METRICS_COLLECTOR.snapshot()
+    if format == "json":
+        return {"ok": True, **render_json(snap, METRICS, WORKER_NAME), "collector": dict(METRICS_COLLECTOR.stats)}
+    return PlainTextResponse(render_prometheus(snap, METRICS, WORKER_NAME),
+                             media_type="text/plain; version=0.0.4")
+
+@app.get("/health")
+def health():
+    """轻量心跳：不做任何进程/窗口枚举，供 orchestrator 健康表与熔断探测使用。"""
+    return {"ok": True, "worker": WORKER_NAME, "version": WORKER_VERSION, "boot_id": LOGQ.boot_id,
+            "uptime_s": round(time.time() - WORKER_STARTED, 1), "is_admin": _is_admin(),
+            "time": time.time()}   # orchestrator 据此估计时钟偏移（trace 对齐 span）
+
+@app.get("/sim")
+def sim_state():
+    """模拟模式：虚拟进程 / 窗口 / UI 状态 / 故障注入配置的快照。"""
+    if not SIM:
+        return {"ok": False, "error": "not running in simulation mode"}
+    return {"ok": True, "worker": WORKER_NAME, **SIM.snapshot()}
+
+@app.post("/sim/config")
+def sim_config(update: dict = Body(...)):
+    """模拟模式：运行中调整延迟 / 故障概率，如 {"fail": {"join": 0.2}}。"""
+    if not SIM:
+        return {"ok": False, "error": "not running in simulation mode"}
+    with SIM._lock:
+        simwin32.merge_config(SIM.cfg, update)
+    return {"ok": True, "config": SIM.cfg}
+
+@app.get("/spans")
+def spans(target_id: Optional[str] = None, after: int = 0, limit: int = 500):
+    """最近的步骤级 span（有界环）；after 为 seq 游标。"""
+    return {"ok": True, "worker": WORKER_NAME, "spans": SPANS.recent(target_id, after, limit), **SPANS.stats()}
+
+@app.get("/uimap")
+def uimap_info():
+    ui = load_uimap(UIMAP_PATH)
+    return {"path": UIMAP_PATH, "keys": sorted(ui.keys()), "stats": dict(UIMAP_CACHE.stats)}
+
+@app.get("/post_launch/timings")
+def post_launch_timings(target_id: Optional[str] = None):
+    if target_id is not None:
+        return {"timings": {target_id: POST_LAUNCH_TIMINGS.get(target_id, [])}}
+    return {"timings": POST_LAUNCH_TIMINGS}
+
+@app.get("/capture/stats")
+def capture_stats():
+    return {"mode": getattr(CAPTURE.backend, "mode", None), "max_fps": CAPTURE.max_fps,
+            "downscale": CAPTURE.downscale, "regions": [r.name for r in CAPTURE.regions],
+            "sessions": CAPTURE.stats()}
+
+@app.get("/state")
+def ui_state(target_id: Optional[str] = None):
+    """当前 UI 状态；不带 target_id 时一次性分类本 worker 的全部 target。"""
+    if UI_STATE is None:
+        return {"ok": False, "error": "ui_state disabled (no signatures)", "signatures": UI_STATE_SIGNATURES}
+    if target_id is not None:
+        hwnd = TARGET_MAP.get(target_id)
+        if not hwnd:
+            refresh_targets()
+            hwnd = TARGET_MAP.get(target_id)
+        items = [(target_id, hwnd or 0)]
+    else:
+        refresh_targets()
+        items = list(TARGET_MAP.items())
+    return {"ok": True, "states": classify_targets(items, force=True)}
+
 @app.get("/pidmap")
 def pidmap():
     return {"pidmap": TARGET_PID}
@@ -981,55 +1664,73 @@ def close_handle(req: CloseHandleReq):
 
 @app.post("/launch")
 def launch(req: LaunchReq):
-    cfg = {"shortcut": req.shortcut_path, "args_append": ""}
+    return _do_launch(req.target_id, req.shortcut_path)
+
+@SPANS.traced("launch")
+def _do_launch(target_id: str, shortcut_path: Optional[str]) -> dict:
+    cfg = {"shortcut": shortcut_path, "args_append": ""}
 
     debug_steps = []
     t0 = time.time()
 
     try:
-        cmd, cwd = resolve_launcher(cfg)
+        with SPANS.span("resolve", target_id) as sp:
+            cmd, cwd = resolve_launcher(cfg)
+            sp.set(exe=cmd[0])
         debug_steps.append(f"resolve: exe={cmd[0]}")
         if len(cmd) > 1:
             debug_steps.append("resolve: args=" + " ".join(cmd[1:]))
         if cwd:
             debug_steps.append(f"resolve: cwd={cwd}")
         debug_steps.append("subprocess: launching ...")
-        proc = subprocess.Popen(cmd, cwd=cwd or None)
+        with SPANS.span("spawn", target_id) as sp:
+            proc = subprocess.Popen(cmd, cwd=cwd or None)
+            sp.set(pid=proc.pid)
         debug_steps.append(f"subprocess: pid={proc.pid}")
     except Exception as e:
-        return log_and_return(req.target_id, {"ok": False, "error": f"launch failed: {e}"})
+        return log_and_return(target_id, {"ok": False, "error": f"launch failed: {e}"})
 
     exe_basename = Path(cmd[0]).name if cmd and cmd[0] else None
 
-    final_pid = _find_final_pid(proc, exe_basename, t0)
+    with SPANS.span("pid_resolution", target_id, exe=exe_basename) as sp:
+        final_pid = _find_final_pid(proc, exe_basename, t0)
+        sp.set(pid=final_pid)
     debug_steps.append(f"pid resolution: exe_basename={exe_basename} final_pid={final_pid}")
-    TARGET_PID[req.target_id] = final_pid
+    TARGET_PID[target_id] = final_pid
+    WINDOWS.invalidate()
 
     hwnd = None
-    wait_deadline = time.time() + 20.0
-    while time.time() < wait_deadline:
-        if final_pid:
-            hwnd = find_top_window_for_pid(final_pid)
-            if hwnd:
-                break
-        sleep_log(req.target_id, 0.1)
+    with SPANS.span("window_wait", target_id, pid=final_pid) as sp:
+        wait_deadline = time.time() + 20.0
+        while time.time() < wait_deadline:
+            if final_pid:
+                # 100ms 轮询：索引最多 100ms 旧，其它请求在这期间共享同一次枚举
+                hwnd = find_top_window_for_pid(final_pid, max_age=0.1)
+                if hwnd:
+                    break
+            sleep_log(target_id, 0.1)
+        sp.set(hwnd=hwnd)
     t_wait_ms = int((time.time() - t0) * 1000)
     debug_steps.append(f"wait window: {t_wait_ms} ms, hwnd={hwnd}")
 
     if hwnd:
-        TARGET_MAP[req.target_id] = hwnd
+        TARGET_MAP[target_id] = hwnd
 
     # 3) 总是自动 close 句柄（配置项已移除）
     ok, msg = (False, "Skipped")
     if final_pid:
-        ok, msg = close_other_instance_handle(final_pid)
+        with SPANS.span("handle64", target_id, pid=final_pid) as sp:
+            ok, msg = close_other_instance_handle(final_pid)
+            sp.set(ok=ok)
     debug_steps.append(f"handle64: ok={ok} msg={msg}")
 
-    # 4) 默认启用 post_launch（配置里不再有 enabled）
-    threading.Thread(target=_do_post_launch, args=(req.target_id, hwnd or 0), daemon=True).start()
-    debug_steps.append(f"post_launch: started background seq={POST_LAUNCH.get('sequence','default')}")
+    # 4) 默认启用 post_launch（配置里不再有 enabled）：排进该 target 的 job 队列
+    with SPANS.span("post_launch_submit", target_id):
+        post_job = _start_post_launch(target_id, hwnd or 0)
+    debug_steps.append(f"post_launch: started background seq={POST_LAUNCH.get('sequence','default')}"
+                       + (f" job={post_job}" if post_job else ""))
 
-    return log_and_return(req.target_id, {
+    return log_and_return(target_id, {
         "ok": True,
         "resolved": {"cmd": cmd, "cwd": cwd, "exe": cmd[0], "args": cmd[1:]},
         "pid": final_pid,
@@ -1037,28 +1738,34 @@ def launch(req: LaunchReq):
         "handle_close": {"ok": ok, "msg": msg},
         "window_wait_ms": t_wait_ms,
         "steps": debug_steps,
+        "post_job": post_job,
     })
 
 @app.post("/stop")
 def stop(req: StopReq):
-    pid = TARGET_PID.get(req.target_id)
+    return _do_stop(req.target_id, req.force)
+
+@SPANS.traced("stop")
+def _do_stop(target_id: str, force: bool = False) -> dict:
+    pid = TARGET_PID.get(target_id)
     if not pid:
-        return log_and_return(req.target_id, {"ok": False, "error": "no known pid for target"})
+        return log_and_return(target_id, {"ok": False, "error": "no known pid for target"})
     try:
         p = psutil.Process(pid)
-        hwnd = TARGET_MAP.get(req.target_id) or find_top_window_for_pid(pid)
-        if hwnd and not req.force:
+        hwnd = TARGET_MAP.get(target_id) or find_top_window_for_pid(pid)
+        if hwnd and not force:
             win32api.PostMessage(hwnd, win32con.WM_CLOSE, 0, 0)
         else:
-            if req.force:
+            if force:
                 p.kill()
             else:
                 p.terminate()
-        return log_and_return(req.target_id, {"ok": True})
+        WINDOWS.invalidate()
+        return log_and_return(target_id, {"ok": True})
     except psutil.NoSuchProcess:
-        return log_and_return(req.target_id, {"ok": True, "note": "process already gone"})
+        return log_and_return(target_id, {"ok": True, "note": "process already gone"})
     except Exception as e:
-        return log_and_return(req.target_id, {"ok": False, "error": str(e)})
+        return log_and_return(target_id, {"ok": False, "error": str(e)})
 
 
 @app.post("/click")
@@ -1072,7 +1779,10 @@ def click(req: ClickReq):
 
 @app.post("/bo")
 def bo(req: BoReq):
-    target_id = req.target_id
+    return _do_bo(req.target_id)
+
+@SPANS.traced("bo")
+def _do_bo(target_id: str) -> dict:
     hwnd = TARGET_MAP.get(target_id)
     if not hwnd:
         refresh_targets()
@@ -1088,77 +1798,103 @@ def bo(req: BoReq):
             for i in range(1, 4):  # 1..3
                 log_event(target_id, f"bo: press {label} {i}/3")
                 bg_send_hotkey(hwnd, [vk], target_id=target_id)
-                time.sleep(0.5)
+                sleep_log(target_id, 0.5)
         log_event(target_id, "bo: end")
         return log_and_return(target_id, {"ok": True, "steps": ["Qx3", "Wx3", "Ex3", "interval=0.5s"]})
+    except JobCancelled:
+        raise
     except Exception as e:
         return log_and_return(target_id, {"ok": False, "error": f"bo failed: {e}"})
 
 @app.post("/join_game")
 def join_game(req: JoinReq):
-    with JOIN_LOCK:
+    return _do_join_game(req.target_id, req.game_name, req.password or "")
+
+@SPANS.traced("join_game")
+def _do_join_game(target_id: str, game_name: str, password: str = "") -> dict:
+    with span_lock(JOIN_LOCK, "join_lock", target_id):
         steps = []
-        hwnd = TARGET_MAP.get(req.target_id)
+        hwnd = TARGET_MAP.get(target_id)
         if not hwnd:
             refresh_targets()
-            hwnd = TARGET_MAP.get(req.target_id)
+            hwnd = TARGET_MAP.get(target_id)
             if not hwnd:
-                return log_and_return(req.target_id, {"ok": False, "error": "target not found"})
+                return log_and_return(target_id, {"ok": False, "error": "target not found"})
         ensure_restored_no_focus(hwnd)
 
+        err = ui_state_gate(target_id, hwnd, ("lobby",), "before join")
+        if err:
+            return log_and_return(target_id, {"ok": False, "error": err})
+
         ui = load_uimap(UIMAP_PATH)
         required = ["GameNameBox"]
         for key in required:
             if key not in ui:
-                return log_and_return(req.target_id, {"ok": False, "error": f"UiMap missing key: {key}"})
+                return log_and_return(target_id, {"ok": False, "error": f"UiMap missing key: {key}"})
 
-        cx, cy = uimap_point_client(hwnd, tuple(ui["GameNameBox"]))
-        bg_mouse_click_client(hwnd, cx, cy, target_id=req.target_id)
-        sleep_log(req.target_id, 0.05)
+        cx, cy = uimap_points(hwnd)["GameNameBox"]
+        bg_mouse_click_client(hwnd, cx, cy, target_id=target_id)
+        sleep_log(target_id, 0.05)
         steps.append(f"click GameNameBox client@{cx},{cy}")
 
         '''
-        set_clipboard_text(req.game_name)
-        bg_send_hotkey(hwnd, [win32con.VK_CONTROL, ord('A')], target_id=req.target_id)
-        sleep_log(req.target_id, 0.5)
-        bg_send_hotkey(hwnd, [win32con.VK_CONTROL, ord('V')], target_id=req.target_id)
-        steps.append(f"copy paste game name: ({req.game_name})")
+        set_clipboard_text(game_name)
+        bg_send_hotkey(hwnd, [win32con.VK_CONTROL, ord('A')], target_id=target_id)
+        sleep_log(target_id, 0.5)
+        bg_send_hotkey(hwnd, [win32con.VK_CONTROL, ord('V')], target_id=target_id)
+        steps.append(f"copy paste game name: ({game_name})")
         
         '''
-        for _ in range(10):
-            bg_send_hotkey(hwnd, [win32con.VK_BACK], target_id=req.target_id)
-            bg_send_hotkey(hwnd, [win32con.VK_DELETE], target_id=req.target_id)
-            sleep_log(req.target_id, 0.005)
-        steps.append("clear game name")
-
-        bg_type_text(hwnd, req.game_name, delay=0.01, target_id=req.target_id)
-        steps.append(f"type game name ({len(req.game_name)} chars)")
-        #'''
-        
-        if (req.password or "") != "":
-            bg_send_hotkey(hwnd, [win32con.VK_TAB], target_id=req.target_id)
-            sleep_log(req.target_id, 0.5)  
+        with SPANS.span("field", target_id, field="game_name"):
             for _ in range(10):
-                bg_send_hotkey(hwnd, [win32con.VK_BACK], target_id=req.target_id)
-                bg_send_hotkey(hwnd, [win32con.VK_DELETE], target_id=req.target_id)
-                sleep_log(req.target_id, 0.005)
-            steps.append("clear password box")
-
-            bg_type_text(hwnd, req.password, delay=0.01, target_id=req.target_id)
-            steps.append(f"type game password: ({req.password})")
+                bg_send_hotkey(hwnd, [win32con.VK_BACK], target_id=target_id)
+                bg_send_hotkey(hwnd, [win32con.VK_DELETE], target_id=target_id)
+                sleep_log(target_id, 0.005)
+            steps.append("clear game name")
 
-        ui_press_enter(hwnd, target_id=req.target_id)
+            bg_type_text(hwnd, game_name, delay=0.01, target_id=target_id)
+            steps.append(f"type game name ({len(game_name)} chars)")
+        #'''
+        
+        if password != "":
+            bg_send_hotkey(hwnd, [win32con.VK_TAB], target_id=target_id)
+            sleep_log(target_id, 0.5)  
+            with SPANS.span("field", target_id, field="password"):
+                for _ in range(10):
+                    bg_send_hotkey(hwnd, [win32con.VK_BACK], target_id=target_id)
+                    bg_send_hotkey(hwnd, [win32con.VK_DELETE], target_id=target_id)
+                    sleep_log(target_id, 0.005)
+                steps.append("clear password box")
+
+                bg_type_text(hwnd, password, delay=0.01, target_id=target_id)
+                steps.append(f"type game password: ({password})")
+
+        ui_press_enter(hwnd, target_id=target_id)
         steps.append("press ENTER")
+        ui_state_gate(target_id, hwnd, (), "after join")
         
-        # --- Post-join hook: GoToRoFReadyForBO ---
-        if req.target_id in GO_TO_ROF_READY_FOR_BO_TARGETS:
-            threading.Thread(
-                target=_do_goto_rof_ready_for_bo,
-                args=(req.target_id,),
-                daemon=True
-            ).start()
-
-        return log_and_return(req.target_id, {"ok": True, "steps": steps})
+        # --- Post-join hook: GoToRoFReadyForBO（排进 job 队列，可查询/取消）---
+        if target_id in GO_TO_ROF_READY_FOR_BO_TARGETS:
+            try:
+                JOBS.submit("goto_rof_ready_for_bo", target_id)
+            except OverflowError:
+                threading.Thread(
+                    target=_do_goto_rof_ready_for_bo,
+                    args=(target_id,),
+                    daemon=True
+                ).start()
+
+        res = {"ok": True, "steps": steps}
+
+    # 进房确认（锁外等，不挡其它 target 的 join）：有 UI 状态签名时等到 in_game 或超时。
+    # confirmed 是 orchestrator 缩短 join 间隔的依据（ok 只说明按键已发出）；没有签名时不给 confirmed。
+    if UI_STATE is not None and JOIN_CONFIRM_SEC > 0:
+        with SPANS.span("join_confirm", target_id) as sp:
+            hit, el, st = wait_for_ui_state(target_id, hwnd, ("in_game",), JOIN_CONFIRM_SEC)
+            sp.set(hit=hit, state=st)
+        res.update(confirmed=hit, ui_state=st)
+        steps.append(f"confirm in_game: {'yes' if hit else 'no'} after {el:.1f}s (state={st})")
+    return log_and_return(target_id, res)
 
 @app.exception_handler(Exception)
 async def _unhandled_exc(request: Request, exc: Exception):
@@ -1172,7 +1908,10 @@ async def _unhandled_exc(request: Request, exc: Exception):
 
 @app.post("/goto_lobby")
 def goto_lobby(req: GotoLobbyReq):
-    target_id = req.target_id
+    return _do_goto_lobby_target(req.target_id)
+
+@SPANS.traced("goto_lobby")
+def _do_goto_lobby_target(target_id: str) -> dict:
     hwnd = TARGET_MAP.get(target_id)
     if not hwnd:
         refresh_targets()
@@ -1185,38 +1924,200 @@ def goto_lobby(req: GotoLobbyReq):
 
 @app.post("/leave_game")
 def leave_game(req: LeaveReq):
-    with JOIN_LOCK:
+    return _do_leave_game(req.target_id)
+
+@SPANS.traced("leave_game")
+def _do_leave_game(target_id: str) -> dict:
+    with span_lock(JOIN_LOCK, "join_lock", target_id):
         steps = []
-        hwnd = TARGET_MAP.get(req.target_id)
+        hwnd = TARGET_MAP.get(target_id)
         if not hwnd:
             refresh_targets()
-            hwnd = TARGET_MAP.get(req.target_id)
+            hwnd = TARGET_MAP.get(target_id)
             if not hwnd:
-                return log_and_return(req.target_id, {"ok": False, "error": "target not found"})
+                return log_and_return(target_id, {"ok": False, "error": "target not found"})
         ensure_restored_no_focus(hwnd)
 
+        err = ui_state_gate(target_id, hwnd, ("in_game",), "before leave")
+        if err:
+            return log_and_return(target_id, {"ok": False, "error": err})
+
         ui = load_uimap(UIMAP_PATH)
-        ui_press_esc(hwnd, target_id=req.target_id)
+        if "SaveAndExitButton" not in ui:
+            return log_and_return(target_id, {"ok": False, "error": "UiMap missing key: SaveAndExitButton"})
+        ui_press_esc(hwnd, target_id=target_id)
         steps.append("press ESC")
-        sleep_log(req.target_id, 0.5)
+        sleep_log(target_id, 0.5)
 
-        cx, cy = uimap_point_client(hwnd, tuple(ui["SaveAndExitButton"]))
-        bg_mouse_click_client(hwnd, cx, cy, target_id=req.target_id)
-        sleep_log(req.target_id, 0.05)
+        cx, cy = uimap_points(hwnd)["SaveAndExitButton"]
+        bg_mouse_click_client(hwnd, cx, cy, target_id=target_id)
+        sleep_log(target_id, 0.05)
         steps.append(f"click SaveAndExitButton client@{cx},{cy}")
-        return log_and_return(req.target_id, {"ok": True, "steps": steps})
+        ui_state_gate(target_id, hwnd, (), "after leave")
+        return log_and_return(target_id, {"ok": True, "steps": steps})
+
+class EventsReq(BaseModel):
+    after: int = 0          # 读者游标：返回 seq > after 的事件
+    max_items: int = 200
+
+@app.post("/events")
+def events(req: EventsReq):
+    """非破坏性读取：{events, next, dropped, last_seq, boot_id}；下次以 after=next 续读。"""
+    return read_events(req.after, req.max_items)
+
+@app.get("/events")
+def events_get(after: int = 0, max_items: int = 200):
+    return read_events(after, max_items)
+
+class BatchItem(BaseModel):
+    target_id: str
+    action: str
+    args: dict = {}
+    not_before: Optional[float] = None   # worker 时钟的最早开始时刻（orchestrator 预约的全局令牌）
+
+class BatchReq(BaseModel):
+    items: List[BatchItem]
+    mode: str = "serial"          # serial | concurrent
+    delay_sec: float = 0.0        # 相邻项（同一 target 序列内）之间的间隔；给了 delay_ok_sec 时只用于失败之后
+    delay_ok_sec: Optional[float] = None  # 上一项成功后的间隔（orchestrator 学到的最小间隔）
+    stop_on_error: bool = False
+
+@app.post("/batch")
+def batch(req: BatchReq):
+    if req.mode not in ("serial", "concurrent"):
+        return {"ok": False, "error": f"unknown mode: {req.mode}"}
+    run = submit_batch([_model_dict(it) for it in req.items], req.mode, req.delay_sec, req.stop_on_error,
+                       delay_ok_sec=req.delay_ok_sec)
+    return {"ok": True, "batch_id": run.id, "total": len(run.items)}
+
+@app.get("/batch/{batch_id}")
+async def batch_result(batch_id: str, wait: float = 0.0, done_gt: int = -1):
+    """长轮询：等到 完成项数 > done_gt 或整批结束（最多 wait 秒，≤30）。"""
+    run = BATCHES.get(batch_id)
+    if run is None:
+        return JSONResponse(status_code=404, content={"ok": False, "error": "batch not found"})
+    deadline = time.monotonic() + min(max(wait, 0.0), 30.0)
+    while not run.is_final and run.done_count <= done_gt and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    return {"ok": True, **run.to_dict()}
+
+@app.post("/batch/{batch_id}/cancel")
+def batch_cancel(batch_id: str):
+    run = BATCHES.get(batch_id)
+    if run is None:
+        return JSONResponse(status_code=404, content={"ok": False, "error": "batch not found"})
+    run.cancel_evt.set()
+    return {"ok": True, **run.to_dict()}
+
+class JobReq(BaseModel):
+    action: str                 # launch | join_game | leave_game | goto_lobby | bo | post_launch | ...
+    target_id: str
+    args: dict = {}
+
+@app.post("/jobs")
+def submit_job(req: JobReq):
+    try:
+        job = JOBS.submit(req.action, req.target_id, req.args)
+    except KeyError:
+        return {"ok": False, "error": f"unknown action: {req.action}", "actions": JOBS.actions}
+    except OverflowError as e:
+        return JSONResponse(status_code=429, content={"ok": False, "error": str(e)})
+    return {"ok": True, "job_id": job.id, "status": job.status,
+            "queue_depth": JOBS.queue_depth(req.target_id)}
+
+@app.get("/jobs")
+def list_jobs(target_id: Optional[str] = None):
+    return {"jobs": JOBS.list(target_id)}
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = JOBS.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"ok": False, "error": "job not found"})
+    return {"ok": True, **job.to_dict()}
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str, wait: float = 0.0):
+    """长轮询：最多等 wait 秒（≤30）直到 job 结束；不占用线程池。"""
+    job = JOBS.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"ok": False, "error": "job not found"})
+    deadline = time.monotonic() + min(max(wait, 0.0), 30.0)
+    while not job.is_final and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    return {"ok": True, **job.to_dict()}
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    job = JOBS.cancel(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"ok": False, "error": "job not found"})
+    return {"ok": True, **job.to_dict()}
+
+SSE_HEARTBEAT_SEC: float = 15.0
+
+def _sse(event: str, data: dict, ev_id: Optional[int] = None) -> str:
+    head = f"id: {ev_id}\n" if ev_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.get("/events/stream")
+async def events_stream(request: Request, after: Optional[int] = None):
+    """
+    Server-Sent Events：实时推送 log_event 记录。
+      - 续传：?after=N 或 Last-Event-ID 头（取较大者），断线重连不丢事件
+      - 首帧 hello 带 boot_id；溢出时推 dropped；空闲时每 SSE_HEARTBEAT_SEC 推 heartbeat
+    """
+    try:
+        last_id = int(request.headers.get("last-event-id") or 0)
+    except ValueError:
+        last_id = 0
+    # EventSource 重连时 URL 仍带最初的 ?after=，Last-Event-ID 才是真正的进度
+    cursor = max(int(after or 0), last_id)
+
+    async def gen():
+        nonlocal cursor
+        loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+        waiter = (loop, wake)
+        _EVENT_WAITERS.add(waiter)
+        try:
+            yield _sse("hello", {"worker": WORKER_NAME, "boot_id": LOGQ.boot_id, "last_seq": LOGQ.last_seq})
+            while True:
+                wake.clear()
+                res = read_events(cursor, 500)
+                if res["dropped"]:
+                    yield _sse("dropped", {"count": res["dropped"], "after": cursor})
+                for ev in res["events"]:
+                    yield _sse("log", ev, ev_id=ev["seq"])
+                cursor = res["next"]
+                if res["events"] and cursor < res["last_seq"]:
+                    continue  # 还有积压，继续推
+                if await request.is_disconnected():
+                    break
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout=SSE_HEARTBEAT_SEC)
+                except asyncio.TimeoutError:
+                    yield _sse("heartbeat", {"last_seq": LOGQ.last_seq, "ts": time.time()})
+        finally:
+            _EVENT_WAITERS.discard(waiter)
+
+    return StreamingResponse(gen(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.post("/drain_logs")
 def drain_logs(max_items: int = Body(200, embed=True)):
-    out = []
+    # 兼容旧版 orchestrator：用一个服务端游标模拟“取走”，不影响 /events 的其它读者
+    # 读取与推进游标在同一把锁内完成：并发的 /drain_logs 不会拿到同一批事件
+    global _LEGACY_DRAIN_CURSOR
     with LOGQ_LOCK:
-        for _ in range(min(max_items, len(LOGQ))):
-            out.append(LOGQ.popleft())
-    return {"events": out}
+        res = LOGQ.read_after(_LEGACY_DRAIN_CURSOR, max_items)
+        _LEGACY_DRAIN_CURSOR = res["next"]
+    return {"events": res["events"], "dropped": res["dropped"]}
 
 
 # === After-Join (per-worker) config & target flags ===
 AFTER_JOIN_WAIT_READY_SEC: float = 10.0  # 默认 X 秒（等角色进入可行动界面）
+JOIN_CONFIRM_SEC: float = 20.0           # join 后最多等多久确认进入 in_game（需要 UI 状态签名；0 = 不确认）
 GO_TO_ROF_READY_FOR_BO_TARGETS: Set[str] = set()
 
 def _do_goto_rof_ready_for_bo(target_id: str):
@@ -1230,8 +2131,9 @@ def _do_goto_rof_ready_for_bo(target_id: str):
                 return
 
         ensure_restored_no_focus(hwnd)
-        log_event(target_id, f"post-join: wait_ready {AFTER_JOIN_WAIT_READY_SEC:.2f}s")
-        sleep_log(target_id, AFTER_JOIN_WAIT_READY_SEC)
+        log_event(target_id, f"post-join: wait_ready in_game (≤{AFTER_JOIN_WAIT_READY_SEC:.2f}s)")
+        hit, el, st = wait_for_ui_state(target_id, hwnd, ("in_game",), AFTER_JOIN_WAIT_READY_SEC)
+        log_event(target_id, f"post-join: wait_ready {'in_game' if hit else 'timeout'} after {el:.1f}s (state={st})")
 
         ui = load_uimap(UIMAP_PATH)
         for key in ("A4TownWP", "A4RoFWPEntry"):
@@ -1240,7 +2142,8 @@ def _do_goto_rof_ready_for_bo(target_id: str):
                 return
 
         # —— 第一次点击前：先平滑移动到 A4TownWP ——
-        cx, cy = uimap_point_client(hwnd, tuple(ui["A4TownWP"]))
+        pts = uimap_points(hwnd)
+        cx, cy = pts["A4TownWP"]
         _smooth_move_to_client(hwnd, cx, cy, target_id=target_id)
 
         # 点击 A4TownWP
@@ -1251,11 +2154,15 @@ def _do_goto_rof_ready_for_bo(target_id: str):
         sleep_log(target_id, 5)
 
         # 点击 A4RoFWPEntry（如需也平滑移动，可再加一行 _smooth_move_to_client）
-        cx, cy = uimap_point_client(hwnd, tuple(ui["A4RoFWPEntry"]))
+        # 等待期间窗口可能被调整大小：按当前尺寸重新取点
+        cx, cy = uimap_points(hwnd)["A4RoFWPEntry"]
         log_event(target_id, f"post-join: click A4RoFWPEntry client@{cx},{cy}")
         bg_mouse_click_client(hwnd, cx, cy, target_id=target_id)
 
         log_event(target_id, "post-join: GoToRoFReadyForBO done")
+    except JobCancelled:
+        log_event(target_id, "post-join: cancelled")
+        raise
     except Exception as e:
         log_event(target_id, f"post-join: error {e}")
 
@@ -1264,28 +2171,279 @@ def _do_goto_rof_ready_for_bo(target_id: str):
 
 # ============== Post-Launch sequence ==============
 
+class Win32ReadinessProbe(ReadinessProbe):
+    SMTO_ABORTIFHUNG = 0x0002
+
+    def __init__(self):
+        self._procs: Dict[int, psutil.Process] = {}
+
+    def window_responsive(self, hwnd: int) -> Optional[bool]:
+        try:
+            if not win32gui.IsWindow(hwnd) or user32.IsHungAppWindow(hwnd):
+                return False
+            win32gui.SendMessageTimeout(hwnd, win32con.WM_NULL, 0, 0, self.SMTO_ABORTIFHUNG, 200)
+            return True
+        except Exception:
+            return False
+
+    def region_matches(self, hwnd: int, name: str) -> Optional[bool]:
+        # name 即状态名（title_screen / main_menu …）；签名里没有该状态时不参与判定
+        if UI_STATE is None or name not in UI_STATE.states:
+            return None
+        res = classify_target(_target_for_hwnd(hwnd), hwnd) or {}
+        return res.get("state") == name
+
+    def cpu_percent(self, pid: int) -> Optional[float]:
+        try:
+            p = self._procs.get(pid)
+            if p is None:
+                p = self._procs[pid] = psutil.Process(pid)
+                p.cpu_percent(None)  # 首次调用只建立基线
+            return p.cpu_percent(None)
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            self._procs.pop(pid, None)
+            return None
+
+READINESS_PROBE: ReadinessProbe = Win32ReadinessProbe()
+POST_LAUNCH_TIMINGS: Dict[str, List[dict]] = {}   # target_id -> 最近一次 post_launch 各步耗时
+
+def _post_launch_steps() -> List[StepSpec]:
+    """config 的 wait_for_* 作为每步上限；readiness.min_sec / readiness.conditions 可覆盖默认值。"""
+    rd = POST_LAUNCH.get("readiness") or {}
+    mins = rd.get("min_sec") or {}
+    conds = rd.get("conditions") or {}
+    def spec(name, default_timeout, default_min, default_conds):
+        return StepSpec(name, float(POST_LAUNCH.get(f"wait_for_{name}", default_timeout)),
+                        float(mins.get(name, default_min)), list(conds.get(name, default_conds)))
+    return [
+        spec("start_up", 5.0, 1.0, ["responsive"]),
+        spec("title_load_up", 55.0, 5.0, ["responsive", "cpu_settled", "region:title_screen"]),
+        spec("connect_to_server", 45.0, 3.0, ["responsive", "cpu_settled", "region:main_menu"]),
+    ]
+
+def _post_launch_confirmed(timings: List[dict], lobby_ok: bool) -> Optional[bool]:
+    """
+    launch 是否真的成功（orchestrator 据此学习 launch 间隔）：
+      True  = 每步都由画面签名等条件判定就绪，且进了大厅
+      False = 进大厅失败，或某步超时时画面签名明确不符（例如卡在连接服务器）
+      None  = 有步骤没有可用信号、按上限等满（无法确认）
+    """
+    if not lobby_ok:
+        return False
+    if any(not t["ready"] and any(k.startswith("region:") and v is False for k, v in t["met"].items())
+           for t in timings):
+        return False
+    if timings and all(t["ready"] for t in timings):
+        return True
+    return None
+
+def _readiness_enabled() -> bool:
+    rd = POST_LAUNCH.get("readiness")
+    return not (rd is False or (isinstance(rd, dict) and rd.get("enabled") is False))
+
+@SPANS.traced("post_launch")
 def _do_post_launch(target_id: str, hwnd: int):
     log_event(target_id, "post: start")
     seq = POST_LAUNCH.get("sequence", "default")
-    wait_for_start_up = POST_LAUNCH.get("wait_for_start_up", "5.0")
-    wait_for_title_load_up = POST_LAUNCH.get("wait_for_title_load_up", "55.0")
-    wait_for_connect_to_server = POST_LAUNCH.get("wait_for_connect_to_server", "45.0")
+    timings: List[dict] = []
+    POST_LAUNCH_TIMINGS[target_id] = timings
     try:
         if seq == "default":
-            sleep_log(target_id, wait_for_start_up)           
-            ui_press_space(hwnd, target_id)
+            steps = {st.name: st for st in _post_launch_steps()}
+            pid = TARGET_PID.get(target_id) or 0
+            enabled = _readiness_enabled()
+            rd = POST_LAUNCH.get("readiness") if enabled else None
+            cs = (rd or {}).get("cpu_settle") or {} if isinstance(rd, dict) else {}
+            cpu, ignored = CpuSettle.from_config(cs)
+            if ignored:
+                log_event(target_id, f"post: readiness.cpu_settle ignores unknown keys {ignored}")
+            # 关闭 readiness 时用空探针：所有条件不可用 → 每步按上限固定等待（旧行为）
+            waiter = ReadinessWaiter(
+                READINESS_PROBE if enabled else ReadinessProbe(),
+                cpu=cpu,
+                sleep_fn=lambda sec: sleep_log(target_id, sec),
+            )
+
+            def wait_step(name: str):
+                st = steps[name]
+                h = hwnd or TARGET_MAP.get(target_id) or find_top_window_for_pid(pid) or 0
+                with SPANS.span(f"readiness:{name}", target_id, timeout=st.timeout) as sp:
+                    tm = waiter.wait(st, h, pid)
+                    sp.set(ready=tm.ready, met=dict(tm.met))
+                timings.append(tm.to_dict())
+                log_event(target_id, f"post: {name} {'ready' if tm.ready else 'timeout'} "
+                                     f"after {tm.elapsed:.1f}s (≤{st.timeout:.0f}s) met={tm.met}")
+                return h
+
+            h = wait_step("start_up")
+            ui_press_space(h, target_id)
             sleep_log(target_id, 2.0)
-            ui_press_space(hwnd, target_id)
-            sleep_log(target_id, wait_for_title_load_up)
-            ui_press_space(hwnd, target_id)
-            sleep_log(target_id, wait_for_connect_to_server)
+            ui_press_space(h, target_id)
+            h = wait_step("title_load_up")
+            ui_press_space(h, target_id)
+            h = wait_step("connect_to_server")
             log_event(target_id, "post: calling goto_lobby")
-            ret = _do_goto_lobby(target_id, hwnd)
+            ret = _do_goto_lobby(target_id, h)
             log_event(target_id, f"post: goto_lobby result={ret}")
+            confirmed = _post_launch_confirmed(timings, bool((ret or {}).get("ok")))
+            return {"ok": True, "timings": timings, "confirmed": confirmed}
+    except JobCancelled:
+        log_event(target_id, "post: cancelled")
+        raise
     except Exception as e:
         log_event(target_id, f"post: error {e}")
+        return {"ok": False, "error": f"{type(e).__name__}: {e}", "timings": timings}
+    finally:
+        total = sum(t["elapsed_s"] for t in timings)
+        log_event(target_id, f"post: end (waited {total:.1f}s)")
+    return {"ok": True, "timings": timings}
+
+def _start_post_launch(target_id: str, hwnd: int) -> Optional[str]:
+    """
+    post_launch 作为 job 排进该 target 的 "post" lane（不占动作队列，随后的 join / leave 不用等它）；
+    队列满时退回后台线程。返回 job_id（若有）。
+    """
+    try:
+        return JOBS.submit("post_launch", target_id, {"hwnd": int(hwnd or 0)}).id
+    except OverflowError:
+        threading.Thread(target=_do_post_launch, args=(target_id, hwnd), daemon=True).start()
+        return None
+
+JOBS.register("launch", lambda tid, a: _do_launch(tid, a.get("shortcut_path")))
+JOBS.register("join_game", lambda tid, a: _do_join_game(tid, a.get("game_name") or "", a.get("password") or ""))
+JOBS.register("leave_game", lambda tid, a: _do_leave_game(tid))
+JOBS.register("goto_lobby", lambda tid, a: _do_goto_lobby_target(tid))
+JOBS.register("bo", lambda tid, a: _do_bo(tid))
+JOBS.register("post_launch", lambda tid, a: _do_post_launch(tid, int(a.get("hwnd") or 0)), lane="post")
+JOBS.register("goto_rof_ready_for_bo", lambda tid, a: _do_goto_rof_ready_for_bo(tid) or {"ok": True})
+JOBS.register("stop", lambda tid, a: _do_stop(tid, bool(a.get("force"))))
+
+# ============== Batch: many targets, one request ==============
+# 一批 {target_id, action, args} 共用一次 refresh_targets 和一次 UiMap 加载。
+#   mode="serial"：按顺序执行，相邻两项之间等 delay_sec
+#   mode="concurrent"：不同 target 并行，同一 target 内仍按顺序（并受 delay_sec 间隔）
+# 项可带 not_before（worker 时钟）：不早于该时刻开始，与间隔重叠等待（全局令牌桶的预约）。
+
+class BatchRun:
+    def __init__(self, batch_id: str, items: List[dict], mode: str, delay_sec: float, stop_on_error: bool,
+                 delay_ok_sec: Optional[float] = None):
+        self.id = batch_id
+        self.items = items
+        self.mode = mode
+        self.delay_sec = max(0.0, float(delay_sec or 0.0))
+        self.delay_ok_sec = self.delay_sec if delay_ok_sec is None else max(0.0, float(delay_ok_sec))
+        self.stop_on_error = stop_on_error
+        self.results: List[Optional[dict]] = [None] * len(items)
+        self.status = "running"        # running | done | cancelled
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self.cancel_evt = threading.Event()
+
+    @property
+    def done_count(self) -> int:
+        return sum(1 for r in self.results if r is not None)
+
+    @property
+    def is_final(self) -> bool:
+        return self.status != "running"
+
+    def to_dict(self) -> dict:
+        return {"batch_id": self.id, "status": self.status, "mode": self.mode,
+                "done": self.done_count, "total": len(self.items),
+                "started": self.started, "finished": self.finished,
+                "results": [dict(r, index=i) if r is not None else None for i, r in enumerate(self.results)]}
+
+BATCHES: "OrderedDict[str, BatchRun]" = OrderedDict()
+BATCHES_LOCK = Lock()
+_BATCH_SEQ = 0
+BATCH_KEEP = 100
+
+def _run_batch_item(run: BatchRun, i: int, ui_pin: tuple, gap_ms: int = 0, rate_wait_ms: int = 0):
+    """
+    每一项都作为普通 job 进该 target 的队列（保持“同一 target 同时只跑一个动作”），在这里等它结束。
+    elapsed_ms 是 job 实际执行的时长，排队等待另记 queued_ms；
+    gap_ms 是开始前的总等待，其中超出间隔、只为等 not_before 的部分记为 rate_wait_ms。
+    """
+    item = run.items[i]
+    tid, action = str(item.get("target_id")), item.get("action")
+    t0 = time.time()
+    job = None
+    if run.cancel_evt.is_set():
+        res = {"ok": False, "error": "batch cancelled", "skipped": True}
+    else:
+        try:
+            job = JOBS.submit(action, tid, item.get("args") or {}, ctx={"uimap": ui_pin})
+        except KeyError:
+            res = {"ok": False, "error": f"unknown action: {action}"}
+        except OverflowError as e:
+            res = {"ok": False, "error": str(e)}
+    if job is not None:
+        while not job.done_evt.wait(0.2):
+            if run.cancel_evt.is_set() and not job.cancel_evt.is_set():
+                JOBS.cancel(job.id)
+        if job.status == "cancelled":
+            res = {"ok": False, "error": "batch cancelled" if run.cancel_evt.is_set() else "job cancelled"}
+        elif job.error:
+            res = {"ok": False, "error": job.error}
+        else:
+            res = job.result or {"ok": True}
+    t1 = (job.finished if job is not None and job.finished else time.time())
+    started = job.started if job is not None and job.started else t1
+    extra = {"job_id": job.id, "queued_ms": int((started - t0) * 1000)} if job is not None else {}
+    run.results[i] = dict(res, target_id=tid, action=action, elapsed_ms=int((t1 - started) * 1000),
+                          gap_ms=gap_ms, rate_wait_ms=rate_wait_ms, **extra)
+
+def _run_batch_sequence(run: BatchRun, indices: List[int], ui_pin: tuple):
+    prev_ok = True
+    for n, i in enumerate(indices):
+        if run.stop_on_error and any(r is not None and r.get("ok") is False for r in run.results):
+            run.cancel_evt.set()
+        gap = (run.delay_ok_sec if prev_ok else run.delay_sec) if n else 0.0
+        nb = run.items[i].get("not_before")
+        rate_wait = max(0.0, float(nb) - time.time()) if nb else 0.0  # 与间隔重叠，取较长者
+        wait = max(gap, rate_wait)
+        t0 = time.monotonic()
+        if wait and not run.cancel_evt.is_set():
+            run.cancel_evt.wait(wait)  # 可被取消打断；之后的项会标记为 skipped
+        _run_batch_item(run, i, ui_pin, gap_ms=int((time.monotonic() - t0) * 1000),
+                        rate_wait_ms=int(max(0.0, rate_wait - gap) * 1000))
+        prev_ok = bool((run.results[i] or {}).get("ok"))
+
+def _run_batch(run: BatchRun):
+    try:
+        refresh_targets()                     # 整批只刷新一次
+        ui_pin = (UIMAP_PATH, load_uimap(UIMAP_PATH))
+        log_event("system", f"batch {run.id}: {len(run.items)} items mode={run.mode} "
+                            f"delay={run.delay_ok_sec}s (after failure {run.delay_sec}s)")
+        if run.mode == "concurrent":
+            by_target: Dict[str, List[int]] = OrderedDict()
+            for i, it in enumerate(run.items):
+                by_target.setdefault(str(it.get("target_id")), []).append(i)
+            threads = [Thread(target=_run_batch_sequence, args=(run, idx, ui_pin), daemon=True)
+                       for idx in by_target.values()]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        else:
+            _run_batch_sequence(run, list(range(len(run.items))), ui_pin)
     finally:
-        log_event(target_id, "post: end")
+        run.status = "cancelled" if run.cancel_evt.is_set() else "done"
+        run.finished = time.time()
+        log_event("system", f"batch {run.id}: {run.status} {run.done_count}/{len(run.items)} "
+                            f"in {int((run.finished - run.started) * 1000)} ms")
+
+def submit_batch(items: List[dict], mode: str = "serial", delay_sec: float = 0.0,
+                 stop_on_error: bool = False, delay_ok_sec: Optional[float] = None) -> BatchRun:
+    global _BATCH_SEQ
+    with BATCHES_LOCK:
+        _BATCH_SEQ += 1
+        run = BatchRun(f"b{_BATCH_SEQ}", items, mode, delay_sec, stop_on_error, delay_ok_sec)
+        BATCHES[run.id] = run
+        for bid in [b for b, r in BATCHES.items() if r.is_final][:max(0, len(BATCHES) - BATCH_KEEP)]:
+            BATCHES.pop(bid, None)
+    Thread(target=_run_batch, args=(run,), daemon=True, name=f"batch-{run.id}").start()
+    return run
 
 # ============== Main ==============
 
@@ -1311,13 +2469,31 @@ def main():
     UIMAP_PATH = wcfg.get("uimap_path", UIMAP_PATH)
     POST_LAUNCH = wcfg.get("post_launch", POST_LAUNCH)
 
+    # 画面采集：{"mode": "bitblt"|"printwindow", "max_fps": 2, "downscale": 4}
+    cap_cfg = wcfg.get("capture") or {}
+    if cap_cfg.get("mode") and not SIM:
+        CAPTURE.backend = Win32GdiBackend(mode=str(cap_cfg["mode"]))
+    CAPTURE.max_fps = float(cap_cfg.get("max_fps", CAPTURE.max_fps))
+    CAPTURE.downscale = int(cap_cfg.get("downscale", CAPTURE.downscale))
+
+    # 指标采样：{"interval_sec": 2}
+    METRICS_COLLECTOR.interval = float((wcfg.get("metrics") or {}).get("interval_sec", METRICS_COLLECTOR.interval))
+
+    # UI 状态识别：{"signatures": "worker/uimaps/states.npz", "enforce": false}
+    global UI_STATE_SIGNATURES, UI_STATE_ENFORCE
+    us_cfg = wcfg.get("ui_state") or {}
+    UI_STATE_SIGNATURES = us_cfg.get("signatures", UI_STATE_SIGNATURES)
+    UI_STATE_ENFORCE = bool(us_cfg.get("enforce", UI_STATE_ENFORCE))
+    load_ui_state_classifier(UI_STATE_SIGNATURES)
+
     # === After-join settings from config ===
-    global AFTER_JOIN_WAIT_READY_SEC, GO_TO_ROF_READY_FOR_BO_TARGETS
+    global AFTER_JOIN_WAIT_READY_SEC, GO_TO_ROF_READY_FOR_BO_TARGETS, JOIN_CONFIRM_SEC
 
     # 1) per-worker: 等待秒数（没配就用默认）
     AFTER_JOIN_WAIT_READY_SEC = float(
         ((wcfg.get("after_join") or {}).get("wait_ready_seconds") or AFTER_JOIN_WAIT_READY_SEC)
     )
+    JOIN_CONFIRM_SEC = float((wcfg.get("after_join") or {}).get("confirm_seconds", JOIN_CONFIRM_SEC))
 
     # 2) per-target: 收集 GoToRoFReadyForBO 开关（默认 false）
     GO_TO_ROF_READY_FOR_BO_TARGETS = set()
@@ -1333,7 +2509,7 @@ def main():
 
     log_event(
         "system",
-        f"after_join.wait_ready={AFTER_JOIN_WAIT_READY_SEC}s; "
+        f"after_join.wait_ready={AFTER_JOIN_WAIT_READY_SEC}s confirm={JOIN_CONFIRM_SEC}s; "
         f"GoToRoFReadyForBO.targets={sorted(list(GO_TO_ROF_READY_FOR_BO_TARGETS))}"
     )
 